@@ -0,0 +1,115 @@
+# Analyzer - Turns text into stemmed index terms for the indexer and search
+import re
+import threading
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, List, Optional
+
+TAG_RE = re.compile(r'<[^>]+>')
+WORD_RE = re.compile(r'\w+')
+DIGITS_RE = re.compile(r'\d+')
+
+class Analyzer:
+    """Tokenizer, stopword filter and Porter stemmer with a bounded stem cache.
+
+    Word frequencies are heavily skewed, so most stems are served from the LRU
+    cache instead of running the stemmer again. NLTK takes a large share of a
+    process's startup time and memory, so the stemmer and stopword list are only
+    loaded on the first call that needs them.
+    """
+
+    def __init__(self, stop_words: Optional[Iterable[str]] = None, cache_size: int = 100_000):
+        self.cache_size = cache_size
+        self.stop_words = frozenset(stop_words) if stop_words is not None else None
+        self.stemmer = None
+        self._stem = None
+        self._lock = threading.Lock()
+
+    def load(self) -> None:
+        """Load the stemmer and stopwords now instead of on first use."""
+        if self._stem is not None:
+            return
+        with self._lock:
+            if self._stem is None:
+                from nltk.stem import PorterStemmer
+                if self.stop_words is None:
+                    from nltk.corpus import stopwords
+                    self.stop_words = frozenset(stopwords.words('english'))
+                self.stemmer = PorterStemmer()
+                self._stem = lru_cache(maxsize=self.cache_size)(self.stemmer.stem)
+
+    def words(self, text: str) -> Iterator[str]:
+        """Yield the lowercased words of text with tags, punctuation and digits removed."""
+        for match in WORD_RE.finditer(TAG_RE.sub('', text).lower()):
+            word = match.group()
+            if not word.isalpha():
+                word = DIGITS_RE.sub('', word)
+            yield word
+
+    def stem(self, word: str) -> Optional[str]:
+        """Stem a single lowercase word the way terms() would, or None if it isn't indexed."""
+        if not word.isalpha():
+            word = DIGITS_RE.sub('', word)
+        self.load()
+        if len(word) > 1 and word not in self.stop_words:
+            return self._stem(word)
+        return None
+
+    def terms(self, text: str) -> Iterator[str]:
+        """Yield the stemmed terms of text, skipping stopwords and single characters."""
+        self.load()
+        stop_words = self.stop_words
+        stem = self._stem
+        for word in self.words(text):
+            if len(word) > 1 and word not in stop_words:
+                yield stem(word)
+
+    def analyze(self, text: str) -> List[str]:
+        """Return the stemmed terms of text as a list."""
+        return list(self.terms(text))
+
+    def term_frequencies(self, text: str) -> Dict[str, int]:
+        """Count the occurrences of each stemmed term in text."""
+        word_freq = {}
+        for term in self.terms(text):
+            word_freq[term] = word_freq.get(term, 0) + 1
+        return word_freq
+
+    def term_positions(self, text: str) -> Dict[str, List[int]]:
+        """Positions of each stemmed term in the term sequence of text.
+
+        Stopwords aren't counted, so a phrase matches wherever its terms are adjacent.
+        """
+        positions = {}
+        for position, term in enumerate(self.terms(text)):
+            positions.setdefault(term, []).append(position)
+        return positions
+
+    def surface_forms(self, text: str, terms: Iterable[str]) -> Dict[str, str]:
+        """First word of text that stems to each of terms, e.g. {'happi': 'happiness'}."""
+        missing = set(terms)
+        surfaces = {}
+        for word in self.words(text):
+            if not missing:
+                break
+            term = self.stem(word)
+            if term in missing:
+                surfaces[term] = word
+                missing.discard(term)
+        return surfaces
+
+    def cache_stats(self) -> Dict[str, float]:
+        """Stem cache hits, misses, size and hit rate."""
+        if self._stem is None:
+            return {'hits': 0, 'misses': 0, 'size': 0, 'max_size': self.cache_size, 'hit_rate': 0.0}
+        info = self._stem.cache_info()
+        lookups = info.hits + info.misses
+        return {
+            'hits': info.hits,
+            'misses': info.misses,
+            'size': info.currsize,
+            'max_size': info.maxsize,
+            'hit_rate': info.hits / lookups if lookups else 0.0
+        }
+
+# Shared analyzer used by classeur and servir
+analyzer = Analyzer()
@@ -0,0 +1 @@
+# Benchmarks - Synthetic sites and timing scripts for the crawler, indexer and search
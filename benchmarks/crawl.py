@@ -0,0 +1,31 @@
+# Crawl Benchmark - Sequential vs concurrent crawling of local synthetic sites
+import argparse
+import os
+import tempfile
+import time
+import glaneur
+from init_db import init_database
+from benchmarks.sites import serve_sites
+
+def run(num_sites: int, pages_per_site: int, delay: float, concurrency: int) -> None:
+    with serve_sites(num_sites, pages_per_site) as base_urls, tempfile.TemporaryDirectory() as tmp:
+        max_pages = num_sites * pages_per_site
+        for label, workers in (('sequential', 1), ('concurrent', concurrency)):
+            db_path = os.path.join(tmp, f'{label}.db')
+            init_database(db_path)
+            glaneur.robots_parser_cache.clear()
+
+            start = time.perf_counter()
+            pages = glaneur.crawl_pages(base_urls, max_pages=max_pages, min_delay=delay, max_delay=delay,
+                                        db_path=db_path, concurrency=workers)
+            elapsed = time.perf_counter() - start
+            print(f"{label}: {pages} pages in {elapsed:.2f}s ({pages / elapsed:.1f} pages/s)")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare sequential and concurrent crawling.')
+    parser.add_argument('--sites', type=int, default=8)
+    parser.add_argument('--pages', type=int, default=10)
+    parser.add_argument('--delay', type=float, default=0.2)
+    parser.add_argument('--concurrency', type=int, default=16)
+    args = parser.parse_args()
+    run(args.sites, args.pages, args.delay, args.concurrency)
@@ -0,0 +1,101 @@
+# Positions Benchmark - Storage and query cost of a positional vs. non-positional index
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+from typing import List
+import servir
+from analyseur import analyzer
+from classeur import IndexSegment
+from db import get_connection, close_all
+from init_db import init_database
+
+SYLLABLES = ['ka', 'lo', 'mi', 'ren', 'tas', 'vo', 'pel', 'dor', 'sin', 'qua', 'bru', 'fen']
+
+def make_vocabulary(size: int, rng: random.Random) -> List[str]:
+    words = set()
+    while len(words) < size:
+        words.add(''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+def make_pages(num_pages: int, words_per_page: int, vocabulary: List[str], seed: int = 1) -> List[str]:
+    """Page texts whose word frequencies follow Zipf's law."""
+    rng = random.Random(seed)
+    weights = [1 / rank for rank in range(1, len(vocabulary) + 1)]
+    return [' '.join(rng.choices(vocabulary, weights, k=words_per_page)) for _ in range(num_pages)]
+
+def build_index(db_path: str, pages: List[str], positions: bool) -> float:
+    init_database(db_path)
+    segment = IndexSegment(db_path, max_pages=200, positions=positions)
+    start = time.perf_counter()
+    for n, text in enumerate(pages):
+        term_positions = analyzer.term_positions(text)
+        word_freq = {word: len(word_positions) for word, word_positions in term_positions.items()}
+        segment.add_page(f'http://bench/{n}', f'Page {n}', text[:100], word_freq, None,
+                         term_positions if positions else None)
+    segment.flush()
+    return time.perf_counter() - start
+
+def database_bytes(db_path: str) -> int:
+    conn = get_connection(db_path)
+    try:
+        conn.execute('VACUUM')
+        page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+        return conn.execute('PRAGMA page_count').fetchone()[0] * page_size
+    finally:
+        conn.close()
+
+def time_queries(db_path: str, queries: List[str], k: int) -> List[float]:
+    timings = []
+    for query in queries:
+        servir.result_cache.clear()
+        start = time.perf_counter()
+        servir.search_pages(query, db_path, k)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+def summarize(label: str, timings: List[float]) -> str:
+    ordered = sorted(timings)
+    p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+    return f"{label}: mean {statistics.mean(timings) * 1000:.2f}ms, p99 {p99 * 1000:.2f}ms"
+
+def run(num_pages: int, words_per_page: int, vocabulary_size: int, num_queries: int, k: int) -> None:
+    rng = random.Random(42)
+    vocabulary = make_vocabulary(vocabulary_size, rng)
+    pages = make_pages(num_pages, words_per_page, vocabulary)
+
+    # Two-word queries and phrases taken from the pages, so phrases do match
+    term_queries = [' '.join(rng.sample(vocabulary[:500], 2)) for _ in range(num_queries)]
+    phrase_queries = []
+    for _ in range(num_queries):
+        words = rng.choice(pages).split()
+        start = rng.randrange(len(words) - 2)
+        phrase_queries.append('"' + ' '.join(words[start:start + 2]) + '"')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        sizes = {}
+        for positions in (False, True):
+            label = 'positional' if positions else 'non-positional'
+            db_path = os.path.join(tmp, f'{label}.db')
+            elapsed = build_index(db_path, pages, positions)
+            sizes[label] = database_bytes(db_path)
+            print(f"{label}: indexed {num_pages} pages in {elapsed:.2f}s, {sizes[label] / 1024 / 1024:.1f} MiB")
+            print('  ' + summarize('term queries', time_queries(db_path, term_queries, k)))
+            if positions:
+                print('  ' + summarize('phrase queries', time_queries(db_path, phrase_queries, k)))
+        close_all()
+
+    overhead = sizes['positional'] / sizes['non-positional'] - 1
+    print(f"Storage overhead of positions: {overhead:.0%}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare positional and non-positional indexing.')
+    parser.add_argument('--pages', type=int, default=2000)
+    parser.add_argument('--words', type=int, default=300)
+    parser.add_argument('--vocabulary', type=int, default=5000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=10)
+    args = parser.parse_args()
+    run(args.pages, args.words, args.vocabulary, args.queries, args.k)
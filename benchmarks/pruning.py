@@ -0,0 +1,81 @@
+# Pruning Benchmark - Exhaustive BM25 vs MaxScore top-k on a synthetic Zipfian corpus
+import argparse
+import random
+import statistics
+import time
+from array import array
+from typing import Dict, List, Tuple
+from classement import rank_bm25, rank_maxscore
+from postings import POSTING_TYPECODE
+
+def build_corpus(num_docs: int, vocabulary: int, seed: int = 42) -> Tuple[List[Tuple], array, int]:
+    """Posting lists whose document frequencies follow Zipf's law, with random page lengths.
+
+    Returns (term_postings, lengths, total_length) where each term is
+    (webpage_ids, frequencies, max_frequency, min_length) as stored by the indexer.
+    """
+    rng = random.Random(seed)
+    lengths = array(POSTING_TYPECODE, (rng.randint(50, 2000) for _ in range(num_docs)))
+    terms = []
+    for rank in range(1, vocabulary + 1):
+        df = max(1, min(num_docs // 2, int(num_docs / rank ** 1.1)))
+        webpage_ids = array(POSTING_TYPECODE, sorted(rng.sample(range(num_docs), df)))
+        frequencies = array(POSTING_TYPECODE, (min(int(rng.expovariate(0.5)) + 1, 50) for _ in range(df)))
+        terms.append((webpage_ids, frequencies, max(frequencies), min(lengths[i] for i in webpage_ids)))
+    return terms, lengths, sum(lengths)
+
+def make_queries(terms: List[Tuple], count: int, seed: int = 7) -> List[List[Tuple]]:
+    """Queries of 2-4 common terms, half of them with one rarer term added."""
+    rng = random.Random(seed)
+    queries = []
+    for n in range(count):
+        query = rng.sample(terms[:200], rng.randint(2, 4))
+        if n % 2:
+            query.append(rng.choice(terms[200:5000]))
+        queries.append(query)
+    return queries
+
+def time_queries(rank, queries: List[List[Tuple]], lengths: array, num_docs: int, total_length: int,
+                 k: int, **kwargs) -> Tuple[List[float], List[List]]:
+    timings = []
+    results = []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(rank(query, lengths, num_docs, total_length, k, **kwargs))
+        timings.append(time.perf_counter() - start)
+    return timings, results
+
+def summarize(label: str, timings: List[float]) -> None:
+    ordered = sorted(timings)
+    p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+    print(f"{label}: mean {statistics.mean(timings) * 1000:.2f}ms, "
+          f"p50 {statistics.median(timings) * 1000:.2f}ms, p99 {p99 * 1000:.2f}ms")
+
+def run(num_docs: int, vocabulary: int, num_queries: int, k: int) -> None:
+    print(f"Building corpus: {num_docs} pages, {vocabulary} terms...")
+    terms, lengths, total_length = build_corpus(num_docs, vocabulary)
+    queries = make_queries(terms, num_queries)
+
+    exhaustive_queries = [[(ids, freqs) for ids, freqs, _, _ in query] for query in queries]
+    exhaustive, expected = time_queries(rank_bm25, exhaustive_queries, lengths, num_docs, total_length, k)
+    stats: Dict[str, int] = {}
+    pruned, actual = time_queries(rank_maxscore, queries, lengths, num_docs, total_length, k, stats=stats)
+
+    # Ties may be ordered differently, so compare the score lists
+    same = all([round(s, 9) for _, s, _ in a] == [round(s, 9) for _, s, _ in b]
+               for a, b in zip(expected, actual))
+    print(f"Same top {k} scores: {same}")
+    summarize('exhaustive', exhaustive)
+    summarize('maxscore', pruned)
+    skipped = stats['postings'] - stats['scored']
+    print(f"Postings skipped: {skipped} of {stats['postings']} ({skipped / max(stats['postings'], 1):.1%})")
+    print(f"Speedup: {statistics.mean(exhaustive) / statistics.mean(pruned):.1f}x")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare exhaustive BM25 scoring with MaxScore pruning.')
+    parser.add_argument('--docs', type=int, default=200_000)
+    parser.add_argument('--terms', type=int, default=20_000)
+    parser.add_argument('--queries', type=int, default=100)
+    parser.add_argument('--k', type=int, default=10)
+    args = parser.parse_args()
+    run(args.docs, args.terms, args.queries, args.k)
@@ -0,0 +1,126 @@
+# Synthetic Sites - Generated websites served from a local stand-in HTTP server
+import random
+import itertools
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, List, Optional, Tuple
+
+WORDS = (
+    "search engine crawler index query ranking page link site content text word "
+    "python garden river mountain ocean forest city music history science travel "
+    "recipe market energy health school library window harbor island planet signal"
+).split()
+
+SYLLABLES = ['ka', 'lo', 'mi', 'ren', 'tas', 'vo', 'pel', 'dor', 'sin', 'qua', 'bru', 'fen']
+
+ROBOTS_TXT = "User-agent: *\nDisallow: /private/\n"
+
+# Link graphs: 'random' links to random pages, 'ring' to the next pages in order,
+# 'hub' from every page to page 0 and from page 0 to all pages
+LINK_GRAPHS = ('random', 'ring', 'hub')
+
+def make_vocabulary(size: int, seed: int = 0) -> List[str]:
+    """WORDS followed by made-up words, up to size words; earlier words are used more often."""
+    rng = random.Random(seed)
+    words = list(WORDS[:size])
+    seen = set(words)
+    while len(words) < size:
+        word = ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+        if word not in seen:
+            seen.add(word)
+            words.append(word)
+    return words
+
+def zipf_weights(size: int, exponent: float = 1.0) -> List[float]:
+    """Cumulative weights making the word of rank r appear with frequency ~ 1 / r^exponent."""
+    return list(itertools.accumulate(1 / rank ** exponent for rank in range(1, size + 1)))
+
+def _links(rng: random.Random, page_id: int, num_pages: int, links_per_page: int, link_graph: str) -> List[int]:
+    if link_graph == 'ring':
+        return [(page_id + step) % num_pages for step in range(1, links_per_page + 1)]
+    if link_graph == 'hub':
+        return list(range(num_pages)) if page_id == 0 else [0]
+    return [rng.randrange(num_pages) for _ in range(links_per_page)]
+
+def generate_site(site_id: int, num_pages: int, links_per_page: int = 5, seed: int = 0,
+                  vocabulary: Optional[List[str]] = None, words_per_page: Tuple[int, int] = (30, 320),
+                  link_graph: str = 'random') -> Dict[str, str]:
+    """Generate the pages of one synthetic site as a {path: html} mapping.
+
+    Without a vocabulary, words are drawn uniformly from WORDS; with one, they follow
+    Zipf's law over it. link_graph is one of LINK_GRAPHS.
+    """
+    if link_graph not in LINK_GRAPHS:
+        raise ValueError(f"Unknown link graph: {link_graph}")
+    rng = random.Random(seed * 1000003 + site_id)
+    weights = zipf_weights(len(vocabulary)) if vocabulary else None
+    pages = {}
+    for page_id in range(num_pages):
+        paragraphs = []
+        remaining = rng.randint(*words_per_page)
+        while remaining > 0:
+            size = min(remaining, rng.randint(10, 40))
+            remaining -= size
+            if vocabulary:
+                words = rng.choices(vocabulary, cum_weights=weights, k=size)
+            else:
+                words = [rng.choice(WORDS) for _ in range(size)]
+            paragraphs.append('<p>' + ' '.join(words) + '.</p>')
+        links = ''.join(
+            f'<a href="/page/{target}">more</a>'
+            for target in _links(rng, page_id, num_pages, links_per_page, link_graph)
+        )
+        pages[f'/page/{page_id}'] = (
+            f'<html><head><title>Site {site_id} page {page_id}</title></head>'
+            f'<body><h1>Site {site_id} page {page_id} heading text</h1>{"".join(paragraphs)}'
+            f'{links}<a href="/private/secret">hidden</a></body></html>'
+        )
+    pages['/'] = pages['/page/0']
+    return pages
+
+def _make_handler(pages: Dict[str, str]):
+    class SiteHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == '/robots.txt':
+                body, content_type = ROBOTS_TXT, 'text/plain'
+            elif self.path in pages:
+                body, content_type = pages[self.path], 'text/html'
+            else:
+                self.send_error(404)
+                return
+            data = body.encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', f'{content_type}; charset=utf-8')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    return SiteHandler
+
+@contextmanager
+def serve_sites(num_sites: int = 4, pages_per_site: int = 50, links_per_page: int = 5, seed: int = 0,
+                vocabulary: Optional[List[str]] = None, words_per_page: Tuple[int, int] = (30, 320),
+                link_graph: str = 'random') -> Iterator[List[str]]:
+    """Serve synthetic sites on local ports, one port (and so one host) per site.
+
+    Pages are answered right away, without any delay. Yields the base URLs of the
+    sites and shuts the servers down on exit.
+    """
+    servers = []
+    try:
+        for site_id in range(num_sites):
+            pages = generate_site(site_id, pages_per_site, links_per_page, seed, vocabulary,
+                                  words_per_page, link_graph)
+            server = ThreadingHTTPServer(('127.0.0.1', 0), _make_handler(pages))
+            server.daemon_threads = True
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            servers.append(server)
+        yield [f'http://127.0.0.1:{server.server_address[1]}/' for server in servers]
+    finally:
+        for server in servers:
+            server.shutdown()
+            server.server_close()
@@ -0,0 +1,72 @@
+# Startup Benchmark - Cold start time and memory of a server process, up to its first search and crawl request
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from typing import Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Run in a fresh interpreter; prints the elapsed time, peak RSS and loaded modules after each step
+PROBE = '''
+import json, resource, sys, time
+start = time.perf_counter()
+report = {}
+
+def mark(step):
+    report[step] = {
+        'seconds': time.perf_counter() - start,
+        'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'modules': len(sys.modules),
+        'heavy_modules': [name for name in ('nltk', 'bs4', 'requests') if name in sys.modules],
+    }
+
+import clea_server
+mark('import')
+client = clea_server.app.test_client()
+client.get('/api/search?q=benchmark')
+mark('first_search')
+client.get('/api/sitemap')
+mark('first_sitemap_request')
+print(json.dumps(report))
+'''
+
+def probe(workdir: str) -> Dict[str, Dict]:
+    env = dict(os.environ, PYTHONPATH=ROOT + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    output = subprocess.run([sys.executable, '-c', PROBE], cwd=workdir, env=env, capture_output=True,
+                            text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def run(repeat: int) -> Dict:
+    """Median time and peak RSS of each startup step over repeat fresh processes."""
+    with tempfile.TemporaryDirectory() as tmp:
+        # The server opens clea_db.db in its working directory
+        subprocess.run([sys.executable, '-c', 'from init_db import init_database; init_database()'], cwd=tmp,
+                       env=dict(os.environ, PYTHONPATH=ROOT), check=True, capture_output=True)
+        probe(tmp)  # warm the OS file cache and bytecode caches
+        runs: List[Dict[str, Dict]] = [probe(tmp) for _ in range(repeat)]
+
+    report = {}
+    for step in runs[0]:
+        report[step] = {
+            'seconds': statistics.median(run[step]['seconds'] for run in runs),
+            'max_rss_kb': statistics.median(run[step]['max_rss_kb'] for run in runs),
+            'modules': runs[0][step]['modules'],
+            'heavy_modules': runs[0][step]['heavy_modules'],
+        }
+    return report
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure server cold start time and memory.')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    result = run(args.repeat)
+    for step, values in result.items():
+        print(f"{step}: {values['seconds'] * 1000:.0f}ms, {values['max_rss_kb'] / 1024:.1f}MB peak RSS, "
+              f"{values['modules']} modules ({', '.join(values['heavy_modules']) or 'no NLTK/bs4/requests'})",
+              file=sys.stderr)
+    json.dump(result, sys.stdout, indent=2)
+    print()
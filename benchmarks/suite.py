@@ -0,0 +1,239 @@
+# Benchmark Suite - Crawl, index and search benchmarks on local synthetic sites, reported as JSON
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional
+import glaneur
+import metrics
+import servir
+from classeur import batch_index_urls
+from db import get_connection, close_all
+from init_db import init_database
+from shards import read_shard_count, reshard, shard_path
+from benchmarks.sites import LINK_GRAPHS, make_vocabulary, serve_sites
+
+# Bump when the layout of the report changes, so old reports aren't compared blindly
+REPORT_VERSION = 2
+
+def percentiles(timings: List[float]) -> Dict[str, float]:
+    """Mean, p50, p90, p99 and max of timings, in milliseconds."""
+    ordered = sorted(timings)
+
+    def at(fraction: float) -> float:
+        return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] * 1000
+
+    return {
+        'mean_ms': statistics.mean(ordered) * 1000,
+        'p50_ms': at(0.5),
+        'p90_ms': at(0.9),
+        'p99_ms': at(0.99),
+        'max_ms': ordered[-1] * 1000,
+    }
+
+def stage_summary() -> Dict[str, Dict[str, float]]:
+    """Count and mean duration of each instrumented stage since the last call."""
+    return {stage: {'count': count, 'mean_ms': total / count * 1000 if count else 0.0}
+            for stage, (_, total, count) in sorted(metrics.export().items())}
+
+def database_bytes(db_path: str) -> int:
+    """Size of the database and its index shards."""
+    conn = get_connection(db_path)
+    try:
+        shard_count = read_shard_count(conn.cursor())
+    finally:
+        conn.close()
+    total = 0
+    for path in [db_path, *(shard_path(db_path, shard, shard_count) for shard in range(shard_count))]:
+        conn = get_connection(path)
+        try:
+            conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+            page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+            total += conn.execute('PRAGMA page_count').fetchone()[0] * page_size
+        finally:
+            conn.close()
+    return total
+
+def make_query_log(vocabulary: List[str], count: int, seed: int = 7) -> List[str]:
+    """Queries of 1-3 words biased towards frequent words, one in five a quoted phrase."""
+    rng = random.Random(seed)
+    head = vocabulary[:max(len(vocabulary) // 10, 10)]
+    queries = []
+    for n in range(count):
+        words = rng.sample(head, rng.randint(1, 3))
+        if rng.random() < 0.3:
+            words[-1] = rng.choice(vocabulary)
+        query = ' '.join(words)
+        queries.append(f'"{query}"' if n % 5 == 4 and len(words) > 1 else query)
+    return queries
+
+def bench_crawl(db_path: str, page_urls: List[str], concurrency: int) -> Dict:
+    """crawl_from_sitemap over every page of the sites; throughput counts the pages actually fetched."""
+    glaneur.robots_parser_cache.clear()
+    glaneur.add_urls_to_sitemap(page_urls, db_path)
+    statuses: Dict[str, int] = {}
+    statuses_lock = threading.Lock()
+
+    def count(url: str, status: str) -> None:
+        with statuses_lock:
+            statuses[status] = statuses.get(status, 0) + 1
+
+    stage_summary()
+    start = time.perf_counter()
+    links = glaneur.crawl_from_sitemap(force_crawl=True, min_delay=0, max_delay=0, db_path=db_path,
+                                       concurrency=concurrency, on_status=count)
+    elapsed = time.perf_counter() - start
+    crawled = statuses.get('crawled', 0)
+    return {
+        'pages': crawled,
+        'errors': statuses.get('error', 0),
+        'links_found': len(links),
+        'seconds': elapsed,
+        'pages_per_second': crawled / elapsed,
+        'stages': stage_summary(),
+    }
+
+def bench_index(db_path: str, page_urls: List[str], workers: int, positions: bool) -> Dict:
+    """batch_index_urls over the crawled pages, with the database growth it causes."""
+    size_before = database_bytes(db_path)
+    start = time.perf_counter()
+    indexed = batch_index_urls(page_urls, max_pages=len(page_urls), min_delay=0, max_delay=0, db_path=db_path,
+                               workers=workers, positions=positions)
+    elapsed = time.perf_counter() - start
+    size_after = database_bytes(db_path)
+    return {
+        'pages': indexed,
+        'seconds': elapsed,
+        'pages_per_second': indexed / elapsed,
+        'database_bytes_before': size_before,
+        'database_bytes_after': size_after,
+        'bytes_per_page': (size_after - size_before) / max(indexed, 1),
+        'stages': stage_summary(),
+    }
+
+def bench_search(db_path: str, queries: List[str], k: int) -> Dict:
+    """search_pages latency over the query log, with empty caches and then with filled ones."""
+    report = {'queries': len(queries)}
+    stage_summary()
+    for label in ('cold', 'warm'):
+        if label == 'warm':
+            report['cold_stages'] = stage_summary()
+            for query in queries:
+                servir.search_pages(query, db_path, k)
+            stage_summary()
+        timings = []
+        hits = 0
+        for query in queries:
+            if label == 'cold':
+                servir.result_cache.clear()
+                servir.posting_cache.clear()
+            start = time.perf_counter()
+            hits += bool(servir.search_pages(query, db_path, k))
+            timings.append(time.perf_counter() - start)
+        report[label] = {**percentiles(timings), 'queries_with_results': hits}
+    report['warm_stages'] = stage_summary()
+    return report
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(sites: int, pages: int, vocabulary_size: int, links: int, link_graph: str, queries: int,
+        k: int, concurrency: int, workers: int, positions: bool, seed: int, shards: int = 0) -> Dict:
+    """Run the three benchmarks on a fresh database and return the report."""
+    vocabulary = make_vocabulary(vocabulary_size, seed)
+    report = {
+        'version': REPORT_VERSION,
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'params': {
+            'sites': sites, 'pages_per_site': pages, 'vocabulary': vocabulary_size,
+            'links_per_page': links, 'link_graph': link_graph, 'queries': queries, 'k': k,
+            'concurrency': concurrency, 'workers': workers, 'positions': positions, 'seed': seed,
+            'shards': shards,
+        },
+    }
+    with serve_sites(sites, pages, links, seed, vocabulary, link_graph=link_graph) as base_urls, \
+            tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        init_database(db_path)
+        if shards:
+            reshard(db_path, shards)
+        page_urls = [f'{base}page/{page_id}' for base in base_urls for page_id in range(pages)]
+        metrics.reset()
+
+        print(f"Crawling {len(page_urls)} pages...", file=sys.stderr)
+        report['crawl'] = bench_crawl(db_path, page_urls, concurrency)
+        print(f"Indexing {len(page_urls)} pages...", file=sys.stderr)
+        report['index'] = bench_index(db_path, page_urls, workers, positions)
+        print(f"Running {queries} queries...", file=sys.stderr)
+        report['search'] = bench_search(db_path, make_query_log(vocabulary, queries, seed), k)
+        close_all()
+    return report
+
+def _flatten(report: Dict, prefix: str = '') -> Dict[str, float]:
+    values = {}
+    for key, value in report.items():
+        name = f'{prefix}{key}'
+        if isinstance(value, dict):
+            values.update(_flatten(value, name + '.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            values[name] = value
+    return values
+
+def compare(baseline: Dict, current: Dict) -> List[str]:
+    """Relative change of every crawl, index and search figure between two reports."""
+    lines = []
+    if baseline.get('params') != current.get('params'):
+        lines.append('warning: the reports were run with different parameters')
+    old = _flatten({key: baseline.get(key, {}) for key in ('crawl', 'index', 'search')})
+    new = _flatten({key: current.get(key, {}) for key in ('crawl', 'index', 'search')})
+    for name in sorted(old.keys() & new.keys()):
+        if old[name]:
+            lines.append(f'{name}: {old[name]:.4g} -> {new[name]:.4g} ({new[name] / old[name] - 1:+.1%})')
+    return lines
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Crawl, index and search benchmarks on synthetic local sites.')
+    parser.add_argument('--sites', type=int, default=4)
+    parser.add_argument('--pages', type=int, default=100, help='pages per site')
+    parser.add_argument('--vocabulary', type=int, default=5000)
+    parser.add_argument('--links', type=int, default=5, help='links per page')
+    parser.add_argument('--link-graph', choices=LINK_GRAPHS, default='random')
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--workers', type=int, default=0, help='indexing worker processes')
+    parser.add_argument('--positions', action='store_true')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--shards', type=int, default=0, help='index shard files, 0 for a single database')
+    parser.add_argument('--output', help='write the JSON report here instead of stdout')
+    parser.add_argument('--compare', metavar='BASELINE', help='print changes against an earlier JSON report')
+    args = parser.parse_args()
+
+    # The crawler and indexer print progress; keep it out of a JSON report written to stdout
+    with contextlib.redirect_stdout(sys.stderr):
+        result = run(args.sites, args.pages, args.vocabulary, args.links, args.link_graph, args.queries,
+                     args.k, args.concurrency, args.workers, args.positions, args.seed, args.shards)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+    else:
+        json.dump(result, sys.stdout, indent=2)
+        print()
+    if args.compare:
+        with open(args.compare) as f:
+            print('\n'.join(compare(json.load(f), result)), file=sys.stderr)
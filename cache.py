@@ -0,0 +1,88 @@
+# Cache - Bounded LRU/TTL caches invalidated by the index generation
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+class LRUCache:
+    """Thread-safe LRU cache with an optional time-to-live per entry.
+
+    Entries belong to one index generation: sync() drops everything when the
+    indexer has published a newer one, so cached data is never older than the
+    index it was computed from.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: Optional[float] = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.generation: Optional[int] = None
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def sync(self, generation: int) -> None:
+        """Clear the cache if its entries were computed for another index generation."""
+        if generation == self.generation:
+            return
+        with self._lock:
+            if generation != self.generation:
+                if self.generation is not None:
+                    self.invalidations += 1
+                self._entries.clear()
+                self.generation = generation
+
+    def get(self, key: Hashable) -> Any:
+        """Return the cached value for key, or None on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, stored_at = entry
+            if self.ttl is not None and time.monotonic() - stored_at > self.ttl:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any, generation: int) -> None:
+        """Store value for key if it was computed for the generation the cache holds.
+
+        Another request may have synced the cache to a newer generation meanwhile;
+        a value computed for the older one is then dropped rather than served as current.
+        """
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Hits, misses, evictions, expirations, invalidations, size and hit rate."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'generation': self.generation,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
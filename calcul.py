@@ -0,0 +1,187 @@
+# Calculator - Recognizes and evaluates arithmetic queries without eval
+import ast
+import math
+import operator
+from functools import lru_cache
+from typing import Callable, Dict, Optional, Union
+
+Number = Union[int, float]
+
+# Longer queries are searched, never evaluated
+MAX_LENGTH = 200
+
+# Nodes per expression after parsing
+MAX_NODES = 100
+
+# Largest integer an expression may produce along the way (about 1200 digits);
+# powers are rejected before computing when their result would be larger
+MAX_INT_BITS = 4096
+
+# Digits round() may keep or drop; its cost grows with them, not with its result
+MAX_ROUND_DIGITS = 100
+
+def _round(number: Number, ndigits: Optional[int] = None) -> Number:
+    if ndigits is not None and (not isinstance(ndigits, int) or abs(ndigits) > MAX_ROUND_DIGITS):
+        raise ValueError('Too many digits to round to')
+    return round(number, ndigits)
+
+FUNCTIONS: Dict[str, Callable] = {
+    'sqrt': math.sqrt,
+    'sin': math.sin,
+    'cos': math.cos,
+    'tan': math.tan,
+    'log': math.log10,
+    'ln': math.log,
+    'abs': abs,
+    'round': _round,
+    'min': min,
+    'max': max,
+}
+
+CONSTANTS: Dict[str, float] = {'pi': math.pi, 'e': math.e}
+
+BINARY_OPERATORS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+}
+
+UNARY_OPERATORS = {ast.UAdd: operator.pos, ast.USub: operator.neg}
+
+# Characters of the classifier: operators make a query a calculation, symbols may appear in one
+OPERATOR_CHARS = frozenset('+-*/^√')
+SYMBOL_CHARS = frozenset(' \t().,%π')
+
+def is_math_query(query: str) -> bool:
+    """Whether query looks like a calculation, in one pass over its characters.
+
+    A calculation has at least one number and one operator or function, and
+    every word in it is a known function or constant, e.g. '2^10', 'sqrt(2) * pi'.
+    """
+    cleaned = query.strip().lower()
+    if len(cleaned) > MAX_LENGTH:
+        return False
+    has_number = has_operator = False
+    word_start = None
+    for i, char in enumerate(cleaned + ' '):  # the trailing space ends the last word
+        if 'a' <= char <= 'z':
+            if word_start is None:
+                word_start = i
+            continue
+        if word_start is not None:
+            word = cleaned[word_start:i]
+            if word in FUNCTIONS:
+                has_operator = True
+            elif word not in CONSTANTS:
+                return False
+            word_start = None
+        if '0' <= char <= '9':
+            has_number = True
+        elif char in OPERATOR_CHARS:
+            has_operator = True
+        elif char not in SYMBOL_CHARS:
+            return False
+    return has_number and has_operator
+
+def _checked(value: Number) -> Number:
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError('Result is not a real number')
+    if isinstance(value, int) and value.bit_length() > MAX_INT_BITS:
+        raise ValueError('Result too large')
+    if isinstance(value, float) and not math.isfinite(value):
+        raise ValueError('Result is not finite')
+    return value
+
+def _power(base: Number, exponent: Number) -> Number:
+    # An integer power's size is known from the operands, so oversized ones are never computed
+    if isinstance(base, int) and isinstance(exponent, int) and exponent > 0 and abs(base) > 1:
+        if (abs(base).bit_length() - 1) * exponent > MAX_INT_BITS:
+            raise ValueError('Result too large')
+    return base ** exponent
+
+def _compile(node: ast.AST) -> Callable[[], Number]:
+    """Turn a whitelisted expression node into a function computing its value."""
+    if isinstance(node, ast.Constant):
+        value = node.value
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError(f'Unsupported constant: {value!r}')
+        value = _checked(value)
+        return lambda: value
+    if isinstance(node, ast.Name):
+        if node.id not in CONSTANTS:
+            raise ValueError(f'Unknown name: {node.id}')
+        value = CONSTANTS[node.id]
+        return lambda: value
+    if isinstance(node, ast.UnaryOp) and type(node.op) in UNARY_OPERATORS:
+        op, operand = UNARY_OPERATORS[type(node.op)], _compile(node.operand)
+        return lambda: op(operand())
+    if isinstance(node, ast.BinOp):
+        if isinstance(node.op, ast.Pow):
+            op = _power
+        elif type(node.op) in BINARY_OPERATORS:
+            op = BINARY_OPERATORS[type(node.op)]
+        else:
+            raise ValueError(f'Unsupported operator: {type(node.op).__name__}')
+        left, right = _compile(node.left), _compile(node.right)
+        return lambda: _checked(op(left(), right()))
+    if isinstance(node, ast.Call):
+        if not isinstance(node.func, ast.Name) or node.func.id not in FUNCTIONS or node.keywords:
+            raise ValueError('Unsupported function call')
+        function = FUNCTIONS[node.func.id]
+        arguments = [_compile(argument) for argument in node.args]
+        # Arguments are checked like any result before the function sees them
+        return lambda: _checked(function(*(_checked(argument()) for argument in arguments)))
+    raise ValueError(f'Unsupported expression: {type(node).__name__}')
+
+@lru_cache(maxsize=256)
+def compile_expression(expr: str) -> Optional[Callable[[], Number]]:
+    """Parse a calculation into a function computing its value, or None if it isn't one.
+
+    '^' is a power and '√' a square root; only numbers, the arithmetic operators,
+    FUNCTIONS and CONSTANTS are accepted. Parsed expressions are cached.
+    """
+    expr = expr.strip().lower()
+    if not expr or len(expr) > MAX_LENGTH:
+        return None
+    expr = expr.replace('^', '**').replace('√', 'sqrt').replace('π', 'pi')
+    try:
+        tree = ast.parse(expr, mode='eval')
+        if sum(1 for _ in ast.walk(tree)) > MAX_NODES:
+            return None
+        return _compile(tree.body)
+    except (SyntaxError, ValueError, RecursionError):
+        return None
+
+def evaluate(expr: str) -> Optional[Number]:
+    """Value of a calculation, or None if it can't be parsed or computed within the limits."""
+    compiled = compile_expression(expr)
+    if compiled is None:
+        return None
+    try:
+        return compiled()
+    except (ArithmeticError, ValueError, TypeError):
+        return None
+
+def solve_math_query(query: str) -> Optional[Dict[str, str]]:
+    """
+    Solve a mathematical query and format the result.
+    """
+    query = query.strip()
+    result = evaluate(query)
+    if result is None:
+        return None
+
+    if isinstance(result, int) or result.is_integer():
+        formatted_result = str(int(result))
+    else:
+        # Round to a reasonable number of decimal places for display
+        formatted_result = str(round(result, 10)).rstrip('0').rstrip('.')
+
+    return {
+        'type': 'calculation',
+        'expression': query,
+        'result': formatted_result
+    }
@@ -0,0 +1,228 @@
+# Ranking - BM25 scoring of posting lists with heap-based top-k selection
+import heapq
+import math
+from bisect import bisect_left
+from operator import itemgetter
+from typing import Collection, Dict, List, Optional, Sequence, Tuple
+
+# Standard BM25 parameters: term-frequency saturation and length normalization
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+def bm25_idf(df: int, doc_count: int) -> float:
+    """Inverse document frequency of a term found in df of doc_count pages, never negative."""
+    return math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+
+def rank_key(result: Tuple[int, float]) -> Tuple[float, int]:
+    """Sort key of (webpage_id, score): best score first, then lowest id, so ties have a fixed order."""
+    return result[1], -result[0]
+
+def is_after(webpage_id: int, score: float, after: Tuple[float, int]) -> bool:
+    """Whether a page comes after the (score, webpage_id) position in ranking order."""
+    return score < after[0] or (score == after[0] and webpage_id > after[1])
+
+def estimate_hits(document_frequencies: Sequence[int], doc_count: int) -> int:
+    """Estimated number of pages containing any of the terms, from their posting-list lengths.
+
+    Assumes terms occur independently, so a page misses all of them with
+    probability prod(1 - df / N).
+    """
+    if not document_frequencies:
+        return 0
+    doc_count = max(doc_count, *document_frequencies)
+    missing = 1.0
+    for df in document_frequencies:
+        missing *= 1 - df / doc_count
+    return max(round(doc_count * (1 - missing)), *document_frequencies)
+
+def rank_bm25(term_postings: List[Tuple[Sequence[int], Sequence[int]]], lengths, doc_count: int,
+              total_length: int, k: int, deleted: Collection[int] = (),
+              only: Optional[Collection[int]] = None,
+              after: Optional[Tuple[float, int]] = None) -> List[Tuple[int, float, int]]:
+    """Score pages with BM25 and return the k best as (webpage_id, score, matching_terms).
+
+    term_postings holds one (webpage_ids, frequencies) pair per distinct query term;
+    lengths maps a webpage id to its length. The document frequency of a term is the
+    length of its posting list. Only the k best pages are kept in a bounded heap, so
+    selecting them costs O(n log k) instead of sorting every candidate. If only is
+    given, pages outside it are left out of the results (but still count for idf).
+    With after=(score, webpage_id), only pages ranked below that position are returned.
+    """
+    avg_length = total_length / doc_count if doc_count else 1.0
+    avg_length = avg_length or 1.0
+    k1 = BM25_K1
+    # k1 * (1 - b + b * length / avg_length), split into a constant and a per-length part
+    norm_base = k1 * (1 - BM25_B)
+    norm_scale = k1 * BM25_B / avg_length
+
+    scores = {}
+    matches = {}
+    for webpage_ids, frequencies in term_postings:
+        weight = bm25_idf(len(webpage_ids), max(doc_count, len(webpage_ids))) * (k1 + 1)
+        for webpage_id, frequency in zip(webpage_ids, frequencies):
+            score = weight * frequency / (frequency + norm_base + norm_scale * lengths[webpage_id])
+            if webpage_id in scores:
+                scores[webpage_id] += score
+                matches[webpage_id] += 1
+            else:
+                scores[webpage_id] = score
+                matches[webpage_id] = 1
+
+    # Tombstoned pages keep their postings until the next compaction
+    for webpage_id in deleted:
+        scores.pop(webpage_id, None)
+
+    candidates = scores.items()
+    if only is not None:
+        candidates = [(webpage_id, score) for webpage_id, score in candidates if webpage_id in only]
+    if after is not None:
+        candidates = [(webpage_id, score) for webpage_id, score in candidates if is_after(webpage_id, score, after)]
+    top = heapq.nlargest(k, candidates, key=rank_key)
+    return [(webpage_id, score, matches[webpage_id]) for webpage_id, score in top]
+
+def term_upper_bound(weight: float, max_frequency: Optional[int], min_length: Optional[int],
+                     norm_base: float, norm_scale: float) -> float:
+    """Highest BM25 contribution a term can make to any page.
+
+    The per-posting score grows with the frequency and shrinks with the page length,
+    so the list's highest frequency and shortest page bound it from above. Without
+    stored bounds the term weight itself is the (loose) limit.
+    """
+    if max_frequency is None or min_length is None:
+        return weight
+    return weight * max_frequency / (max_frequency + norm_base + norm_scale * min_length)
+
+def rank_maxscore(term_postings: List[Tuple[Sequence[int], Sequence[int], Optional[int], Optional[int]]],
+                  lengths, doc_count: int, total_length: int, k: int, deleted: Collection[int] = (),
+                  stats: Optional[Dict[str, int]] = None,
+                  after: Optional[Tuple[float, int]] = None) -> List[Tuple[int, float, int]]:
+    """BM25 top k with MaxScore pruning; returns the same pages as rank_bm25.
+
+    term_postings holds (webpage_ids, frequencies, max_frequency, min_length) per
+    distinct query term. Terms are scored from the highest upper bound down. Once
+    the bounds of the remaining terms add up to no more than the current k-th best
+    score, a page outside the accumulators can no longer make the top k: remaining
+    lists are then only probed (by binary search) for pages already accumulated,
+    and accumulators that can't reach the threshold are dropped.
+
+    With after=(score, webpage_id), only pages ranked below that position are
+    returned, e.g. for the next page of results. The threshold then only counts
+    pages whose bound keeps them below it.
+
+    If stats is given, 'postings' and 'scored' counts are added to it.
+    """
+    if k <= 0:
+        return []
+    avg_length = total_length / doc_count if doc_count else 1.0
+    avg_length = avg_length or 1.0
+    k1 = BM25_K1
+    norm_base = k1 * (1 - BM25_B)
+    norm_scale = k1 * BM25_B / avg_length
+
+    terms = []
+    for webpage_ids, frequencies, max_frequency, min_length in term_postings:
+        weight = bm25_idf(len(webpage_ids), max(doc_count, len(webpage_ids))) * (k1 + 1)
+        bound = term_upper_bound(weight, max_frequency, min_length, norm_base, norm_scale)
+        terms.append((bound, weight, webpage_ids, frequencies))
+    terms.sort(key=itemgetter(0), reverse=True)
+
+    # remaining[i] is the most the terms from i on can still add to a page
+    remaining = [0.0] * (len(terms) + 1)
+    for i in range(len(terms) - 1, -1, -1):
+        remaining[i] = remaining[i + 1] + terms[i][0]
+
+    scores: Dict[int, float] = {}
+    matches: Dict[int, int] = {}
+    threshold = 0.0
+    total = 0
+    scored = 0
+    for i, (bound, weight, webpage_ids, frequencies) in enumerate(terms):
+        size = len(webpage_ids)
+        total += size
+        if len(scores) >= k and remaining[i] <= threshold:
+            for webpage_id in [d for d, score in scores.items() if score + remaining[i] < threshold]:
+                del scores[webpage_id]
+                del matches[webpage_id]
+
+            if len(scores) * size.bit_length() < size:
+                probes = []
+                for webpage_id in scores:
+                    pos = bisect_left(webpage_ids, webpage_id)
+                    if pos < size and webpage_ids[pos] == webpage_id:
+                        probes.append((webpage_id, frequencies[pos]))
+            else:
+                probes = [(webpage_id, frequency) for webpage_id, frequency in zip(webpage_ids, frequencies)
+                          if webpage_id in scores]
+            for webpage_id, frequency in probes:
+                scores[webpage_id] += weight * frequency / (frequency + norm_base + norm_scale * lengths[webpage_id])
+                matches[webpage_id] += 1
+            scored += len(probes)
+        else:
+            for webpage_id, frequency in zip(webpage_ids, frequencies):
+                score = weight * frequency / (frequency + norm_base + norm_scale * lengths[webpage_id])
+                if webpage_id in scores:
+                    scores[webpage_id] += score
+                    matches[webpage_id] += 1
+                else:
+                    scores[webpage_id] = score
+                    matches[webpage_id] = 1
+            scored += size
+            # Tombstoned pages must not raise the threshold
+            for webpage_id in deleted:
+                if scores.pop(webpage_id, None) is not None:
+                    del matches[webpage_id]
+
+        if after is None:
+            eligible = scores.values()
+        else:
+            # Partial scores still grow, so only pages that surely stay below after count
+            eligible = [score for score in scores.values() if score + remaining[i + 1] < after[0]]
+        if len(eligible) >= k:
+            threshold = heapq.nlargest(k, eligible)[-1]
+
+    if stats is not None:
+        stats['postings'] = stats.get('postings', 0) + total
+        stats['scored'] = stats.get('scored', 0) + scored
+
+    candidates = scores.items()
+    if after is not None:
+        candidates = [(webpage_id, score) for webpage_id, score in candidates if is_after(webpage_id, score, after)]
+    top = heapq.nlargest(k, candidates, key=rank_key)
+    return [(webpage_id, score, matches[webpage_id]) for webpage_id, score in top]
+
+# Weight of the proximity signal added to the BM25 score of multi-term queries
+PROXIMITY_WEIGHT = 0.5
+
+def phrase_matches(term_positions: List[Sequence[int]]) -> bool:
+    """Check whether the terms occur next to each other, in order, somewhere on the page."""
+    if not term_positions or any(not positions for positions in term_positions):
+        return False
+    following = [set(positions) for positions in term_positions[1:]]
+    return any(all(start + offset in positions for offset, positions in enumerate(following, 1))
+               for start in term_positions[0])
+
+def min_distance(left: Sequence[int], right: Sequence[int]) -> int:
+    """Smallest gap between a position in left and one in right (both sorted)."""
+    best = None
+    i = j = 0
+    while i < len(left) and j < len(right):
+        gap = abs(left[i] - right[j])
+        if best is None or gap < best:
+            best = gap
+        if left[i] < right[j]:
+            i += 1
+        else:
+            j += 1
+    return best if best is not None else 0
+
+def proximity_score(term_positions: List[Optional[Sequence[int]]]) -> float:
+    """Proximity bonus of a page for query terms given in query order.
+
+    Each pair of consecutive query terms found on the page adds 1 / their smallest
+    distance, so adjacent terms add a full PROXIMITY_WEIGHT.
+    """
+    score = 0.0
+    for left, right in zip(term_positions, term_positions[1:]):
+        if left and right:
+            score += 1 / max(min_distance(left, right), 1)
+    return PROXIMITY_WEIGHT * score
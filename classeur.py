@@ -1,24 +1,37 @@
 # Indexer - Handles Webpage Indexing
 import sqlite3
-import requests
+from db import get_connection
 from bs4 import BeautifulSoup
-from nltk.stem import PorterStemmer
-from nltk.corpus import stopwords
-from typing import List, Tuple
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from postings import (
+    merge_term_changes,
+    encode_terms,
+    decode_terms,
+    encode_positions,
+    bump_generation,
+    update_collection_stats
+)
+from grenier import CONTENT_MAX_AGE, load_page, fetch_page, content_hash, is_page_fresh
+from analyseur import analyzer
+from extraits import make_snippet
+from souffleur import update_vocabulary
+from shards import read_shard_count, write_term_changes
+import metrics
 import re
-import json
+import zlib
+import os
 import time
+import queue
 import random
+import itertools
+import threading
 
 # try:
 #     nltk.data.find('corpora/stopwords')
 # except LookupError:
 #     nltk.download('stopwords')
 
-# Init stemmer and stopwords
-stemmer = PorterStemmer()
-STOP_WORDS = set(stopwords.words('english'))
-
 def clean_title(text: str) -> str:
     """Clean title keeping capitalization."""
     # Remove HTML tags
@@ -40,19 +53,7 @@ def clean_text(text: str) -> str:
 
 def tokenize_and_stem(text: str) -> List[str]:
     """Tokenize text, remove stopwords, and apply stemming."""
-    # Clean the text first
-    text = clean_text(text)
-    
-    # Split into words
-    words = text.split()
-    
-    processed_words = [
-        stemmer.stem(word) for word in words # Apply stemming
-        if word.lower() not in STOP_WORDS  # Remove stopwords
-        and len(word) > 1  # Skip single char words
-    ]
-    
-    return processed_words
+    return analyzer.analyze(text)
 
 def find_best_snippet(text: str, max_length: int = 200) -> str:
     """Find the most relevant snippet from text"""
@@ -91,116 +92,372 @@ def find_best_snippet(text: str, max_length: int = 200) -> str:
     
     return snippet + "..." if len(snippet) < len(" ".join(best_sentences)) else snippet
 
-def extract_page_info(url: str, query_words: List[str] = None) -> Tuple[str, str, str]:
-    """Fetch and extract information from a webpage."""
+def fetch_html(url: str, db_path: str = 'clea_db.db', max_age: float = CONTENT_MAX_AGE) -> str:
+    """Get the HTML of a page from the content store, fetching it only if missing or stale.
+
+    Stale copies are revalidated with a conditional GET, so an unchanged page costs a 304.
+    """
+    html = load_page(url, max_age, db_path)
+    metrics.increment('content_store', result='miss' if html is None else 'hit')
+    if html is None:
+        html, _ = fetch_page(url, db_path=db_path)
+    return html
+
+def parse_page_html(html: str) -> Tuple[str, str, str]:
+    """Extract the title, snippet and full text from a page's HTML."""
+    with metrics.timed('parse'):
+        return _parse_page_html(html)
+
+def _parse_page_html(html: str) -> Tuple[str, str, str]:
+    soup = BeautifulSoup(html, 'html.parser')
+    
+    # Get title
+    title = soup.title.string if soup.title else ""
+    title = clean_title(title)
+    
+    # Get all text with paragraph structure
+    paragraphs = []
+    for p in soup.find_all(['p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6']):
+        text = p.get_text().strip()
+        if text and len(text.split()) > 3: # Avoid short paragraphs
+            paragraphs.append(text)
+    
+    text = ' '.join(paragraphs)
+    text = re.sub(r'[\n\r\t]+', ' ', text)
+    text = ' '.join(text.split())
+    
+    snippet = find_best_snippet(text)
+    
+    return title, snippet, text
+
+def extract_page_info(url: str, query_words: List[str] = None, db_path: str = 'clea_db.db') -> Tuple[str, str, str]:
+    """Fetch and extract information from a webpage.
+
+    With query_words, the snippet is the passage that best matches them.
+    """
     try:
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        # Get title
-        title = soup.title.string if soup.title else ""
-        title = clean_title(title)
-        
-        # Get all text with paragraph structure
-        paragraphs = []
-        for p in soup.find_all(['p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6']):
-            text = p.get_text().strip()
-            if text and len(text.split()) > 3: # Avoid short paragraphs
-                paragraphs.append(text)
-        
-        text = ' '.join(paragraphs)
-        text = re.sub(r'[\n\r\t]+', ' ', text)
-        text = ' '.join(text.split())
-        
-        snippet = find_best_snippet(text)
-        
+        title, snippet, text = parse_page_html(fetch_html(url, db_path))
+        if query_words:
+            snippet = make_snippet(text, tokenize_and_stem(' '.join(query_words)))[0] or snippet
         return title, snippet, text
         
     except Exception as e:
         print(f"Error processing {url}: {str(e)}")
         return "", "", ""
 
-def update_word_index(word: str, webpage_id: int, frequency: int, conn: sqlite3.Connection) -> None:
-    """Update the word index for a single word."""
-    cursor = conn.cursor()
+def upsert_webpage(cursor: sqlite3.Cursor, url: str, title: str, snippet: str, page_hash: Optional[str],
+                   length: int = 0) -> int:
+    """Insert or update a webpage row and return its id, which stays stable across re-indexing."""
+    cursor.execute('''
+    INSERT INTO webpages (url, title, snippet, content_hash, length)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT(url) DO UPDATE SET
+        title = excluded.title,
+        snippet = excluded.snippet,
+        content_hash = excluded.content_hash,
+        length = excluded.length,
+        timestamp = CURRENT_TIMESTAMP
+    ''', (url, title, snippet, page_hash, length))
+    cursor.execute('SELECT id FROM webpages WHERE url = ?', (url,))
+    return cursor.fetchone()[0]
+
+def count_terms(text: str) -> Dict[str, int]:
+    """Tokenize text and count the occurrences of each stemmed term."""
+    return analyzer.term_frequencies(text)
+
+def tokenize_page(text: str, positions: bool = False) -> Tuple[Dict[str, int], Optional[Dict[str, List[int]]]]:
+    """Term frequencies of a page's text, and the term positions if asked."""
+    with metrics.timed('tokenize'):
+        if not positions:
+            return count_terms(text), None
+        term_positions = analyzer.term_positions(text)
+        return {word: len(word_positions) for word, word_positions in term_positions.items()}, term_positions
+
+class IndexSegment:
+    """In-memory postings for a batch of pages, merged into word_index in bulk.
+
+    Pages are buffered until the segment holds max_pages pages or its oldest page
+    is max_seconds old. A flush then writes all pages and merges every touched
+    term in a single transaction, so the number of statements depends on the
+    distinct terms of the segment rather than on pages x terms.
+
+    With positions=True, callers also pass term positions, which are stored in
+    word_positions for phrase and proximity queries.
+    """
+
+    def __init__(self, db_path: str = 'clea_db.db', max_pages: int = 50, max_seconds: float = 30.0,
+                 positions: bool = False):
+        self.db_path = db_path
+        self.max_pages = max_pages
+        self.max_seconds = max_seconds
+        self.positions = positions
+        # Buffered pages by URL; a page added again replaces its earlier version
+        self.pages: Dict[str, Tuple[str, str, str, Dict[str, int], Optional[str],
+                                    Optional[Dict[str, List[int]]], Optional[str]]] = {}
+        self.started = 0.0
+        # Pages written by successful flushes so far
+        self.written = 0
+
+    def add_page(self, url: str, title: str, snippet: str, word_freq: Dict[str, int],
+                 page_hash: Optional[str] = None, term_positions: Optional[Dict[str, List[int]]] = None,
+                 text: Optional[str] = None) -> None:
+        """Buffer an analyzed page, flushing the segment if a limit is reached.
+
+        text is the extracted page text, kept compressed for query-dependent snippets.
+        """
+        if not self.pages:
+            self.started = time.monotonic()
+        self.pages[url] = (url, title, snippet, word_freq, page_hash, term_positions, text)
+        if self.is_full():
+            self.flush()
+
+    def is_full(self) -> bool:
+        if len(self.pages) >= self.max_pages:
+            return True
+        return bool(self.pages) and time.monotonic() - self.started >= self.max_seconds
+
+    def flush(self) -> int:
+        """Write buffered pages and their postings. Returns the number of pages written."""
+        if not self.pages:
+            return 0
+        pages, self.pages = list(self.pages.values()), {}
+        with metrics.timed('index_write'):
+            written = self._write(pages)
+        self.written += written
+        return written
+
+    def _write(self, pages: List[Tuple]) -> int:
+        conn = get_connection(self.db_path)
+        # What a failed flush must undo if the shards have already committed
+        new_ids: List[int] = []
+        known_terms: Dict[int, Set[str]] = {}
+        shards_written = False
+        try:
+            cursor = conn.cursor()
+
+            # Upsert webpage rows and gather postings to add and remove per term
+            term_postings: Dict[str, List[Tuple[int, int]]] = {}
+            removed: Dict[str, Set[int]] = {}
+            doc_delta = 0
+            length_delta = 0
+            page_lengths: Dict[int, int] = {}
+            for url, title, snippet, word_freq, page_hash, term_positions, text in pages:
+                # Keep the collection statistics in step with the webpage rows
+                length = sum(word_freq.values())
+                cursor.execute('SELECT length FROM webpages WHERE url = ?', (url,))
+                previous = cursor.fetchone()
+                if previous is None:
+                    doc_delta += 1
+                    length_delta += length
+                else:
+                    length_delta += length - (previous[0] or 0)
+
+                webpage_id = upsert_webpage(cursor, url, title, snippet, page_hash, length)
+                page_lengths[webpage_id] = length
+
+                # Terms that vanished from a re-indexed page lose their posting for it
+                cursor.execute('SELECT terms FROM page_terms WHERE webpage_id = ?', (webpage_id,))
+                row = cursor.fetchone()
+                previous_terms = decode_terms(row[0] if row else None)
+                for word in previous_terms - word_freq.keys():
+                    removed.setdefault(word, set()).add(webpage_id)
+                if previous is None:
+                    new_ids.append(webpage_id)
+                else:
+                    known_terms[webpage_id] = previous_terms | word_freq.keys()
+
+                for word, freq in word_freq.items():
+                    term_postings.setdefault(word, []).append((webpage_id, freq))
+
+                cursor.execute('''
+                INSERT OR REPLACE INTO page_terms (webpage_id, terms)
+                VALUES (?, ?)
+                ''', (webpage_id, encode_terms(word_freq)))
+
+                if text:
+                    cursor.execute('INSERT OR REPLACE INTO page_text (webpage_id, text) VALUES (?, ?)',
+                                   (webpage_id, zlib.compress(text.encode('utf-8'))))
+                else:
+                    cursor.execute('DELETE FROM page_text WHERE webpage_id = ?', (webpage_id,))
+
+                # Positions of a previous version of the page are stale either way
+                cursor.execute('DELETE FROM word_positions WHERE webpage_id = ?', (webpage_id,))
+                if term_positions:
+                    cursor.executemany('''
+                    INSERT INTO word_positions (webpage_id, word, positions)
+                    VALUES (?, ?, ?)
+                    ''', [(webpage_id, word, encode_positions(word_positions))
+                          for word, word_positions in term_positions.items()])
+
+                cursor.execute('''
+                UPDATE crawled_urls SET indexed = TRUE WHERE url = ?
+                ''', (url,))
+
+            # Merge terms in sorted order so word_index is written sequentially
+            words = sorted(term_postings.keys() | removed.keys())
+            shard_count = read_shard_count(cursor)
+            if shard_count:
+                shards_written = True
+                document_frequencies = write_term_changes(self.db_path, shard_count, words, term_postings,
+                                                          removed, page_lengths)
+            else:
+                document_frequencies = merge_term_changes(cursor, words, term_postings, removed, page_lengths)
+            update_collection_stats(cursor, doc_delta, length_delta)
+            generation = bump_generation(cursor)
+            update_vocabulary(cursor, document_frequencies, generation, (page[6] for page in pages if page[6]))
+
+            conn.commit()
+            print(f"Flushed {len(pages)} pages ({len(words)} terms) to the index")
+            return len(pages)
+
+        except Exception as e:
+            print(f"Error flushing index segment: {str(e)}")
+            conn.rollback()
+            if shards_written:
+                self._forget_failed_write(conn, new_ids, known_terms)
+            return 0
+
+        finally:
+            conn.close()
+
+    def _forget_failed_write(self, conn: sqlite3.Connection, new_ids: List[int],
+                             known_terms: Dict[int, Set[str]]) -> None:
+        # Shards commit before the main database, so a failed flush may have left postings
+        # in some of them. The ids of its new pages are tombstoned and never handed out
+        # again, so compaction drops their postings. Re-indexed pages keep every term they
+        # may have postings for in page_terms and are queued for indexing again, which
+        # removes the stale ones.
+        try:
+            cursor = conn.cursor()
+            if new_ids:
+                cursor.executemany('INSERT OR IGNORE INTO deleted_webpages (webpage_id) VALUES (?)',
+                                   [(webpage_id,) for webpage_id in new_ids])
+                cursor.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'webpages'",
+                               (max(new_ids),))
+                if cursor.rowcount == 0:
+                    cursor.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('webpages', ?)",
+                                   (max(new_ids),))
+            for webpage_id, terms in known_terms.items():
+                cursor.execute('INSERT OR REPLACE INTO page_terms (webpage_id, terms) VALUES (?, ?)',
+                               (webpage_id, encode_terms(terms)))
+                cursor.execute('''
+                UPDATE crawled_urls SET indexed = FALSE
+                WHERE url = (SELECT url FROM webpages WHERE id = ?)
+                ''', (webpage_id,))
+            bump_generation(cursor)
+            conn.commit()
+        except Exception as e:
+            print(f"Error recovering from failed index flush: {str(e)}")
+            conn.rollback()
+
+def indexed_content_hash(url: str, db_path: str = 'clea_db.db') -> Optional[str]:
+    """Get the content hash a page was last indexed from, if it is indexed."""
+    conn = get_connection(db_path)
     try:
-        cursor.execute('SELECT webpage_ids, webpage_frequencies FROM word_index WHERE word = ?', (word,))
+        cursor = conn.cursor()
+        cursor.execute('SELECT content_hash FROM webpages WHERE url = ?', (url,))
         row = cursor.fetchone()
+        return row[0] if row else None
+    finally:
+        conn.close()
 
-        if row:
-            # Update existing entry
-            webpage_ids = json.loads(row[0])
-            frequencies = json.loads(row[1])
-            
-            if str(webpage_id) not in webpage_ids:
-                webpage_ids.append(str(webpage_id))
-            frequencies[str(webpage_id)] = frequency
+def mark_indexed(url: str, db_path: str = 'clea_db.db') -> None:
+    """Mark a URL as indexed in the crawled_urls table."""
+    conn = get_connection(db_path)
+    try:
+        cursor = conn.cursor()
+        cursor.execute('''
+        UPDATE crawled_urls SET indexed = TRUE WHERE url = ?
+        ''', (url,))
+        conn.commit()
+    finally:
+        conn.close()
 
-            cursor.execute('''
-            UPDATE word_index 
-            SET webpage_ids = ?, webpage_frequencies = ?
-            WHERE word = ?
-            ''', (json.dumps(webpage_ids), json.dumps(frequencies), word))
-        else:
-            # Create new entry
-            webpage_ids = [str(webpage_id)]
-            frequencies = {str(webpage_id): frequency}
+def index_webpage(url: str, db_path: str = 'clea_db.db', segment: Optional[IndexSegment] = None,
+                  positions: bool = False) -> str:
+    """Index a webpage: extract information, process text, and store in database.
 
-            cursor.execute('''
-            INSERT INTO word_index (word, webpage_ids, webpage_frequencies)
-            VALUES (?, ?, ?)
-            ''', (word, json.dumps(webpage_ids), json.dumps(frequencies)))
+    Pages whose HTML hashes to the same value as when they were last indexed are
+    only marked as indexed. When a segment is given the page is buffered there and
+    written on its next flush, with positions if the segment stores them.
 
+    Returns 'indexed', 'unchanged', 'empty' for pages without indexable text, or
+    'error' if the page couldn't be fetched, parsed or (without a segment) written.
+    """
+    try:
+        html = fetch_html(url, db_path)
+        page_hash = content_hash(html)
+        if indexed_content_hash(url, db_path) == page_hash:
+            mark_indexed(url, db_path)
+            print(f"Unchanged since last index: {url}")
+            return 'unchanged'
+        title, snippet, full_text = parse_page_html(html)
     except Exception as e:
-        print(f"Error updating word index for {word}: {str(e)}")
-        raise
+        print(f"Error processing {url}: {str(e)}")
+        if is_gone(e):
+            delete_webpage(url, db_path)
+        return 'error'
 
-def index_webpage(url: str, db_path: str = 'clea_db.db') -> None:
-    """Index a webpage: extract information, process text, and store in database."""
-    title, snippet, full_text = extract_page_info(url)
     if not full_text:
-        return
+        return 'empty'
+
+    own_segment = segment is None
+    if own_segment:
+        # A one-page segment writes the page right away
+        segment = IndexSegment(db_path, max_pages=1, positions=positions)
 
-    words = tokenize_and_stem(full_text)
-    word_freq = {}
-    for word in words:
-        word_freq[word] = word_freq.get(word, 0) + 1
+    word_freq, term_positions = tokenize_page(full_text, segment.positions)
+    if not word_freq:
+        return 'empty'
+    segment.add_page(url, title, snippet, word_freq, page_hash, term_positions, full_text)
+    if own_segment and not segment.written:
+        return 'error'
+    return 'indexed'
 
-    conn = sqlite3.connect(db_path)
+def delete_webpage(url: str, db_path: str = 'clea_db.db') -> bool:
+    """Remove a page from the index, e.g. after it started returning 404.
+
+    The page id is tombstoned so searches skip it right away; its postings are
+    dropped by the next compaction (see compaction.py).
+    """
+    conn = get_connection(db_path)
     try:
         cursor = conn.cursor()
-        
-        # Insert webpage info
-        cursor.execute('''
-        INSERT OR REPLACE INTO webpages (url, title, snippet)
-        VALUES (?, ?, ?)
-        ''', (url, title, snippet))
-        
-        webpage_id = cursor.lastrowid
-        
-        # Update word index entries
-        for word, freq in word_freq.items():
-            update_word_index(word, webpage_id, freq, conn)
-        
-        # Mark URL as indexed in crawled_urls table
+        cursor.execute('SELECT id, length FROM webpages WHERE url = ?', (url,))
+        row = cursor.fetchone()
+        if row:
+            cursor.execute('INSERT OR IGNORE INTO deleted_webpages (webpage_id) VALUES (?)', (row[0],))
+            cursor.execute('DELETE FROM webpages WHERE id = ?', (row[0],))
+            cursor.execute('DELETE FROM word_positions WHERE webpage_id = ?', (row[0],))
+            cursor.execute('DELETE FROM page_text WHERE webpage_id = ?', (row[0],))
+            update_collection_stats(cursor, -1, -(row[1] or 0))
+            bump_generation(cursor)
+
+        # Nothing left to index for this URL
         cursor.execute('''
         UPDATE crawled_urls SET indexed = TRUE WHERE url = ?
         ''', (url,))
-        
+
         conn.commit()
-        print(f"Indexed: {url}")
-        
+        if row:
+            print(f"Removed from index: {url}")
+        return row is not None
+
     except Exception as e:
-        print(f"Error indexing {url}: {str(e)}")
+        print(f"Error removing {url} from index: {str(e)}")
         conn.rollback()
-    
+        return False
     finally:
         conn.close()
 
+def is_gone(error: Exception) -> bool:
+    """Check whether a fetch error means the page no longer exists."""
+    response = getattr(error, 'response', None)
+    return response is not None and response.status_code in (404, 410)
+
 def get_unindexed_urls(db_path: str = 'clea_db.db') -> List[str]:
     """Get URLs from the database that haven't been indexed yet."""
-    conn = sqlite3.connect(db_path)
+    conn = get_connection(db_path)
     try:
         cursor = conn.cursor()
         cursor.execute('''
@@ -215,7 +472,181 @@ def get_unindexed_urls(db_path: str = 'clea_db.db') -> List[str]:
     finally:
         conn.close()
 
-def batch_index_urls(urls: List[str], max_pages: int = 100, min_delay: float = 0.5, max_delay: float = 2.0, db_path: str = 'clea_db.db') -> int:
+def iter_unindexed_urls(db_path: str = 'clea_db.db', batch_size: int = 500) -> Iterator[str]:
+    """Yield URLs that haven't been indexed yet, reading them in batches of batch_size.
+
+    Each batch is read on a connection that is closed before any URL is yielded, so
+    the generator may be advanced from several threads (under a lock) and abandoned
+    at any point without holding a connection.
+    """
+    last_id = 0
+    while True:
+        conn = get_connection(db_path)
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+            SELECT id, url FROM crawled_urls
+            WHERE indexed = FALSE AND id > ?
+            ORDER BY id
+            LIMIT ?
+            ''', (last_id, batch_size))
+            rows = cursor.fetchall()
+        finally:
+            conn.close()
+        if not rows:
+            return
+        last_id = rows[-1][0]
+        for _, url in rows:
+            yield url
+
+def analyze_html(url: str, html: str, page_hash: str, positions: bool = False
+                 ) -> Tuple[str, str, str, Dict[str, int], str, Optional[Dict[str, List[int]]], str]:
+    """Parse a page and count its terms, with their positions if asked. Runs in the indexing worker processes."""
+    title, snippet, full_text = parse_page_html(html)
+    word_freq, term_positions = tokenize_page(full_text, positions)
+    return url, title, snippet, word_freq, page_hash, term_positions, full_text
+
+def _analyze_in_worker(url: str, html: str, page_hash: str, positions: bool = False) -> Tuple[Tuple, Dict]:
+    # Stage timings of a worker process are sent back with the result
+    return analyze_html(url, html, page_hash, positions), metrics.export()
+
+_FETCH_DONE = None
+
+def _fetch_stage(urls: Iterator[str], urls_lock: threading.Lock, fetched: queue.Queue,
+                 min_delay: float, max_delay: float, db_path: str,
+                 on_status: Optional[Callable[[str, str], None]] = None,
+                 cancel: Optional[threading.Event] = None, stop: Optional[threading.Event] = None) -> None:
+    # pull URLs until the shared iterator is exhausted or cancel (the caller's) or stop
+    # (the pipeline's own) is set, pushing (url, html) downstream
+    events = [event for event in (cancel, stop) if event is not None]
+    try:
+        while not any(event.is_set() for event in events):
+            with urls_lock:
+                url = next(urls, None)
+            if url is None:
+                return
+            if not url.strip():
+                continue
+
+            needs_fetch = not is_page_fresh(url, db_path=db_path)
+            try:
+                html = fetch_html(url, db_path)
+                page_hash = content_hash(html)
+                if indexed_content_hash(url, db_path) == page_hash:
+                    mark_indexed(url, db_path)
+                    print(f"Unchanged since last index: {url}")
+                    if on_status:
+                        on_status(url, 'unchanged')
+                else:
+                    fetched.put((url, html, page_hash))
+            except Exception as e:
+                print(f"Error fetching {url}: {str(e)}")
+                if is_gone(e):
+                    delete_webpage(url, db_path)
+                if on_status:
+                    on_status(url, 'error')
+
+            if needs_fetch:
+                delay = random.uniform(min_delay, max_delay)
+                if events:
+                    events[-1].wait(delay)
+                else:
+                    time.sleep(delay)
+    finally:
+        fetched.put(_FETCH_DONE)
+
+def pipeline_index_urls(urls: Iterable[str], max_pages: int = 100, min_delay: float = 0.5, max_delay: float = 2.0,
+                        db_path: str = 'clea_db.db', workers: Optional[int] = None, fetch_threads: int = 1,
+                        queue_size: int = 32, segment_pages: int = 50, segment_seconds: float = 30.0,
+                        positions: bool = False, on_status: Optional[Callable[[str, str], None]] = None,
+                        cancel: Optional[threading.Event] = None) -> int:
+    """Index URLs with a fetch -> parse/stem -> write pipeline.
+
+    Fetch threads read pages from the content store or the network, a process pool
+    does the HTML extraction and stemming, and the calling thread is the only
+    writer, committing through an IndexSegment. Fetched pages wait in a queue of
+    at most queue_size entries and at most 2 x workers pages are being analyzed,
+    so memory stays flat however long the URL iterator is.
+
+    on_status is called (from any stage) with (url, 'indexed' | 'unchanged' | 'empty' |
+    'error') for every URL handled. Once cancel is set no new URLs are fetched; pages already
+    fetched are still indexed. If the worker pool fails, the fetch threads are stopped,
+    the pages analyzed so far are written and the error is raised.
+
+    Returns:
+        Number of pages written to the index by successful segment flushes
+    """
+    workers = workers or os.cpu_count() or 1
+    urls_iter = itertools.islice(iter(urls), max_pages)
+    urls_lock = threading.Lock()
+    fetched: queue.Queue = queue.Queue(maxsize=queue_size)
+    segment = IndexSegment(db_path, segment_pages, segment_seconds, positions)
+    stop = threading.Event()
+
+    fetchers = [
+        threading.Thread(target=_fetch_stage, daemon=True,
+                         args=(urls_iter, urls_lock, fetched, min_delay, max_delay, db_path, on_status, cancel,
+                               stop))
+        for _ in range(max(1, fetch_threads))
+    ]
+    for fetcher in fetchers:
+        fetcher.start()
+
+    submitted: Dict = {}
+
+    def write(done) -> None:
+        for future in done:
+            submitted_url = submitted.pop(future)
+            try:
+                analyzed, timings = future.result()
+                metrics.merge(timings)
+                url, title, snippet, word_freq, page_hash, term_positions, text = analyzed
+            except Exception as e:
+                print(f"Error analyzing page: {str(e)}")
+                if on_status:
+                    on_status(submitted_url, 'error')
+                continue
+            if word_freq:
+                segment.add_page(url, title, snippet, word_freq, page_hash, term_positions, text)
+                print(f"Indexed: {url}")
+            if on_status:
+                on_status(url, 'indexed' if word_freq else 'empty')
+
+    print(f"Starting pipelined indexing (max: {max_pages}) with {workers} workers...")
+    running_fetchers = len(fetchers)
+    pending = set()
+    try:
+        # Forked workers start with a copy of this process's histograms, which they must not send back
+        with ProcessPoolExecutor(max_workers=workers, initializer=metrics.reset) as pool:
+            try:
+                while running_fetchers:
+                    item = fetched.get()
+                    if item is _FETCH_DONE:
+                        running_fetchers -= 1
+                        continue
+                    if len(pending) >= 2 * workers:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        write(done)
+                    future = pool.submit(_analyze_in_worker, *item, positions)
+                    submitted[future] = item[0]
+                    pending.add(future)
+            finally:
+                write(wait(pending).done)
+    finally:
+        # After an error the fetchers are stopped; draining the queue unblocks any waiting
+        # on it. Their pages stay unindexed for the next run.
+        stop.set()
+        while running_fetchers:
+            if fetched.get() is _FETCH_DONE:
+                running_fetchers -= 1
+        segment.flush()
+    print(f"\nPipelined indexing completed. Successfully indexed {segment.written} pages.")
+    return segment.written
+
+def batch_index_urls(urls: List[str], max_pages: int = 100, min_delay: float = 0.5, max_delay: float = 2.0, db_path: str = 'clea_db.db',
+                     segment_pages: int = 50, segment_seconds: float = 30.0, workers: int = 0,
+                     positions: bool = False, on_status: Optional[Callable[[str, str], None]] = None,
+                     cancel: Optional[threading.Event] = None) -> int:
     """Index multiple URLs in batch with a delay between requests.
     
     Args:
@@ -224,30 +655,61 @@ def batch_index_urls(urls: List[str], max_pages: int = 100, min_delay: float = 0
         min_delay: Minimum delay between indexing requests
         max_delay: Maximum delay between indexing requests
         db_path: Path to database
+        segment_pages: Pages buffered in memory before a bulk index flush (0 writes each page on its own)
+        segment_seconds: Maximum age of a buffered page before the segment is flushed
+        workers: Parse/stem worker processes; above 0 the URLs go through pipeline_index_urls
+        positions: Also store term positions, for phrase and proximity queries
+        on_status: Called with (url, 'indexed' | 'unchanged' | 'empty' | 'error') for every URL handled
+        cancel: Event that stops the batch before the next URL once set
         
     Returns:
-        Number of successfully indexed pages
+        Number of pages written to the index; unchanged and empty pages aren't counted
     """
     if not urls:
         print("No URLs to index.")
         return 0
     
+    if workers > 0:
+        return pipeline_index_urls(urls, max_pages, min_delay, max_delay, db_path, workers=workers,
+                                   segment_pages=segment_pages or 1, segment_seconds=segment_seconds,
+                                   positions=positions, on_status=on_status, cancel=cancel)
+    
     print(f"Starting batch indexing of {len(urls)} URLs (max: {max_pages})...")
     indexed_count = 0
+    segment = IndexSegment(db_path, segment_pages, segment_seconds, positions) if segment_pages > 0 else None
     
     for url in urls[:max_pages]:
+        if cancel is not None and cancel.is_set():
+            print("Batch indexing cancelled.")
+            break
         if url.strip():
             print(f"Indexing URL: {url}")
+            # Pages already in the content store don't touch the network
+            needs_fetch = not is_page_fresh(url, db_path=db_path)
             try:
-                index_webpage(url, db_path)
-                indexed_count += 1
+                status = index_webpage(url, db_path, segment, positions)
             except Exception as e:
                 print(f"Error during batch indexing of {url}: {str(e)}")
+                status = 'error'
+            if segment is None and status == 'indexed':
+                indexed_count += 1
+            if on_status:
+                on_status(url, status)
+            
+            if not needs_fetch:
+                continue
             
             # Add delay between requests
             delay = random.uniform(min_delay, max_delay)
             print(f"Waiting {delay:.2f} seconds...")
-            time.sleep(delay)
+            if cancel is not None:
+                cancel.wait(delay)
+            else:
+                time.sleep(delay)
+    
+    if segment is not None:
+        segment.flush()
+        indexed_count = segment.written
     
     print(f"\nBatch indexing completed. Successfully indexed {indexed_count} pages.")
     return indexed_count
@@ -1,28 +1,40 @@
 # Backend Server - Search API that handles search queries and returns results
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
-from servir import search_pages
-from classeur import get_unindexed_urls, batch_index_urls
-from glaneur import (
-    add_urls_to_sitemap, 
-    get_sitemap_urls, 
-    remove_url_from_sitemap,
-    crawl_from_sitemap
-)
-import sqlite3
-import re
-import math
+from servir import search, enable_memory_index, cache_stats
+from souffleur import suggest
+from calcul import is_math_query, solve_math_query
+import compaction
+import jobs
+import metrics
+from db import get_connection
+import itertools
+import os
+
+# The crawler and indexer (glaneur, classeur) pull in requests, BeautifulSoup and
+# the robots.txt parser, which searches never use. They are imported by the
+# endpoints that need them, so a search-only server starts without them.
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
 
 @app.route('/api/search')
 def api_search():
-    """API endpoint for searching pages."""
+    """API endpoint for searching pages.
+
+    Pages of results are selected with offset and limit (max_results is accepted as
+    the limit), or with the next_cursor of the previous page.
+    """
     query = request.args.get('q', '')
-    max_results = int(request.args.get('max_results', '10'))
+    # e.g. fields=url,title to skip snippets and scores
+    fields = request.args.get('fields')
+    fields = [field.strip() for field in fields.split(',') if field.strip()] if fields else None
     
     try:
+        limit = int(request.args.get('limit', request.args.get('max_results', '10')))
+        offset = int(request.args.get('offset', '0'))
+        cursor = request.args.get('cursor')
+
         # Check if the query is a math expression
         if is_math_query(query):
             math_result = solve_math_query(query)
@@ -36,17 +48,44 @@ def api_search():
                 })
         
         # If not a math query or calculation failed, perform regular search
-        results = search_pages(query, max_results=max_results) if query else []
-        return jsonify({
-            'query': query,
-            'results': results,
-            'total': len(results)
-        })
+        if not query:
+            return jsonify({'query': query, 'results': [], 'total': 0})
+        page = search(query, offset=offset, limit=limit, cursor=cursor, fields=fields)
+        return jsonify({'query': query, **page})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({
             'error': str(e)
         }), 500
 
+@app.route('/api/search/cache')
+def search_cache_stats():
+    """Hit, miss and eviction statistics of the search caches."""
+    return jsonify(cache_stats())
+
+@app.route('/api/suggest')
+def api_suggest():
+    """Completions of the last word of a partial query, most frequent words first."""
+    query = request.args.get('q', '')
+    try:
+        limit = int(request.args.get('limit', '8'))
+        return jsonify({
+            'query': query,
+            'suggestions': suggest(query, limit=limit)
+        })
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/metrics')
+def api_metrics():
+    """Stage timings, counters and cache statistics in the Prometheus text format."""
+    if not metrics.ENABLED:
+        return jsonify({'error': 'Metrics are disabled (CLEA_METRICS=0)'}), 404
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/api/health')
 def health_check():
     return jsonify({'status': 'ok'})
@@ -54,6 +93,7 @@ def health_check():
 @app.route('/api/sitemap', methods=['GET'])
 def get_sitemap():
     """Get all URLs in sitemap with their status."""
+    from glaneur import get_sitemap_urls
     try:
         status_filter = request.args.get('status')
         urls = get_sitemap_urls(status=status_filter)
@@ -67,6 +107,7 @@ def get_sitemap():
 @app.route('/api/sitemap', methods=['POST'])
 def add_to_sitemap():
     """Add URL(s) to sitemap."""
+    from glaneur import add_urls_to_sitemap
     try:
         data = request.get_json()
         
@@ -95,6 +136,7 @@ def add_to_sitemap():
 @app.route('/api/sitemap/<path:url>', methods=['DELETE'])
 def remove_from_sitemap(url):
     """Remove URL from sitemap."""
+    from glaneur import remove_url_from_sitemap
     try:
         success = remove_url_from_sitemap(url)
         if success:
@@ -104,203 +146,174 @@ def remove_from_sitemap(url):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def crawl_params(data):
+    """Crawl options of a request body, with the API defaults."""
+    return {
+        'min_delay': float(data.get('min_delay', 1.0)),
+        'max_delay': float(data.get('max_delay', 3.0)),
+        'concurrency': int(data.get('concurrency', 8)),
+        'per_host_limit': int(data.get('per_host_limit', 1))
+    }
+
+def job_accepted(job, message):
+    """202 response pointing at the status of a queued job."""
+    return jsonify({
+        'message': message,
+        'job_id': job.id,
+        'status_url': f'/api/jobs/{job.id}',
+        'job': job.to_dict()
+    }), 202
+
 @app.route('/api/crawl/force', methods=['POST'])
 def force_crawl():
-    """Force crawl all URLs in sitemap."""
+    """Start a crawl of all URLs in sitemap in the background; only one runs at a time."""
+    from glaneur import get_sitemap_urls, crawl_from_sitemap
     try:
-        data = request.get_json() or {}
-        min_delay = float(data.get('min_delay', 1.0))
-        max_delay = float(data.get('max_delay', 3.0))
-        
-        found_links = crawl_from_sitemap(
-            force_crawl=True,
-            min_delay=min_delay,
-            max_delay=max_delay
-        )
-        
-        return jsonify({
-            'message': 'Force crawl completed',
-            'links_found': len(found_links),
-            'crawl_type': 'force'
-        })
+        data = request.get_json(silent=True) or {}
+        params = crawl_params(data)
+
+        def run(job):
+            job.set_total(len(get_sitemap_urls()))
+            found_links = crawl_from_sitemap(force_crawl=True, on_status=job.report, cancel=job.cancel, **params)
+            return {'links_found': len(found_links), 'crawl_type': 'force'}
+
+        job = jobs.runner.submit('crawl_force', run, params, exclusive=True)
+        if job is None:
+            return jsonify({'error': 'A force crawl is already running'}), 409
+        return job_accepted(job, 'Force crawl started')
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/crawl/new', methods=['POST'])
 def crawl_new():
-    """Crawl only pending URLs in sitemap."""
+    """Start a crawl of the pending URLs in sitemap in the background."""
+    from glaneur import get_sitemap_urls, crawl_from_sitemap
     try:
-        data = request.get_json() or {}
-        min_delay = float(data.get('min_delay', 1.0))
-        max_delay = float(data.get('max_delay', 3.0))
-        
-        found_links = crawl_from_sitemap(
-            force_crawl=False,
-            min_delay=min_delay,
-            max_delay=max_delay
-        )
-        
-        return jsonify({
-            'message': 'New URL crawl completed',
-            'links_found': len(found_links),
-            'crawl_type': 'new_only'
-        })
+        data = request.get_json(silent=True) or {}
+        params = crawl_params(data)
+
+        def run(job):
+            job.set_total(len(get_sitemap_urls(status='pending')))
+            found_links = crawl_from_sitemap(force_crawl=False, on_status=job.report, cancel=job.cancel, **params)
+            return {'links_found': len(found_links), 'crawl_type': 'new_only'}
+
+        return job_accepted(jobs.runner.submit('crawl_new', run, params), 'New URL crawl started')
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/index/force', methods=['POST'])
 def force_index():
-    """Force index all URLs in the crawled_urls table regardless of previous indexing status."""
+    """Start indexing all URLs in the crawled_urls table regardless of previous indexing status."""
+    from classeur import batch_index_urls
     try:
-        data = request.get_json() or {}
-        max_pages = int(data.get('max_pages', 10))
-        min_delay = float(data.get('min_delay', 0.5))
-        max_delay = float(data.get('max_delay', 2.0))
-        
-        # Get all URLs from the crawled_urls table
-        conn = sqlite3.connect('clea_db.db')
-        cursor = conn.cursor()
-        cursor.execute('SELECT url FROM crawled_urls')
-        all_urls = [row[0] for row in cursor.fetchall()]
-        conn.close()
-        
-        indexed_count = batch_index_urls(
-            urls=all_urls,
-            max_pages=max_pages,
-            min_delay=min_delay,
-            max_delay=max_delay
-        )
-        
-        return jsonify({
-            'message': 'Force indexing completed',
-            'indexed_count': indexed_count,
-            'index_type': 'force'
-        })
+        data = request.get_json(silent=True) or {}
+        params = {
+            'max_pages': int(data.get('max_pages', 10)),
+            'min_delay': float(data.get('min_delay', 0.5)),
+            'max_delay': float(data.get('max_delay', 2.0)),
+            'workers': int(data.get('workers', 0)),
+            'positions': bool(data.get('positions', False))
+        }
+
+        def run(job):
+            # Get all URLs from the crawled_urls table
+            conn = get_connection('clea_db.db')
+            try:
+                cursor = conn.cursor()
+                cursor.execute('SELECT url FROM crawled_urls')
+                all_urls = [row[0] for row in cursor.fetchall()]
+            finally:
+                conn.close()
+
+            job.set_total(min(len(all_urls), params['max_pages']))
+            indexed_count = batch_index_urls(urls=all_urls, on_status=job.report, cancel=job.cancel, **params)
+            return {'indexed_count': indexed_count, 'unchanged_count': job.statuses.get('unchanged', 0),
+                    'index_type': 'force'}
+
+        return job_accepted(jobs.runner.submit('index_force', run, params), 'Force indexing started')
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/index/new', methods=['POST'])
 def index_new():
-    """Index only URLs that have been crawled but not yet indexed."""
+    """Start indexing only URLs that have been crawled but not yet indexed."""
+    from classeur import iter_unindexed_urls, batch_index_urls, pipeline_index_urls
     try:
-        data = request.get_json() or {}
-        max_pages = int(data.get('max_pages', 10))
-        min_delay = float(data.get('min_delay', 0.5))
-        max_delay = float(data.get('max_delay', 2.0))
-        
-        # Get unindexed URLs using classeur's function
-        unindexed_urls = get_unindexed_urls()
-        
-        indexed_count = batch_index_urls(
-            urls=unindexed_urls,
-            max_pages=max_pages,
-            min_delay=min_delay,
-            max_delay=max_delay
-        )
-        
-        return jsonify({
-            'message': 'New URL indexing completed',
-            'indexed_count': indexed_count,
-            'index_type': 'new_only'
-        })
+        data = request.get_json(silent=True) or {}
+        params = {
+            'max_pages': int(data.get('max_pages', 10)),
+            'min_delay': float(data.get('min_delay', 0.5)),
+            'max_delay': float(data.get('max_delay', 2.0)),
+            'workers': int(data.get('workers', 0)),
+            'positions': bool(data.get('positions', False))
+        }
+
+        def run(job):
+            conn = get_connection('clea_db.db')
+            try:
+                cursor = conn.cursor()
+                cursor.execute('SELECT COUNT(*) FROM crawled_urls WHERE indexed = FALSE')
+                job.set_total(min(cursor.fetchone()[0], params['max_pages']))
+            finally:
+                conn.close()
+
+            # Stream unindexed URLs from the database instead of loading them all
+            unindexed_urls = iter_unindexed_urls()
+            options = dict(params, on_status=job.report, cancel=job.cancel)
+            if params['workers'] > 0:
+                indexed_count = pipeline_index_urls(unindexed_urls, **options)
+            else:
+                indexed_count = batch_index_urls(urls=list(itertools.islice(unindexed_urls, params['max_pages'])),
+                                                 **options)
+            return {'indexed_count': indexed_count, 'unchanged_count': job.statuses.get('unchanged', 0),
+                    'index_type': 'new_only'}
+
+        return job_accepted(jobs.runner.submit('index_new', run, params), 'New URL indexing started')
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-def is_math_query(query):
-    """
-    Check if the query is a mathematical expression.
-    This function looks for patterns that indicate a math problem:
-    - Contains numbers and operators
-    - No excess text that would suggest it's not a calculation
-    """
-    # Remove whitespace and convert to lowercase
-    cleaned_query = query.strip().lower()
-    
-    # Basic pattern matching for math expressions
-    # Looks for: numbers, operators, parentheses, common math functions
-    math_pattern = r'^[\s0-9+\-*/().,%^√πe\s]+$'
-    
-    # Check for specific math keywords
-    math_keywords = ['sqrt', 'sin', 'cos', 'tan', 'log', 'ln']
-    has_math_keyword = any(keyword in cleaned_query for keyword in math_keywords)
-    
-    # Check if query matches the pattern or contains math keywords
-    is_math_expression = bool(re.match(math_pattern, cleaned_query)) or has_math_keyword
-    
-    # Ensure it contains at least one number and one operator
-    has_number = bool(re.search(r'\d', cleaned_query))
-    has_operator = bool(re.search(r'[+\-*/^]', cleaned_query))
-    
-    return is_math_expression and (has_number and (has_operator or has_math_keyword))
+@app.route('/api/jobs')
+def list_jobs():
+    """Status of recent background jobs, newest first."""
+    return jsonify({'jobs': [job.to_dict() for job in jobs.runner.list()]})
 
-def safe_eval(expr):
-    """
-    Safely evaluate a mathematical expression.
-    Uses a whitelist approach to only allow specific math operations.
-    """
-    # Replace common math notations with Python equivalents
-    expr = expr.replace('^', '**')  # Convert caret to Python power operator
-    expr = expr.replace('√', 'math.sqrt')  # Convert root symbol
-    expr = expr.replace('π', 'math.pi')  # Convert pi symbol
-    expr = expr.replace('pi', 'math.pi')  # Convert pi text
-    
-    # Replace common math functions
-    expr = re.sub(r'sqrt\(', 'math.sqrt(', expr)
-    expr = re.sub(r'sin\(', 'math.sin(', expr)
-    expr = re.sub(r'cos\(', 'math.cos(', expr)
-    expr = re.sub(r'tan\(', 'math.tan(', expr)
-    expr = re.sub(r'log\(', 'math.log10(', expr)
-    expr = re.sub(r'ln\(', 'math.log(', expr)
-    
-    # Create a safe local scope with only math functions
-    safe_locals = {
-        'math': math,
-        'abs': abs,
-        'round': round,
-        'min': min,
-        'max': max
-    }
-    
-    try:
-        # Use eval in a limited scope
-        result = eval(expr, {'__builtins__': {}}, safe_locals)
-        return result
-    except Exception as e:
-        # If evaluation fails, return None
-        return None
+@app.route('/api/jobs/<job_id>')
+def job_status(job_id):
+    """Progress of a background job: pages done, errors, throughput and ETA."""
+    job = jobs.runner.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict())
 
-def solve_math_query(query):
-    """
-    Solve a mathematical query and format the result.
-    """
-    # Clean the query
-    query = query.strip()
-    
+@app.route('/api/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    """Ask a background job to stop after the pages in flight."""
+    if not jobs.runner.cancel(job_id):
+        return jsonify({'error': 'Job not found or already finished'}), 404
+    return jsonify({'message': 'Cancellation requested', 'job': jobs.runner.get(job_id).to_dict()}), 202
+
+@app.route('/api/index/compact', methods=['POST'])
+def compact_index():
+    """Start compacting the index in the background."""
     try:
-        # Evaluate the expression
-        result = safe_eval(query)
+        data = request.get_json(silent=True) or {}
+        started = compaction.start_compaction(vacuum=bool(data.get('vacuum', False)))
+        if not started:
+            return jsonify({'error': 'Compaction already running'}), 409
         
-        if result is not None:
-            # Format the result
-            if isinstance(result, int) or result.is_integer():
-                formatted_result = str(int(result))
-            else:
-                # Round to a reasonable number of decimal places for display
-                formatted_result = str(round(result, 10)).rstrip('0').rstrip('.')
-            
-            return {
-                'type': 'calculation',
-                'expression': query,
-                'result': formatted_result
-            }
-    except Exception:
-        pass
-    
-    return None
+        return jsonify({'message': 'Compaction started'}), 202
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/index/compact', methods=['GET'])
+def compaction_status():
+    """Report of the last index compaction."""
+    return jsonify({'compaction': compaction.last_report})
 
 @app.route('/api/solve', methods=['POST'])
 def api_solve():
@@ -330,4 +343,7 @@ def api_solve():
         return jsonify({'error': str(e)}), 500
 
 if __name__ == '__main__':
+    # CLEA_MEMORY_INDEX=1 answers searches from an in-memory copy of the index
+    if os.environ.get('CLEA_MEMORY_INDEX') == '1':
+        enable_memory_index(poll_interval=float(os.environ.get('CLEA_MEMORY_INDEX_POLL', '5')))
     app.run(debug=True, host='0.0.0.0', port=6942)
@@ -0,0 +1,207 @@
+# Compaction - Rewrites posting lists without postings for dead webpage ids
+import sqlite3
+from db import get_connection
+import sys
+import threading
+from typing import Dict, List, Optional
+from postings import build_postings, decode_postings, encode_postings, bump_generation
+from souffleur import update_vocabulary
+from shards import read_shard_count, shard_path
+
+# Report of the most recent compaction, shown by /api/index/compact
+last_report: Optional[Dict] = None
+_compaction_lock = threading.Lock()
+
+def _used_bytes(cursor: sqlite3.Cursor) -> int:
+    # pages on the freelist are reusable, so they don't count as used space
+    cursor.execute('PRAGMA page_size')
+    page_size = cursor.fetchone()[0]
+    cursor.execute('PRAGMA page_count')
+    page_count = cursor.fetchone()[0]
+    cursor.execute('PRAGMA freelist_count')
+    return (page_count - cursor.fetchone()[0]) * page_size
+
+def _compact_terms(conn: sqlite3.Connection, index_conn: sqlite3.Connection, alive: bytearray, max_id: int,
+                   report: Dict, batch_size: int) -> None:
+    # index_conn holds word_index: conn itself, or a shard whose batches commit before
+    # their vocabulary changes are published in conn
+    cursor = conn.cursor()
+    index_cursor = index_conn.cursor()
+    last_word = ''
+    while True:
+        # Take the write lock before reading so a concurrent flush can't be overwritten
+        index_conn.execute('BEGIN IMMEDIATE')
+        index_cursor.execute('''
+        SELECT word, webpage_ids, webpage_frequencies
+        FROM word_index
+        WHERE word > ?
+        ORDER BY word
+        LIMIT ?
+        ''', (last_word, batch_size))
+        rows = index_cursor.fetchall()
+        if not rows:
+            index_conn.commit()
+            break
+        last_word = rows[-1][0]
+
+        updates = []
+        removals = []
+        document_frequencies = {}
+        for word, ids_blob, freqs_blob in rows:
+            webpage_ids, frequencies = decode_postings(ids_blob, freqs_blob)
+            size = len(ids_blob or b'') + len(freqs_blob or b'')
+            report['terms_scanned'] += 1
+            report['postings_before'] += len(webpage_ids)
+            report['posting_bytes_before'] += size
+
+            kept = [(webpage_id, frequency) for webpage_id, frequency in zip(webpage_ids, frequencies)
+                    if webpage_id > max_id or alive[webpage_id]]
+            if len(kept) == len(webpage_ids):
+                report['postings_after'] += len(webpage_ids)
+                report['posting_bytes_after'] += size
+            elif kept:
+                kept_ids, kept_freqs = build_postings(kept)
+                ids_blob, freqs_blob = encode_postings(kept_ids, kept_freqs)
+                updates.append((ids_blob, freqs_blob, max(kept_freqs), word))
+                document_frequencies[word] = len(kept)
+                report['terms_rewritten'] += 1
+                report['postings_after'] += len(kept)
+                report['posting_bytes_after'] += len(ids_blob) + len(freqs_blob)
+            else:
+                removals.append((word,))
+                document_frequencies[word] = 0
+                report['terms_removed'] += 1
+
+        index_cursor.executemany('''
+        UPDATE word_index
+        SET webpage_ids = ?, webpage_frequencies = ?, max_frequency = ?
+        WHERE word = ?
+        ''', updates)
+        index_cursor.executemany('DELETE FROM word_index WHERE word = ?', removals)
+        if index_conn is not conn:
+            index_conn.commit()
+        if updates or removals:
+            update_vocabulary(cursor, document_frequencies, bump_generation(cursor))
+        conn.commit()
+
+def _shard_bytes(paths: List[str]) -> int:
+    total = 0
+    for path in paths:
+        shard_conn = get_connection(path)
+        try:
+            total += _used_bytes(shard_conn.cursor())
+        finally:
+            shard_conn.close()
+    return total
+
+def compact_index(db_path: str = 'clea_db.db', batch_size: int = 500, vacuum: bool = False) -> Dict:
+    """Drop postings whose webpage id is tombstoned or no longer exists.
+
+    word_index, or each of its shards, is rewritten in batches of batch_size terms,
+    each in its own short transaction, so searches and indexing can keep running
+    alongside. Terms left without postings are deleted. Ids above the highest id
+    handed out at the start belong to pages indexed meanwhile and are always kept,
+    along with their tombstones.
+
+    Returns a report with the space reclaimed and the posting-length changes.
+    """
+    conn = get_connection(db_path)
+    try:
+        cursor = conn.cursor()
+        shard_count = read_shard_count(cursor)
+        shard_files = [shard_path(db_path, shard, shard_count) for shard in range(shard_count)]
+        used_before = _used_bytes(cursor) + _shard_bytes(shard_files)
+
+        # Live ids as a bitmap, so checking a posting is a single byte lookup. Sized by the
+        # highest id ever handed out, so postings of deleted top ids are dropped too.
+        cursor.execute('''
+        SELECT MAX(COALESCE((SELECT MAX(seq) FROM sqlite_sequence WHERE name = 'webpages'), 0),
+                   COALESCE((SELECT MAX(id) FROM webpages), 0))
+        ''')
+        max_id = cursor.fetchone()[0]
+        alive = bytearray(max_id + 1)
+        for (webpage_id,) in cursor.execute('SELECT id FROM webpages'):
+            alive[webpage_id] = 1
+        cursor.execute('SELECT webpage_id FROM deleted_webpages')
+        # Tombstones of pages indexed meanwhile stay until a later compaction reaches them
+        tombstones = [row[0] for row in cursor.fetchall() if row[0] <= max_id]
+        for webpage_id in tombstones:
+            alive[webpage_id] = 0
+
+        report = {
+            'terms_scanned': 0,
+            'terms_rewritten': 0,
+            'terms_removed': 0,
+            'postings_before': 0,
+            'postings_after': 0,
+            'posting_bytes_before': 0,
+            'posting_bytes_after': 0,
+            'tombstones_cleared': len(tombstones),
+        }
+
+        if shard_count:
+            for path in shard_files:
+                index_conn = get_connection(path)
+                try:
+                    _compact_terms(conn, index_conn, alive, max_id, report, batch_size)
+                finally:
+                    index_conn.close()
+        else:
+            _compact_terms(conn, conn, alive, max_id, report, batch_size)
+
+        # Forward-index rows, positions, texts and tombstones of dead pages are no longer needed
+        cursor.execute('DELETE FROM page_terms WHERE webpage_id NOT IN (SELECT id FROM webpages)')
+        cursor.execute('DELETE FROM word_positions WHERE webpage_id NOT IN (SELECT id FROM webpages)')
+        cursor.execute('DELETE FROM page_text WHERE webpage_id NOT IN (SELECT id FROM webpages)')
+        cursor.executemany('DELETE FROM deleted_webpages WHERE webpage_id = ?',
+                           [(webpage_id,) for webpage_id in tombstones])
+        bump_generation(cursor)
+        conn.commit()
+
+        if vacuum:
+            conn.execute('VACUUM')
+            for path in shard_files:
+                shard_conn = get_connection(path)
+                try:
+                    shard_conn.execute('VACUUM')
+                finally:
+                    shard_conn.close()
+
+        used_after = _used_bytes(cursor) + _shard_bytes(shard_files)
+        report['database_bytes_before'] = used_before
+        report['database_bytes_after'] = used_after
+        report['bytes_reclaimed'] = used_before - used_after
+        kept_terms = report['terms_scanned'] - report['terms_removed']
+        report['avg_posting_length_before'] = report['postings_before'] / max(report['terms_scanned'], 1)
+        report['avg_posting_length_after'] = report['postings_after'] / max(kept_terms, 1)
+        return report
+
+    except Exception as e:
+        print(f"Error compacting index: {str(e)}")
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+def start_compaction(db_path: str = 'clea_db.db', vacuum: bool = False) -> bool:
+    """Run compact_index in a background thread. Returns False if one is already running."""
+    if not _compaction_lock.acquire(blocking=False):
+        return False
+
+    def run() -> None:
+        global last_report
+        try:
+            last_report = {'status': 'running'}
+            last_report = {'status': 'completed', **compact_index(db_path, vacuum=vacuum)}
+        except Exception as e:
+            last_report = {'status': 'error', 'error': str(e)}
+        finally:
+            _compaction_lock.release()
+
+    threading.Thread(target=run, daemon=True).start()
+    return True
+
+if __name__ == '__main__':
+    result = compact_index(sys.argv[1] if len(sys.argv) > 1 else 'clea_db.db', vacuum=True)
+    for key, value in result.items():
+        print(f"{key}: {value}")
@@ -0,0 +1,80 @@
+# Database - Shared, pooled SQLite connections in WAL mode
+import sqlite3
+import threading
+from typing import Dict, List
+
+# Pragmas applied to every new connection. WAL lets searches read while the
+# indexer writes; NORMAL sync is safe in WAL mode and avoids an fsync per commit.
+PRAGMAS = (
+    ('synchronous', 'NORMAL'),
+    ('cache_size', -64 * 1024),  # in KiB when negative: 64 MiB of page cache
+    ('mmap_size', 256 * 1024 * 1024),
+    ('temp_store', 'MEMORY'),
+)
+
+# Seconds a writer waits for another writer's lock before giving up
+BUSY_TIMEOUT = 30.0
+
+# Prepared statements kept per connection; pooled connections keep them warm
+CACHED_STATEMENTS = 256
+
+# Idle connections kept per thread and database
+MAX_IDLE = 4
+
+_local = threading.local()
+
+class PooledConnection(sqlite3.Connection):
+    """sqlite3 connection whose close() hands it back to its thread's pool.
+
+    Any transaction the caller left open is rolled back first, so the next user
+    starts clean and a finished reader never pins an old WAL snapshot. The usual
+    connect / try / finally close pattern keeps working unchanged.
+    """
+
+    def close(self) -> None:
+        # Only the owning thread may use the connection, e.g. not a generator's finalizer
+        if threading.get_ident() != self.owner:
+            return
+        if self.in_transaction:
+            self.rollback()
+        idle = _idle_connections().get(self.db_path)
+        if idle is not None and len(idle) < MAX_IDLE and self not in idle:
+            idle.append(self)
+        else:
+            super().close()
+
+    def really_close(self) -> None:
+        super().close()
+
+def _idle_connections() -> Dict[str, List[PooledConnection]]:
+    if not hasattr(_local, 'idle'):
+        _local.idle = {}
+    return _local.idle
+
+def _open(db_path: str) -> PooledConnection:
+    conn = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT, factory=PooledConnection,
+                           cached_statements=CACHED_STATEMENTS)
+    conn.db_path = db_path
+    conn.owner = threading.get_ident()
+    # journal_mode is stored in the database file; setting it again is a no-op
+    conn.execute('PRAGMA journal_mode = WAL')
+    for name, value in PRAGMAS:
+        conn.execute(f'PRAGMA {name} = {value}')
+    return conn
+
+def get_connection(db_path: str = 'clea_db.db') -> PooledConnection:
+    """Return an idle connection of this thread for db_path, opening one if needed.
+
+    Connections are never shared between threads. Nested callers get separate
+    connections, so one function's commit can't end another's transaction.
+    """
+    idle = _idle_connections().setdefault(db_path, [])
+    if idle:
+        return idle.pop()
+    return _open(db_path)
+
+def close_all() -> None:
+    """Close the idle connections of the calling thread, e.g. before deleting a database."""
+    for idle in _idle_connections().values():
+        while idle:
+            idle.pop().really_close()
@@ -0,0 +1,82 @@
+# Snippets - Builds query-dependent snippets with highlight offsets from page text
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+from analyseur import analyzer
+
+SNIPPET_LENGTH = 200
+
+def _candidate_pattern(terms: Iterable[str]) -> Optional[re.Pattern]:
+    # Porter stems keep all but at most the last letter of the word they came from,
+    # so words starting with a stem minus one letter are the only possible matches
+    prefixes = {term[:-1] if len(term) > 3 else term for term in terms}
+    if not prefixes:
+        return None
+    alternatives = '|'.join(sorted(map(re.escape, prefixes), key=len, reverse=True))
+    return re.compile(rf'\b(?:{alternatives})\w*', re.IGNORECASE)
+
+def find_matches(text: str, terms: Iterable[str]) -> List[Tuple[int, int, str]]:
+    """Spans (start, end, term) of the words in text that stem to one of terms."""
+    terms = set(terms)
+    pattern = _candidate_pattern(terms)
+    if pattern is None:
+        return []
+    matches = []
+    for match in pattern.finditer(text):
+        term = analyzer.stem(match.group().lower())
+        if term in terms:
+            matches.append((match.start(), match.end(), term))
+    return matches
+
+def _best_window(matches: List[Tuple[int, int, str]], max_length: int) -> Tuple[int, int]:
+    # Slide over the matches and keep the window of at most max_length characters
+    # with the most distinct query terms, then the most matches
+    best = (0, 0, 0, 0)
+    counts: Dict[str, int] = {}
+    j = 0
+    for i, (start, _, _) in enumerate(matches):
+        while j < len(matches) and (j == i or matches[j][1] - start <= max_length):
+            counts[matches[j][2]] = counts.get(matches[j][2], 0) + 1
+            j += 1
+        if (len(counts), j - i) > best[:2]:
+            best = (len(counts), j - i, i, j)
+        term = matches[i][2]
+        counts[term] -= 1
+        if not counts[term]:
+            del counts[term]
+    return best[2], best[3]
+
+def make_snippet(text: str, terms: Iterable[str], max_length: int = SNIPPET_LENGTH
+                 ) -> Tuple[str, List[Tuple[int, int]]]:
+    """Pick the passage of text with the densest query-term matches.
+
+    Returns the snippet and the (start, end) offsets of matched words within it.
+    Without any match, the snippet is the start of the text and has no highlights.
+    """
+    matches = find_matches(text, terms)
+    if not matches:
+        end = len(text) if len(text) <= max_length else max(text.rfind(' ', 0, max_length), 1)
+        return text[:end] + ('...' if end < len(text) else ''), []
+
+    first, last = _best_window(matches, max_length)
+    window = matches[first:last]
+    span_start, span_end = window[0][0], window[-1][1]
+
+    # Center the matches in the snippet, cutting at word boundaries
+    start = max(0, span_start - (max_length - (span_end - span_start)) // 2)
+    if start > 0:
+        # Prefer starting at a sentence that begins before the first match
+        sentence = text.rfind('. ', start, span_start)
+        space = sentence + 1 if sentence != -1 else text.find(' ', start, span_start)
+        start = space + 1 if space != -1 else span_start
+    end = min(len(text), start + max_length)
+    if end < len(text):
+        space = text.rfind(' ', span_end, end)
+        end = space if space != -1 else span_end
+
+    prefix = '...' if start > 0 else ''
+    snippet = prefix + text[start:end] + ('...' if end < len(text) else '')
+    offset = len(prefix) - start
+    highlights = [(match_start + offset, match_end + offset)
+                  for match_start, match_end, _ in matches[first:]
+                  if match_end <= end and match_start >= start]
+    return snippet, highlights
@@ -24,6 +24,24 @@ import { motion, useMotionValue, AnimatePresence } from "framer-motion";
 import "@mantine/core/styles.css";
 import "./App.css";
 
+// Wrap the highlighted [start, end) ranges of a snippet in <mark>
+function highlightSnippet(snippet, highlights) {
+  if (!snippet || !highlights || highlights.length === 0) {
+    return snippet;
+  }
+  const parts = [];
+  let last = 0;
+  highlights.forEach(([start, end], i) => {
+    if (start > last) {
+      parts.push(snippet.slice(last, start));
+    }
+    parts.push(<mark key={i}>{snippet.slice(start, end)}</mark>);
+    last = end;
+  });
+  parts.push(snippet.slice(last));
+  return parts;
+}
+
 function App() {
   const [query, setQuery] = useState("");
   const [results, setResults] = useState([]);
@@ -31,6 +49,11 @@ function App() {
   const [error, setError] = useState(null);
   const [calculationResult, setCalculationResult] = useState(null);
   const [hasSearched, setHasSearched] = useState(false);
+  const [suggestions, setSuggestions] = useState([]);
+  const [total, setTotal] = useState(0);
+  const [totalEstimated, setTotalEstimated] = useState(false);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [isLoadingMore, setIsLoadingMore] = useState(false);
 
   // Sitemap state
   const [sitemapUrls, setSitemapUrls] = useState([]);
@@ -39,6 +62,7 @@ function App() {
   const [isLoadingSitemap, setIsLoadingSitemap] = useState(false);
   const [isCrawling, setIsCrawling] = useState(false);
   const [isIndexing, setIsIndexing] = useState(false);
+  const [activeJobId, setActiveJobId] = useState(null);
   const [notification, setNotification] = useState(null);
 
   // UI state
@@ -87,6 +111,34 @@ function App() {
     }
   }, [sitemapModalOpen]);
 
+  // Fetch completions of the word being typed, once typing pauses
+  useEffect(() => {
+    if (!query.trim()) {
+      setSuggestions([]);
+      return;
+    }
+    const controller = new AbortController();
+    const timer = setTimeout(async () => {
+      try {
+        const response = await fetch(
+          `${API_BASE}/suggest?q=${encodeURIComponent(query)}`,
+          { signal: controller.signal }
+        );
+        if (!response.ok) return;
+        const data = await response.json();
+        setSuggestions(data.suggestions || []);
+      } catch (err) {
+        if (err.name !== "AbortError") {
+          console.error("Suggest error:", err);
+        }
+      }
+    }, 100);
+    return () => {
+      clearTimeout(timer);
+      controller.abort();
+    };
+  }, [query]);
+
   const handleSearch = async (e) => {
     e.preventDefault();
     if (!query.trim()) return;
@@ -104,6 +156,9 @@ function App() {
 
       const data = await response.json();
       setResults(data.results || []);
+      setTotal(data.total || 0);
+      setTotalEstimated(Boolean(data.total_estimated));
+      setNextCursor(data.next_cursor || null);
 
       // Store calculation result if present
       if (data.calculation) {
@@ -121,11 +176,38 @@ function App() {
     }
   };
 
+  // Append the next page of results using the cursor of the last page
+  const loadMoreResults = async () => {
+    if (!nextCursor) return;
+    setIsLoadingMore(true);
+    try {
+      const response = await fetch(
+        `${API_BASE}/search?q=${encodeURIComponent(
+          query
+        )}&cursor=${encodeURIComponent(nextCursor)}`
+      );
+      if (!response.ok) throw new Error("Search failed");
+
+      const data = await response.json();
+      setResults((previous) => [...previous, ...(data.results || [])]);
+      setTotal(data.total || 0);
+      setTotalEstimated(Boolean(data.total_estimated));
+      setNextCursor(data.next_cursor || null);
+    } catch (err) {
+      setError("Failed to load more results.");
+      console.error("Search error:", err);
+    } finally {
+      setIsLoadingMore(false);
+    }
+  };
+
   // Reset search state
   const resetSearch = () => {
     // Clear all search-related state
     setQuery("");
     setResults([]);
+    setTotal(0);
+    setNextCursor(null);
     setError(null);
     setCalculationResult(null);
     setIsLoading(false);
@@ -241,32 +323,69 @@ function App() {
     }
   };
 
-  const forceCrawl = async () => {
-    setIsCrawling(true);
-    setNotification({
-      type: "info",
-      message:
-        "Force crawling all URLs in sitemap regardless of previous status...",
+  // Describe the progress of a background job for the notification
+  const describeJob = (label, job) => {
+    const total = job.total != null ? `/${job.total}` : "";
+    const eta = job.eta != null ? `, ETA ${Math.round(job.eta)}s` : "";
+    return `${label}: ${job.done}${total} pages, ${job.errors} errors, ${job.throughput.toFixed(1)} pages/s${eta}`;
+  };
+
+  // Final notification of a job; one cancelled while still queued never ran and has no result
+  const jobOutcome = (label, job, summary) => ({
+    type: job.status === "completed" ? "success" : "info",
+    message: job.result
+      ? `${label} ${job.status}. ${summary(job.result)}`
+      : `${label} cancelled before it started.`,
+  });
+
+  // Start a crawl or indexing job and poll its status until it finishes
+  const runJob = async (endpoint, body, label) => {
+    const response = await fetch(`${API_BASE}/${endpoint}`, {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify(body),
     });
+    const data = await response.json();
+    if (!response.ok) throw new Error(data.error || `Failed to start ${label}`);
+
+    setActiveJobId(data.job_id);
     try {
-      const response = await fetch(`${API_BASE}/crawl/force`, {
-        method: "POST",
-        headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({}),
-      });
+      let job = data.job;
+      while (job.status === "queued" || job.status === "running") {
+        setNotification({ type: "info", message: describeJob(label, job) });
+        await new Promise((resolve) => setTimeout(resolve, 1000));
+        const statusResponse = await fetch(`${API_BASE}/jobs/${data.job_id}`);
+        if (!statusResponse.ok) throw new Error(`Lost track of ${label}`);
+        job = await statusResponse.json();
+      }
+      if (job.status === "failed") throw new Error(job.error);
+      return job;
+    } finally {
+      setActiveJobId(null);
+    }
+  };
 
-      if (!response.ok) throw new Error("Failed to start force crawl");
+  const cancelActiveJob = async () => {
+    if (!activeJobId) return;
+    try {
+      await fetch(`${API_BASE}/jobs/${activeJobId}/cancel`, { method: "POST" });
+    } catch (err) {
+      console.error("Cancel error:", err);
+    }
+  };
 
-      const data = await response.json();
-      setNotification({
-        type: "success",
-        message: `${data.message}. Found ${data.links_found} links.`,
-      });
+  const forceCrawl = async () => {
+    setIsCrawling(true);
+    try {
+      const job = await runJob("crawl/force", {}, "Force crawl");
+      setNotification(
+        jobOutcome("Force crawl", job, (result) => `Found ${result?.links_found ?? 0} links.`)
+      );
       loadSitemap(); // Refresh the list to see updated statuses
     } catch (err) {
       setNotification({
         type: "error",
-        message: "Failed to start force crawl",
+        message: err.message || "Failed to start force crawl",
       });
       console.error("Force crawl error:", err);
     } finally {
@@ -276,27 +395,17 @@ function App() {
 
   const crawlNewSites = async () => {
     setIsCrawling(true);
-    setNotification({
-      type: "info",
-      message: "Crawling only new/pending URLs in sitemap...",
-    });
     try {
-      const response = await fetch(`${API_BASE}/crawl/new`, {
-        method: "POST",
-        headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({}),
-      });
-
-      if (!response.ok) throw new Error("Failed to start new crawl");
-
-      const data = await response.json();
-      setNotification({
-        type: "success",
-        message: `${data.message}. Found ${data.links_found} links.`,
-      });
+      const job = await runJob("crawl/new", {}, "New URL crawl");
+      setNotification(
+        jobOutcome("New URL crawl", job, (result) => `Found ${result?.links_found ?? 0} links.`)
+      );
       loadSitemap(); // Refresh the list to see updated statuses
     } catch (err) {
-      setNotification({ type: "error", message: "Failed to start new crawl" });
+      setNotification({
+        type: "error",
+        message: err.message || "Failed to start new crawl",
+      });
       console.error("New crawl error:", err);
     } finally {
       setIsCrawling(false);
@@ -307,24 +416,24 @@ function App() {
   const forceIndex = async () => {
     setIsIndexing(true);
     try {
-      const response = await fetch(`${API_BASE}/index/force`, {
-        method: "POST",
-        headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ max_pages: maxIndexPages }),
-      });
-
-      if (!response.ok) throw new Error("Failed to start force indexing");
-
-      const data = await response.json();
-      setNotification({
-        type: "success",
-        message: `${data.message}. Indexed ${data.indexed_count} pages.`,
-      });
+      const job = await runJob(
+        "index/force",
+        { max_pages: maxIndexPages },
+        "Force indexing"
+      );
+      setNotification(
+        jobOutcome(
+          "Force indexing",
+          job,
+          (result) =>
+            `Indexed ${result?.indexed_count ?? 0} pages, ${result?.unchanged_count ?? 0} unchanged.`
+        )
+      );
       loadSitemap(); // Refresh the list to see updated statuses
     } catch (err) {
       setNotification({
         type: "error",
-        message: "Failed to start force indexing",
+        message: err.message || "Failed to start force indexing",
       });
       console.error("Force index error:", err);
     } finally {
@@ -335,24 +444,24 @@ function App() {
   const indexNewSites = async () => {
     setIsIndexing(true);
     try {
-      const response = await fetch(`${API_BASE}/index/new`, {
-        method: "POST",
-        headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ max_pages: maxIndexPages }),
-      });
-
-      if (!response.ok) throw new Error("Failed to start new indexing");
-
-      const data = await response.json();
-      setNotification({
-        type: "success",
-        message: `${data.message}. Indexed ${data.indexed_count} pages.`,
-      });
+      const job = await runJob(
+        "index/new",
+        { max_pages: maxIndexPages },
+        "New URL indexing"
+      );
+      setNotification(
+        jobOutcome(
+          "New URL indexing",
+          job,
+          (result) =>
+            `Indexed ${result?.indexed_count ?? 0} pages, ${result?.unchanged_count ?? 0} unchanged.`
+        )
+      );
       loadSitemap(); // Refresh the list to see updated statuses
     } catch (err) {
       setNotification({
         type: "error",
-        message: "Failed to start new indexing",
+        message: err.message || "Failed to start new indexing",
       });
       console.error("New index error:", err);
     } finally {
@@ -427,6 +536,17 @@ function App() {
                       data-error={notification.type === "error"}
                     >
                       {notification.message}
+                      {activeJobId && notification.type === "info" && (
+                        <Button
+                          size="xs"
+                          variant="subtle"
+                          color="red"
+                          onClick={cancelActiveJob}
+                          ml="sm"
+                        >
+                          Cancel
+                        </Button>
+                      )}
                     </Notification>
                   </motion.div>
                 )}
@@ -453,7 +573,14 @@ function App() {
                         }
                       }}
                       className="new-search-input"
+                      list="search-suggestions"
+                      autoComplete="off"
                     />
+                    <datalist id="search-suggestions">
+                      {suggestions.map((suggestion) => (
+                        <option key={suggestion.text} value={suggestion.text} />
+                      ))}
+                    </datalist>
                     <button
                       type="submit"
                       className="new-search-button"
@@ -522,12 +649,18 @@ function App() {
                   animate={{ opacity: 1, y: 0 }}
                   transition={{ staggerChildren: 0.1 }}
                 >
+                  {results.length > 0 && (
+                    <Text size="sm" c="dimmed" className="results-count">
+                      {totalEstimated ? "About " : ""}
+                      {total.toLocaleString()} result{total === 1 ? "" : "s"}
+                    </Text>
+                  )}
                   {results.map((result, index) => (
                     <motion.div
                       key={index}
                       initial={{ opacity: 0, y: 20 }}
                       animate={{ opacity: 1, y: 0 }}
-                      transition={{ delay: index * 0.1 }}
+                      transition={{ delay: (index % 10) * 0.1 }}
                     >
                       <Card
                         className="result-card glass-panel"
@@ -549,7 +682,7 @@ function App() {
                             {result.url}
                           </Text>
                           <Text className="result-snippet">
-                            {result.snippet}
+                            {highlightSnippet(result.snippet, result.highlights)}
                           </Text>
                           <Group gap="xs" c="dimmed" size="xs">
                             <Text>Relevance: {result.relevance_score}</Text>
@@ -560,6 +693,18 @@ function App() {
                       </Card>
                     </motion.div>
                   ))}
+                  {nextCursor && results.length > 0 && (
+                    <Group justify="center">
+                      <Button
+                        variant="light"
+                        color="orange"
+                        onClick={loadMoreResults}
+                        loading={isLoadingMore}
+                      >
+                        More results
+                      </Button>
+                    </Group>
+                  )}
                   {query &&
                     hasSearched &&
                     results.length === 0 &&
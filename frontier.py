@@ -0,0 +1,188 @@
+# Frontier - Persistent, resumable queue of URLs waiting to be crawled
+import sqlite3
+from db import get_connection
+import time
+from urllib.parse import urlparse
+from typing import Dict, Iterable, List, Optional, Tuple
+
+class Frontier:
+    """Crawl frontier stored in SQLite so it survives restarts and stays out of memory.
+
+    URLs are handed out by depth first, then by their rank within their host (the
+    nth URL discovered on a host gets rank n), then by discovery time. Ranking by
+    host spreads each batch across hosts instead of draining one site first.
+
+    States: 'queued' -> 'active' (popped by a crawler) -> 'done'.
+    """
+
+    def __init__(self, db_path: str = 'clea_db.db'):
+        self.db_path = db_path
+
+    def add(self, urls: Iterable[str], depth: int) -> int:
+        """Queue URLs that were never seen before. Returns the number of new URLs."""
+        conn = get_connection(self.db_path)
+        try:
+            added = self._add(conn.cursor(), urls, depth)
+            conn.commit()
+            return added
+
+        except Exception as e:
+            print(f"Error adding URLs to frontier: {str(e)}")
+            conn.rollback()
+            return 0
+        finally:
+            conn.close()
+
+    def _add(self, cursor: sqlite3.Cursor, urls: Iterable[str], depth: int, chunk_size: int = 500) -> int:
+        urls = list(set(urls))
+        if not urls:
+            return 0
+
+        known = set()
+        for start in range(0, len(urls), chunk_size):
+            chunk = urls[start:start + chunk_size]
+            placeholders = ','.join('?' * len(chunk))
+            cursor.execute(f'SELECT url FROM crawl_frontier WHERE url IN ({placeholders})', chunk)
+            known.update(row[0] for row in cursor.fetchall())
+
+        by_host: Dict[str, List[str]] = {}
+        for url in urls:
+            if url not in known:
+                by_host.setdefault(urlparse(url).netloc, []).append(url)
+        if not by_host:
+            return 0
+
+        # Host ranks continue from the number of URLs already discovered on each host
+        hosts = list(by_host)
+        placeholders = ','.join('?' * len(hosts))
+        cursor.execute(f'SELECT host, discovered FROM frontier_hosts WHERE host IN ({placeholders})', hosts)
+        discovered = dict(cursor.fetchall())
+
+        now = time.time()
+        rows = []
+        host_counts = []
+        for host, host_urls in by_host.items():
+            rank = discovered.get(host, 0)
+            for url in host_urls:
+                rows.append((url, host, depth, rank, now))
+                rank += 1
+            host_counts.append((host, rank))
+
+        cursor.executemany('''
+        INSERT OR IGNORE INTO crawl_frontier (url, host, depth, host_rank, discovered_at)
+        VALUES (?, ?, ?, ?, ?)
+        ''', rows)
+        cursor.executemany('''
+        INSERT INTO frontier_hosts (host, discovered) VALUES (?, ?)
+        ON CONFLICT(host) DO UPDATE SET discovered = excluded.discovered
+        ''', host_counts)
+        return len(rows)
+
+    def pop(self, limit: int) -> List[Tuple[str, int]]:
+        """Take up to limit queued URLs, marking them active. Returns (url, depth) pairs."""
+        conn = get_connection(self.db_path)
+        try:
+            cursor = conn.cursor()
+            conn.execute('BEGIN IMMEDIATE')
+            cursor.execute('''
+            SELECT url, depth FROM crawl_frontier
+            WHERE state = 'queued'
+            ORDER BY depth, host_rank, discovered_at
+            LIMIT ?
+            ''', (limit,))
+            batch = cursor.fetchall()
+            cursor.executemany("UPDATE crawl_frontier SET state = 'active' WHERE url = ?",
+                               [(url,) for url, _ in batch])
+            conn.commit()
+            return batch
+
+        except Exception as e:
+            print(f"Error popping URLs from frontier: {str(e)}")
+            conn.rollback()
+            return []
+        finally:
+            conn.close()
+
+    def complete(self, url: str, links: Iterable[str] = (), depth: Optional[int] = None) -> None:
+        """Mark a URL done and, in the same transaction, queue the links found on it at depth.
+
+        New links are also recorded in crawled_urls so the indexer picks them up.
+        """
+        conn = get_connection(self.db_path)
+        try:
+            cursor = conn.cursor()
+            links = list(links)
+            if links:
+                cursor.executemany('INSERT OR IGNORE INTO crawled_urls (url) VALUES (?)',
+                                   [(link,) for link in links])
+                if depth is not None:
+                    self._add(cursor, links, depth)
+            cursor.execute("UPDATE crawl_frontier SET state = 'done' WHERE url = ?", (url,))
+            conn.commit()
+
+        except Exception as e:
+            print(f"Error completing {url} in frontier: {str(e)}")
+            conn.rollback()
+        finally:
+            conn.close()
+
+    def requeue(self, urls: Iterable[str]) -> None:
+        """Put active URLs back in the queue without crawling them."""
+        conn = get_connection(self.db_path)
+        try:
+            cursor = conn.cursor()
+            cursor.executemany("UPDATE crawl_frontier SET state = 'queued' WHERE url = ?",
+                               [(url,) for url in urls])
+            conn.commit()
+
+        except Exception as e:
+            print(f"Error requeueing URLs in frontier: {str(e)}")
+            conn.rollback()
+        finally:
+            conn.close()
+
+    def resume(self) -> int:
+        """Requeue URLs left active by an interrupted crawl. Returns how many were requeued."""
+        return self._execute("UPDATE crawl_frontier SET state = 'queued' WHERE state = 'active'")
+
+    def reset(self) -> None:
+        """Forget every URL, so the next crawl starts over."""
+        self._execute('DELETE FROM crawl_frontier')
+        self._execute('DELETE FROM frontier_hosts')
+
+    def is_done(self, url: str) -> bool:
+        """Check whether a URL has already been crawled."""
+        conn = get_connection(self.db_path)
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1 FROM crawl_frontier WHERE url = ? AND state = 'done'", (url,))
+            return cursor.fetchone() is not None
+        finally:
+            conn.close()
+
+    def stats(self) -> Dict[str, int]:
+        """Number of URLs in each state."""
+        conn = get_connection(self.db_path)
+        try:
+            cursor = conn.cursor()
+            cursor.execute('SELECT state, COUNT(*) FROM crawl_frontier GROUP BY state')
+            counts = {'queued': 0, 'active': 0, 'done': 0}
+            counts.update(dict(cursor.fetchall()))
+            return counts
+        finally:
+            conn.close()
+
+    def _execute(self, sql: str) -> int:
+        conn = get_connection(self.db_path)
+        try:
+            cursor = conn.cursor()
+            cursor.execute(sql)
+            conn.commit()
+            return cursor.rowcount
+
+        except Exception as e:
+            print(f"Error updating frontier: {str(e)}")
+            conn.rollback()
+            return 0
+        finally:
+            conn.close()
@@ -3,15 +3,21 @@
 import requests
 from bs4 import BeautifulSoup
 from urllib.parse import urljoin, urlparse
-from typing import List, Set, Dict, Optional
+from typing import List, Set, Dict, Optional, Callable, Deque, Iterable, Tuple
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import threading
 import time
 import random
-import sqlite3
+from db import get_connection
 from datetime import datetime
 from robotexclusionrulesparser import RobotExclusionRulesParser
+from grenier import fetch_page
+from frontier import Frontier
+import metrics
 
 robots_parser_cache: Dict[str, RobotExclusionRulesParser] = {}
-visited_urls: Set[str] = set()
 USER_AGENT = "CleaGlaneur/1.0"
 HEADERS = {"User-Agent": USER_AGENT}
 
@@ -21,17 +27,21 @@ def get_robots_parser(url: str) -> RobotExclusionRulesParser:
     domain = f"{parsed.scheme}://{parsed.netloc}"
     
     if domain not in robots_parser_cache:
+        metrics.increment('robots_cache', result='miss')
         parser = RobotExclusionRulesParser()
         try:
             robots_url = f"{domain}/robots.txt"
-            response = requests.get(robots_url, headers=HEADERS, timeout=10)
-            parser.parse(response.text)
+            with metrics.timed('robots_fetch'):
+                response = requests.get(robots_url, headers=HEADERS, timeout=10)
+                parser.parse(response.text)
         except Exception as e:
             print(f"Error fetching robots.txt for {domain}: {str(e)}")
             # can't fetch robots.txt, assume everything is allowed
             parser.parse("")
         
         robots_parser_cache[domain] = parser
+    else:
+        metrics.increment('robots_cache', result='hit')
         
     return robots_parser_cache[domain]
 
@@ -42,7 +52,7 @@ def is_allowed(url: str) -> bool:
 
 def save_urls_to_database(urls: Set[str], db_path: str = 'clea_db.db') -> None:
     """Save crawled URLs to the database."""
-    conn = sqlite3.connect(db_path)
+    conn = get_connection(db_path)
     try:
         cursor = conn.cursor()
         
@@ -62,65 +72,232 @@ def save_urls_to_database(urls: Set[str], db_path: str = 'clea_db.db') -> None:
     finally:
         conn.close()
 
-# crawl a list of URLs and extract links
-def crawl_pages(url_list: List[str], max_pages: int = 100, min_delay: float = 1.0, max_delay: float = 3.0) -> Set[str]:
-    to_visit = set(url_list)
-    all_links = set()
-    page_count = 0
-
-    while to_visit and page_count < max_pages:
-        current_url = to_visit.pop()
-        
-        if current_url in visited_urls:
+# extract absolute http(s) links from a page
+def extract_links(html: str, base_url: str) -> Set[str]:
+    soup = BeautifulSoup(html, 'html.parser')
+    links = set()
+    for link in soup.find_all('a'):
+        href = link.get('href')
+        if not href:
             continue
+
+        absolute_url = urljoin(base_url, href)
         
-        if not is_allowed(current_url):
-            print(f"Skipping {current_url} (not allowed by robots.txt)")
-            continue
-            
-        print(f"Crawling: {current_url}")
-        
-        try:
-            # random delay before each request
-            delay = random.uniform(min_delay, max_delay)
-            print(f"Waiting {delay:.2f} seconds...")
-            time.sleep(delay)
-            
-            # fetch and parse the webpage
-            response = requests.get(current_url, headers=HEADERS, timeout=10)
-            response.raise_for_status()
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            # mark as visited
-            visited_urls.add(current_url)
-            page_count += 1
-            
-            # find all links
-            for link in soup.find_all('a'):
-                href = link.get('href')
-                if not href:
-                    continue
+        # keep http(s) only
+        if absolute_url.startswith(('http://', 'https://')):
+            links.add(absolute_url)
+    return links
 
-                absolute_url = urljoin(current_url, href)
-                
-                # keep http(s) only
-                if not absolute_url.startswith(('http://', 'https://')):
-                    continue
+# crawl pages through the persistent frontier, following links
+def crawl_pages(url_list: List[str], max_pages: int = 100, min_delay: float = 1.0, max_delay: float = 3.0,
+                db_path: str = 'clea_db.db', concurrency: int = 1, per_host_limit: int = 1,
+                max_depth: Optional[int] = None, batch_size: int = 100) -> int:
+    """Crawl up to max_pages pages starting from url_list, following links.
 
-                all_links.add(absolute_url)
-                to_visit.add(absolute_url)
+    URLs wait in the on-disk frontier and are taken batch_size at a time, so memory
+    use doesn't grow with the number of discovered URLs. An interrupted crawl picks
+    up where it left off on the next call. Discovered links are saved to crawled_urls.
 
-        except Exception as e:
-            print(f"Error crawling {current_url}: {str(e)}")
+    Returns the number of crawled pages.
+    """
+    frontier = Frontier(db_path)
+    frontier.resume()
+    frontier.add(url_list, 0)
+
+    if concurrency > 1:
+        return asyncio.run(crawl_concurrently(
+            [], max_pages, min_delay, max_delay,
+            concurrency=concurrency, per_host_limit=per_host_limit, db_path=db_path,
+            frontier=frontier, max_depth=max_depth, batch_size=batch_size
+        ))
+
+    page_count = 0
+
+    while page_count < max_pages:
+        batch = frontier.pop(min(batch_size, max_pages - page_count))
+        if not batch:
+            break
+
+        for current_url, depth in batch:
+            if not is_allowed(current_url):
+                print(f"Skipping {current_url} (not allowed by robots.txt)")
+                frontier.complete(current_url)
+                continue
+                
+            print(f"Crawling: {current_url}")
+            
+            try:
+                # random delay before each request
+                delay = random.uniform(min_delay, max_delay)
+                print(f"Waiting {delay:.2f} seconds...")
+                time.sleep(delay)
+                
+                # fetch and parse the webpage
+                # conditional GET against the stored copy, which is kept for the indexer
+                html, _ = fetch_page(current_url, HEADERS, db_path)
+                page_count += 1
+                
+                # queue the links one level deeper and mark the page done
+                page_links = extract_links(html, current_url)
+                next_depth = depth + 1 if max_depth is None or depth < max_depth else None
+                frontier.complete(current_url, page_links, next_depth)
+
+            except Exception as e:
+                print(f"Error crawling {current_url}: {str(e)}")
+                frontier.complete(current_url)
 
     print(f"\nCrawling completed. Visited {page_count} pages.")
-    return all_links
+    return page_count
+
+# Concurrent Crawling
+
+class HostSchedule:
+    """Politeness state for one host: connection limit and the earliest next request time."""
+
+    def __init__(self, per_host_limit: int):
+        self.connections = asyncio.Semaphore(per_host_limit)
+        self.robots_lock = asyncio.Lock()
+        self.next_request = 0.0
+        self.queue: Deque[Tuple[str, int]] = deque()
+        self.lanes = 0
+
+async def _polite_wait(schedule: HostSchedule, min_delay: float, max_delay: float) -> None:
+    # reserve a start time before sleeping so parallel lanes on a host stay spaced out
+    loop = asyncio.get_running_loop()
+    now = loop.time()
+    start = max(now, schedule.next_request)
+    schedule.next_request = start + random.uniform(min_delay, max_delay)
+    if start > now:
+        await asyncio.sleep(start - now)
+
+async def crawl_concurrently(seed_urls: List[str], max_pages: int = 100, min_delay: float = 1.0, max_delay: float = 3.0,
+                             concurrency: int = 16, per_host_limit: int = 1, db_path: str = 'clea_db.db',
+                             frontier: Optional[Frontier] = None, max_depth: Optional[int] = None,
+                             batch_size: int = 100,
+                             on_status: Optional[Callable[[str, str], None]] = None,
+                             on_links: Optional[Callable[[str, Set[str]], None]] = None,
+                             cancel: Optional[threading.Event] = None) -> int:
+    """Crawl many hosts in parallel while staying polite to each one.
+
+    Each host gets its own queue and at most per_host_limit open connections, with
+    a random min_delay..max_delay gap between requests to the same host. At most
+    concurrency requests are in flight overall.
+
+    Without a frontier only seed_urls are crawled. With one, URLs are pulled from
+    the frontier batch_size at a time and the links found are queued back into it.
+    on_status is called with (url, 'crawled' | 'error') for every URL attempted and
+    on_links with (url, links) for every crawled page. Once cancel is set no new
+    requests start; queued URLs go back to the frontier.
+
+    Returns the number of crawled pages.
+    """
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    fetch_slots = asyncio.Semaphore(concurrency)
+    hosts: Dict[str, HostSchedule] = {}
+    lanes: Set[asyncio.Task] = set()
+    in_memory = 0
+    started_pages = 0
+    page_count = 0
+
+    def report(url: str, status: str) -> None:
+        if on_status:
+            on_status(url, status)
+
+    def enqueue(url: str, depth: int) -> None:
+        nonlocal in_memory
+        in_memory += 1
+        host = urlparse(url).netloc
+        schedule = hosts.get(host)
+        if schedule is None:
+            schedule = hosts[host] = HostSchedule(per_host_limit)
+        schedule.queue.append((url, depth))
+        if schedule.lanes < per_host_limit:
+            schedule.lanes += 1
+            lanes.add(asyncio.create_task(host_lane(schedule)))
+
+    async def finish(url: str, links: Iterable[str] = (), depth: Optional[int] = None) -> None:
+        if frontier is not None:
+            await loop.run_in_executor(executor, frontier.complete, url, links, depth)
+
+    async def crawl_one(url: str, depth: int, schedule: HostSchedule) -> None:
+        nonlocal page_count, started_pages
+
+        async with schedule.robots_lock:
+            allowed = await loop.run_in_executor(executor, is_allowed, url)
+        if not allowed:
+            print(f"Skipping {url} (not allowed by robots.txt)")
+            report(url, 'error')
+            await finish(url)
+            return
+
+        started_pages += 1
+        async with schedule.connections:
+            await _polite_wait(schedule, min_delay, max_delay)
+            async with fetch_slots:
+                print(f"Crawling: {url}")
+                try:
+                    html, _ = await loop.run_in_executor(executor, fetch_page, url, HEADERS, db_path)
+                    page_links = await loop.run_in_executor(executor, extract_links, html, url)
+                except Exception as e:
+                    print(f"Error crawling {url}: {str(e)}")
+                    started_pages -= 1
+                    report(url, 'error')
+                    await finish(url)
+                    return
+
+        page_count += 1
+        report(url, 'crawled')
+        if on_links:
+            on_links(url, page_links)
+        next_depth = depth + 1 if max_depth is None or depth < max_depth else None
+        await finish(url, page_links, next_depth)
+
+    async def host_lane(schedule: HostSchedule) -> None:
+        nonlocal in_memory
+        try:
+            while schedule.queue:
+                url, depth = schedule.queue.popleft()
+                if started_pages >= max_pages or (cancel is not None and cancel.is_set()):
+                    # over budget or cancelled: hand the URL back for the next crawl
+                    if frontier is not None:
+                        await loop.run_in_executor(executor, frontier.requeue, [url])
+                    in_memory -= 1
+                    continue
+                await crawl_one(url, depth, schedule)
+                in_memory -= 1
+        finally:
+            schedule.lanes -= 1
+
+    try:
+        for url in dict.fromkeys(seed_urls):
+            enqueue(url, 0)
+        while True:
+            # top up the host queues from the frontier when they run low
+            stopping = cancel is not None and cancel.is_set()
+            if frontier is not None and in_memory < batch_size // 2 and started_pages < max_pages and not stopping:
+                budget = min(batch_size, max_pages - started_pages) - in_memory
+                if budget > 0:
+                    for url, depth in await loop.run_in_executor(executor, frontier.pop, budget):
+                        enqueue(url, depth)
+            if not lanes:
+                break
+            done, _ = await asyncio.wait(lanes, timeout=1.0, return_when=asyncio.FIRST_COMPLETED)
+            lanes.difference_update(done)
+            for task in done:
+                if task.exception():
+                    print(f"Crawl lane failed: {task.exception()}")
+    finally:
+        executor.shutdown(wait=False)
+
+    print(f"\nConcurrent crawl completed. Visited {page_count} pages on {len(hosts)} hosts.")
+    return page_count
 
 # Sitemap Management Functions
 
 def add_url_to_sitemap(url: str, db_path: str = 'clea_db.db') -> bool:
     """Add a URL to the sitemap for crawling."""
-    conn = sqlite3.connect(db_path)
+    conn = get_connection(db_path)
     try:
         cursor = conn.cursor()
         cursor.execute('''
@@ -141,7 +318,7 @@ def add_url_to_sitemap(url: str, db_path: str = 'clea_db.db') -> bool:
 
 def add_urls_to_sitemap(urls: List[str], db_path: str = 'clea_db.db') -> int:
     """Add multiple URLs to the sitemap for crawling."""
-    conn = sqlite3.connect(db_path)
+    conn = get_connection(db_path)
     try:
         cursor = conn.cursor()
         added_count = 0
@@ -166,7 +343,7 @@ def add_urls_to_sitemap(urls: List[str], db_path: str = 'clea_db.db') -> int:
 
 def get_sitemap_urls(status: Optional[str] = None, db_path: str = 'clea_db.db') -> List[Dict]:
     """Get URLs from sitemap, optionally filtered by status."""
-    conn = sqlite3.connect(db_path)
+    conn = get_connection(db_path)
     try:
         cursor = conn.cursor()
         
@@ -206,7 +383,7 @@ def get_sitemap_urls(status: Optional[str] = None, db_path: str = 'clea_db.db')
 
 def update_crawl_status(url: str, status: str, db_path: str = 'clea_db.db') -> None:
     """Update the crawl status of a URL in the sitemap."""
-    conn = sqlite3.connect(db_path)
+    conn = get_connection(db_path)
     try:
         cursor = conn.cursor()
         
@@ -227,7 +404,7 @@ def update_crawl_status(url: str, status: str, db_path: str = 'clea_db.db') -> N
 
 def remove_url_from_sitemap(url: str, db_path: str = 'clea_db.db') -> bool:
     """Remove a URL from the sitemap (mark as inactive)."""
-    conn = sqlite3.connect(db_path)
+    conn = get_connection(db_path)
     try:
         cursor = conn.cursor()
         cursor.execute('''
@@ -248,16 +425,22 @@ def remove_url_from_sitemap(url: str, db_path: str = 'clea_db.db') -> bool:
         conn.close()
 
 def crawl_from_sitemap(force_crawl: bool = False, min_delay: float = 1.0, max_delay: float = 3.0, 
-                      db_path: str = 'clea_db.db') -> Set[str]:
-    """Crawl URLs from sitemap based on their status."""
-    global visited_urls
-    
+                      db_path: str = 'clea_db.db', concurrency: int = 1, per_host_limit: int = 1,
+                      on_status: Optional[Callable[[str, str], None]] = None,
+                      cancel: Optional[threading.Event] = None) -> Set[str]:
+    """Crawl URLs from sitemap based on their status.
+
+    With concurrency > 1 the URLs are crawled by crawl_concurrently, which applies
+    the delays per host instead of before every request. on_status is called with
+    (url, 'crawled' | 'error') for every URL attempted; setting cancel stops the
+    crawl after the pages in flight, keeping the links found so far.
+    """
     if force_crawl:
         # Crawl all active URLs regardless of status
         urls_to_crawl = get_sitemap_urls(db_path=db_path)
         print(f"Force crawling {len(urls_to_crawl)} URLs from sitemap...")
-        # Clear visited URLs set when force crawling
-        visited_urls = set()
+        # Start the link frontier over when force crawling
+        Frontier(db_path).reset()
     else:
         # Only crawl pending URLs
         urls_to_crawl = get_sitemap_urls(status='pending', db_path=db_path)
@@ -269,20 +452,41 @@ def crawl_from_sitemap(force_crawl: bool = False, min_delay: float = 1.0, max_de
     
     # Convert to list of URL strings
     url_list = [item['url'] for item in urls_to_crawl]
+
+    def report(url: str, status: str) -> None:
+        update_crawl_status(url, status, db_path)
+        if on_status:
+            on_status(url, status)
+    
+    if concurrency > 1:
+        all_links = set()
+        asyncio.run(crawl_concurrently(
+            url_list,
+            max_pages=len(url_list),
+            min_delay=min_delay,
+            max_delay=max_delay,
+            concurrency=concurrency,
+            per_host_limit=per_host_limit,
+            db_path=db_path,
+            on_status=lambda url, status: report(url, status),
+            on_links=lambda url, links: all_links.update(links),
+            cancel=cancel
+        ))
+        if all_links:
+            save_urls_to_database(all_links, db_path)
+        return all_links
     
     all_links = set()
     crawled_count = 0
     
     for url in url_list:
-            
-        # When force_crawl is True, we crawl even if it's already visited
-        # Only check visited_urls when not forcing a crawl
-        if not force_crawl and url in visited_urls:
-            continue
+        if cancel is not None and cancel.is_set():
+            print("Sitemap crawl cancelled.")
+            break
         
         if not is_allowed(url):
             print(f"Skipping {url} (not allowed by robots.txt)")
-            update_crawl_status(url, 'error', db_path)
+            report(url, 'error')
             continue
             
         print(f"Crawling sitemap URL: {url}")
@@ -291,39 +495,29 @@ def crawl_from_sitemap(force_crawl: bool = False, min_delay: float = 1.0, max_de
             # Random delay before each request
             delay = random.uniform(min_delay, max_delay)
             print(f"Waiting {delay:.2f} seconds...")
-            time.sleep(delay)
+            if cancel is not None:
+                if cancel.wait(delay):
+                    continue
+            else:
+                time.sleep(delay)
             
             # Fetch and parse the webpage
-            response = requests.get(url, headers=HEADERS, timeout=10)
-            response.raise_for_status()
-            soup = BeautifulSoup(response.text, 'html.parser')
+            # Conditional GET; the HTML is kept so the indexer doesn't download the page again
+            html, _ = fetch_page(url, HEADERS, db_path)
             
-            # Mark as visited and update status
-            visited_urls.add(url)
-            update_crawl_status(url, 'crawled', db_path)
+            # Update status
+            report(url, 'crawled')
             crawled_count += 1
             
             # Find all links
-            page_links = set()
-            for link in soup.find_all('a'):
-                href = link.get('href')
-                if not href:
-                    continue
-
-                absolute_url = urljoin(url, href)
-                
-                # Keep http(s) only
-                if not absolute_url.startswith(('http://', 'https://')):
-                    continue
-
-                page_links.add(absolute_url)
-                all_links.add(absolute_url)
+            page_links = extract_links(html, url)
+            all_links.update(page_links)
             
             print(f"Found {len(page_links)} links on {url}")
 
         except Exception as e:
             print(f"Error crawling {url}: {str(e)}")
-            update_crawl_status(url, 'error', db_path)
+            report(url, 'error')
 
     print(f"\nSitemap crawling completed. Crawled {crawled_count} pages, found {len(all_links)} total links.")
     
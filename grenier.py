@@ -0,0 +1,142 @@
+# Content Store - Keeps compressed copies of fetched pages for the crawler and indexer
+from db import get_connection
+import time
+import zlib
+import hashlib
+import requests
+from typing import Dict, Optional, Tuple
+import metrics
+
+# Stored copies older than this (in seconds) are considered stale
+CONTENT_MAX_AGE = 24 * 60 * 60
+
+def content_hash(html: str) -> str:
+    """Hash of a page's raw HTML, used to detect unchanged pages."""
+    return hashlib.sha1(html.encode('utf-8')).hexdigest()
+
+def store_page(url: str, html: str, db_path: str = 'clea_db.db', fetched_at: Optional[float] = None,
+               etag: Optional[str] = None, last_modified: Optional[str] = None) -> None:
+    """Save the raw HTML of a fetched page and its HTTP validators, replacing any older copy."""
+    conn = get_connection(db_path)
+    try:
+        cursor = conn.cursor()
+        cursor.execute('''
+        INSERT OR REPLACE INTO page_content (url, fetched_at, etag, last_modified, content_hash, content)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ''', (url, fetched_at or time.time(), etag, last_modified, content_hash(html),
+              zlib.compress(html.encode('utf-8'))))
+
+        conn.commit()
+
+    except Exception as e:
+        print(f"Error storing content for {url}: {str(e)}")
+        conn.rollback()
+    finally:
+        conn.close()
+
+def touch_page(url: str, db_path: str = 'clea_db.db') -> None:
+    """Mark the stored copy of a page as fetched now, e.g. after a 304 Not Modified."""
+    conn = get_connection(db_path)
+    try:
+        cursor = conn.cursor()
+        cursor.execute('UPDATE page_content SET fetched_at = ? WHERE url = ?', (time.time(), url))
+        conn.commit()
+
+    except Exception as e:
+        print(f"Error updating content for {url}: {str(e)}")
+        conn.rollback()
+    finally:
+        conn.close()
+
+def load_page(url: str, max_age: float = CONTENT_MAX_AGE, db_path: str = 'clea_db.db') -> Optional[str]:
+    """Return the stored HTML of a page, or None if it is missing or stale."""
+    conn = get_connection(db_path)
+    try:
+        cursor = conn.cursor()
+        cursor.execute('''
+        SELECT content FROM page_content
+        WHERE url = ? AND fetched_at >= ?
+        ''', (url, time.time() - max_age))
+
+        row = cursor.fetchone()
+        return zlib.decompress(row[0]).decode('utf-8') if row else None
+
+    except Exception as e:
+        print(f"Error loading content for {url}: {str(e)}")
+        return None
+    finally:
+        conn.close()
+
+def load_validators(url: str, db_path: str = 'clea_db.db') -> Optional[Dict]:
+    """Return the ETag, Last-Modified and content hash stored for a page, if any."""
+    conn = get_connection(db_path)
+    try:
+        cursor = conn.cursor()
+        cursor.execute('''
+        SELECT etag, last_modified, content_hash FROM page_content
+        WHERE url = ?
+        ''', (url,))
+
+        row = cursor.fetchone()
+        if not row:
+            return None
+        return {'etag': row[0], 'last_modified': row[1], 'content_hash': row[2]}
+
+    except Exception as e:
+        print(f"Error loading validators for {url}: {str(e)}")
+        return None
+    finally:
+        conn.close()
+
+def is_page_fresh(url: str, max_age: float = CONTENT_MAX_AGE, db_path: str = 'clea_db.db') -> bool:
+    """Check whether a fresh copy of the page is stored, without decompressing it."""
+    conn = get_connection(db_path)
+    try:
+        cursor = conn.cursor()
+        cursor.execute('''
+        SELECT 1 FROM page_content
+        WHERE url = ? AND fetched_at >= ?
+        ''', (url, time.time() - max_age))
+        return cursor.fetchone() is not None
+
+    except Exception as e:
+        print(f"Error checking content for {url}: {str(e)}")
+        return False
+    finally:
+        conn.close()
+
+def fetch_page(url: str, headers: Optional[Dict[str, str]] = None, db_path: str = 'clea_db.db',
+               timeout: float = 10) -> Tuple[str, bool]:
+    """Download a page with a conditional GET and keep it in the store.
+
+    The stored ETag and Last-Modified values are sent as If-None-Match and
+    If-Modified-Since. Returns the page HTML and whether its content changed
+    since the stored copy.
+    """
+    validators = load_validators(url, db_path)
+    request_headers = dict(headers or {})
+    if validators:
+        if validators['etag']:
+            request_headers['If-None-Match'] = validators['etag']
+        if validators['last_modified']:
+            request_headers['If-Modified-Since'] = validators['last_modified']
+
+    with metrics.timed('page_fetch'):
+        response = requests.get(url, headers=request_headers, timeout=timeout)
+    if response.status_code == 304 and validators:
+        touch_page(url, db_path)
+        html = load_page(url, db_path=db_path)
+        if html is not None:
+            metrics.increment('page_fetches', result='not_modified')
+            return html, False
+        # the stored copy vanished in the meantime, fetch it unconditionally
+        with metrics.timed('page_fetch'):
+            response = requests.get(url, headers=headers, timeout=timeout)
+    metrics.increment('page_fetches', result='downloaded' if response.ok else 'error')
+
+    response.raise_for_status()
+    html = response.text
+    store_page(url, html, db_path, etag=response.headers.get('ETag'),
+               last_modified=response.headers.get('Last-Modified'))
+    changed = not validators or validators['content_hash'] != content_hash(html)
+    return html, changed
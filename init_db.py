@@ -1,8 +1,21 @@
 import sqlite3
+from db import get_connection
+
+def create_word_index(cursor: sqlite3.Cursor) -> None:
+    """Create the posting table, in the main database or in an index shard (see shards.py)."""
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS word_index (
+        word TEXT PRIMARY KEY,
+        webpage_ids BLOB,  -- sorted webpage IDs, packed uint32 (see postings.py)
+        webpage_frequencies BLOB,  -- frequencies aligned with webpage_ids, packed uint32
+        max_frequency INTEGER,  -- highest frequency in the list, for score upper bounds
+        min_length INTEGER  -- lower bound on the length of pages in the list
+    )
+    ''')
 
 # Init the SQLite database
 def init_database(db_path: str = 'clea_db.db') -> None:
-    conn = sqlite3.connect(db_path)
+    conn = get_connection(db_path)
     cursor = conn.cursor()
 
     cursor.execute('''
@@ -11,15 +24,63 @@ def init_database(db_path: str = 'clea_db.db') -> None:
         url TEXT UNIQUE,
         title TEXT,
         snippet TEXT,
-        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+        content_hash TEXT,  -- hash of the HTML this row was indexed from
+        length INTEGER DEFAULT 0  -- number of indexed terms, repeats included (for BM25)
     )
     ''')
 
+    create_word_index(cursor)
+
     cursor.execute('''
-    CREATE TABLE IF NOT EXISTS word_index (
+    CREATE TABLE IF NOT EXISTS word_positions (
+        webpage_id INTEGER,
+        word TEXT,
+        positions BLOB,  -- varint-coded gaps between term positions (see postings.py)
+        PRIMARY KEY (webpage_id, word)
+    ) WITHOUT ROWID
+    ''')
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS index_meta (
+        key TEXT PRIMARY KEY,  -- 'generation' (bumped on every index commit), 'doc_count', 'total_length',
+                               -- 'shards' (number of shard files holding word_index, see shards.py)
+        value
+    )
+    ''')
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS vocabulary (
         word TEXT PRIMARY KEY,
-        webpage_ids TEXT,  -- JSON array of webpage IDs
-        webpage_frequencies TEXT  -- JSON object mapping webpage_id to frequency
+        surface TEXT,  -- a word of the indexed text that stems to word, shown as a suggestion
+        document_frequency INTEGER,  -- pages containing word, 0 once it left the index
+        generation INTEGER  -- index generation of the last change, for incremental reloads
+    )
+    ''')
+
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_vocabulary_generation
+    ON vocabulary (generation)
+    ''')
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS page_terms (
+        webpage_id INTEGER PRIMARY KEY,
+        terms BLOB  -- zlib-compressed, newline-separated distinct terms of the page
+    )
+    ''')
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS page_text (
+        webpage_id INTEGER PRIMARY KEY,
+        text BLOB  -- zlib-compressed extracted text, for query-dependent snippets
+    )
+    ''')
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS deleted_webpages (
+        webpage_id INTEGER PRIMARY KEY,  -- tombstone: postings for this id are dead
+        deleted_at DATETIME DEFAULT CURRENT_TIMESTAMP
     )
     ''')
 
@@ -32,6 +93,29 @@ def init_database(db_path: str = 'clea_db.db') -> None:
     )
     ''')
 
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS crawl_frontier (
+        url TEXT PRIMARY KEY,
+        host TEXT,
+        depth INTEGER,
+        host_rank INTEGER,  -- nth URL discovered on its host, for host fairness
+        discovered_at REAL,
+        state TEXT DEFAULT 'queued'  -- 'queued', 'active', 'done'
+    )
+    ''')
+
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_crawl_frontier_order
+    ON crawl_frontier (state, depth, host_rank, discovered_at)
+    ''')
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS frontier_hosts (
+        host TEXT PRIMARY KEY,
+        discovered INTEGER DEFAULT 0
+    )
+    ''')
+
     cursor.execute('''
     CREATE TABLE IF NOT EXISTS sitemap_urls (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -43,6 +127,17 @@ def init_database(db_path: str = 'clea_db.db') -> None:
     )
     ''')
 
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS page_content (
+        url TEXT PRIMARY KEY,
+        fetched_at REAL,  -- unix time of the fetch
+        etag TEXT,
+        last_modified TEXT,
+        content_hash TEXT,  -- hash of the raw HTML (see grenier.content_hash)
+        content BLOB  -- zlib-compressed UTF-8 HTML
+    )
+    ''')
+
     conn.commit()
     conn.close()
 
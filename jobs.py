@@ -0,0 +1,151 @@
+# Jobs - Runs crawls and indexing in the background with progress reporting and cancellation
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+# Jobs running at the same time; later ones wait in the queue
+JOB_WORKERS = 2
+
+# Finished jobs kept for status requests, oldest dropped first
+MAX_FINISHED_JOBS = 100
+
+FINISHED = ('completed', 'cancelled', 'failed')
+
+class Job:
+    """A crawl or indexing run and its progress.
+
+    The job function reports each page it is done with through report(), and
+    should stop early once cancel is set. Throughput and ETA are derived from the
+    page counts when the status is read.
+    """
+
+    def __init__(self, kind: str, params: Dict[str, Any]):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.params = params
+        self.status = 'queued'
+        self.total: Optional[int] = None
+        self.done = 0
+        self.errors = 0
+        # Pages handled per reported status, e.g. {'indexed': 8, 'unchanged': 2}
+        self.statuses: Dict[str, int] = {}
+        self.last_url: Optional[str] = None
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.cancel = threading.Event()
+        self._lock = threading.Lock()
+
+    def set_total(self, total: int) -> None:
+        """Number of pages the job expects to handle, for the ETA."""
+        self.total = total
+
+    def report(self, url: str, status: str) -> None:
+        """Count a finished page; status 'error' counts as an error. Safe to call from any thread."""
+        with self._lock:
+            self.done += 1
+            if status == 'error':
+                self.errors += 1
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+            self.last_url = url
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Status, counts, throughput (pages per second) and ETA in seconds of the job."""
+        with self._lock:
+            statuses = dict(self.statuses)
+        end = self.finished_at or time.time()
+        elapsed = end - self.started_at if self.started_at else 0.0
+        throughput = self.done / elapsed if elapsed > 0 else 0.0
+        eta = None
+        if self.status == 'running' and self.total is not None and throughput > 0:
+            eta = round(max(self.total - self.done, 0) / throughput, 1)
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'params': self.params,
+            'status': self.status,
+            'total': self.total,
+            'done': self.done,
+            'errors': self.errors,
+            'statuses': statuses,
+            'last_url': self.last_url,
+            'elapsed': round(elapsed, 1),
+            'throughput': round(throughput, 3),
+            'eta': eta,
+            'result': self.result,
+            'error': self.error,
+            'cancel_requested': self.cancel.is_set(),
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at
+        }
+
+class JobRunner:
+    """In-process pool running jobs in submission order, max_workers at a time."""
+
+    def __init__(self, max_workers: int = JOB_WORKERS):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='clea-job')
+        self.jobs: 'OrderedDict[str, Job]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, kind: str, target: Callable[[Job], Optional[Dict[str, Any]]],
+               params: Optional[Dict[str, Any]] = None, exclusive: bool = False) -> Optional[Job]:
+        """Queue target(job) as a new job of the given kind.
+
+        With exclusive=True, returns None instead if a job of the same kind is
+        still queued or running.
+        """
+        with self._lock:
+            if exclusive and any(job.kind == kind and job.status not in FINISHED for job in self.jobs.values()):
+                return None
+            job = Job(kind, params or {})
+            self.jobs[job.id] = job
+            self._forget_finished()
+        self.executor.submit(self._run, job, target)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.jobs.get(job_id)
+
+    def list(self) -> List[Job]:
+        """All known jobs, newest first."""
+        with self._lock:
+            return list(reversed(self.jobs.values()))
+
+    def cancel(self, job_id: str) -> bool:
+        """Ask a job to stop. Returns False for unknown or finished jobs."""
+        job = self.jobs.get(job_id)
+        if job is None or job.status in FINISHED:
+            return False
+        job.cancel.set()
+        return True
+
+    def _forget_finished(self) -> None:
+        finished = [job_id for job_id, job in self.jobs.items() if job.status in FINISHED]
+        for job_id in finished[:max(len(finished) - MAX_FINISHED_JOBS, 0)]:
+            del self.jobs[job_id]
+
+    def _run(self, job: Job, target: Callable[[Job], Optional[Dict[str, Any]]]) -> None:
+        job.started_at = time.time()
+        if job.cancel.is_set():
+            job.status = 'cancelled'
+            job.finished_at = job.started_at
+            return
+        job.status = 'running'
+        try:
+            job.result = target(job)
+            job.status = 'cancelled' if job.cancel.is_set() else 'completed'
+        except Exception as e:
+            print(f"Error in {job.kind} job {job.id}: {str(e)}")
+            job.error = str(e)
+            job.status = 'failed'
+        finally:
+            job.finished_at = time.time()
+
+# Shared runner used by the API server
+runner = JobRunner()
@@ -0,0 +1,143 @@
+# Memory Index - Read-only in-memory copy of word_index for serving searches
+from db import get_connection
+import threading
+from array import array
+from typing import Dict, FrozenSet, List, Optional, Tuple
+from postings import POSTING_TYPECODE, decode_postings, read_generation, read_collection_stats
+from shards import read_shard_count, iter_terms
+
+class MemoryIndex:
+    """Snapshot of the term dictionary and all posting lists of one index generation.
+
+    Postings of every term are packed back to back into two flat arrays; a term
+    maps to a slot whose offsets delimit its slice. Lookups return zero-copy
+    memoryviews, so a query neither touches SQLite nor decodes anything.
+    """
+
+    def __init__(self, generation: int, slots: Dict[str, int], offsets: array,
+                 webpage_ids: array, frequencies: array, deleted: FrozenSet[int],
+                 bounds: List[Tuple[Optional[int], Optional[int]]],
+                 lengths: array, doc_count: int, total_length: int):
+        self.generation = generation
+        self.slots = slots
+        self.offsets = offsets
+        self.webpage_ids = memoryview(webpage_ids)
+        self.frequencies = memoryview(frequencies)
+        self.deleted = deleted
+        # (max_frequency, min_length) of each slot, for MaxScore pruning
+        self.bounds = bounds
+        # Page lengths indexed by webpage id, 0 for ids without a page (which are in deleted)
+        self.lengths = lengths
+        self.doc_count = doc_count
+        self.total_length = total_length
+
+    @classmethod
+    def load(cls, db_path: str = 'clea_db.db') -> 'MemoryIndex':
+        """Read the whole index in one read transaction, so the snapshot is consistent.
+
+        Shards are read in transactions of their own, so their postings may be newer
+        than the generation; the next refresh then loads that generation anyway.
+        """
+        conn = get_connection(db_path)
+        try:
+            cursor = conn.cursor()
+            cursor.execute('BEGIN')
+            generation = read_generation(cursor)
+
+            slots = {}
+            offsets = array('Q', [0])
+            webpage_ids = array(POSTING_TYPECODE)
+            frequencies = array(POSTING_TYPECODE)
+            bounds = []
+            shard_count = read_shard_count(cursor)
+            if shard_count:
+                rows = iter_terms(db_path, shard_count)
+            else:
+                rows = cursor.execute('''
+                SELECT word, webpage_ids, webpage_frequencies, max_frequency, min_length FROM word_index
+                ''')
+            for word, ids_blob, freqs_blob, max_frequency, min_length in rows:
+                term_ids, term_freqs = decode_postings(ids_blob, freqs_blob)
+                slots[word] = len(slots)
+                bounds.append((max_frequency, min_length))
+                webpage_ids.extend(term_ids)
+                frequencies.extend(term_freqs)
+                offsets.append(len(webpage_ids))
+
+            # Sized by the highest id ever handed out, since postings of deleted pages may remain
+            cursor.execute("SELECT COALESCE(MAX(seq), 0) FROM sqlite_sequence WHERE name = 'webpages'")
+            lengths = array(POSTING_TYPECODE, [0]) * (cursor.fetchone()[0] + 1)
+            live = set()
+            for webpage_id, length in cursor.execute('SELECT id, length FROM webpages'):
+                lengths[webpage_id] = length or 0
+                live.add(webpage_id)
+
+            # Ids with postings but no page can't be scored or shown, so they count as deleted
+            cursor.execute('SELECT webpage_id FROM deleted_webpages')
+            deleted = frozenset(row[0] for row in cursor.fetchall()).union(set(webpage_ids).difference(live))
+            doc_count, total_length = read_collection_stats(cursor)
+            conn.commit()
+
+            return cls(generation, slots, offsets, webpage_ids, frequencies, deleted, bounds,
+                       lengths, doc_count, total_length)
+        finally:
+            conn.close()
+
+    def postings(self, word: str) -> Optional[Tuple[memoryview, memoryview]]:
+        """Posting list of a word as (webpage_ids, frequencies), or None if not indexed."""
+        slot = self.slots.get(word)
+        if slot is None:
+            return None
+        start, end = self.offsets[slot], self.offsets[slot + 1]
+        return self.webpage_ids[start:end], self.frequencies[start:end]
+
+    def term_bounds(self, word: str) -> Tuple[Optional[int], Optional[int]]:
+        """(max_frequency, min_length) of a word, None where unknown."""
+        slot = self.slots.get(word)
+        return self.bounds[slot] if slot is not None else (None, None)
+
+class LiveIndex:
+    """Keeps the newest MemoryIndex of a database, reloading it when the generation changes.
+
+    A background thread polls index_meta every poll_interval seconds. A new
+    generation is loaded off to the side and swapped in with a single assignment,
+    so searches always see one complete snapshot.
+    """
+
+    def __init__(self, db_path: str = 'clea_db.db', poll_interval: float = 5.0):
+        self.db_path = db_path
+        self.poll_interval = poll_interval
+        self.index = MemoryIndex.load(db_path)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def refresh(self) -> bool:
+        """Load a new snapshot if the indexer published a new generation. Returns True if swapped."""
+        conn = get_connection(self.db_path)
+        try:
+            generation = read_generation(conn.cursor())
+        finally:
+            conn.close()
+
+        if generation == self.index.generation:
+            return False
+        self.index = MemoryIndex.load(self.db_path)
+        print(f"Loaded index generation {self.index.generation} into memory")
+        return True
+
+    def start(self) -> None:
+        """Start polling for new generations in a daemon thread."""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._poll, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _poll(self) -> None:
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Error reloading memory index: {str(e)}")
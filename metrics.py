@@ -0,0 +1,162 @@
+# Metrics - Stage timing histograms and counters, rendered in the Prometheus text format
+import os
+import time
+import threading
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# CLEA_METRICS=0 turns every call below into a no-op
+ENABLED = os.environ.get('CLEA_METRICS', '1') != '0'
+
+# Upper bounds in seconds of the stage histogram buckets, from sub-millisecond
+# search stages up to slow page fetches
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+           0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class Histogram:
+    """Cumulative-bucket histogram of durations, safe to update from several threads."""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)  # the last bucket is +Inf
+        self.total = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        with self._lock:
+            self.counts[bisect_left(BUCKETS, value)] += 1
+            self.total += value
+            self.count += 1
+
+    def merge(self, counts: List[int], total: float, count: int) -> None:
+        with self._lock:
+            for i, n in enumerate(counts):
+                self.counts[i] += n
+            self.total += total
+            self.count += count
+
+_lock = threading.Lock()
+_histograms: Dict[str, Histogram] = {}
+_counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+_collectors: List[Callable[[], Iterable[Tuple[str, Dict[str, str], float]]]] = []
+
+def _histogram(stage: str) -> Histogram:
+    histogram = _histograms.get(stage)
+    if histogram is None:
+        with _lock:
+            histogram = _histograms.setdefault(stage, Histogram())
+    return histogram
+
+def observe(stage: str, seconds: float) -> None:
+    """Record how long one run of a stage took."""
+    if ENABLED:
+        _histogram(stage).observe(seconds)
+
+class _Timer:
+    __slots__ = ('stage', 'start')
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self) -> '_Timer':
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        _histogram(self.stage).observe(time.perf_counter() - self.start)
+
+class _NoTimer:
+    __slots__ = ()
+
+    def __enter__(self) -> '_NoTimer':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        pass
+
+_NO_TIMER = _NoTimer()
+
+def timed(stage: str):
+    """Context manager recording the duration of its block in the stage histogram.
+
+    Failed runs are recorded too; when metrics are disabled nothing is timed.
+    """
+    return _Timer(stage) if ENABLED else _NO_TIMER
+
+def increment(name: str, amount: float = 1, **labels: str) -> None:
+    """Add to a counter, e.g. increment('page_fetches', result='not_modified')."""
+    if ENABLED:
+        key = (name, tuple(sorted(labels.items())))
+        with _lock:
+            _counters[key] = _counters.get(key, 0) + amount
+
+def register_collector(collector: Callable[[], Iterable[Tuple[str, Dict[str, str], float]]]) -> None:
+    """Add a function returning (name, labels, value) gauges read at every scrape, e.g. cache sizes."""
+    _collectors.append(collector)
+
+def export() -> Dict[str, Tuple[List[int], float, int]]:
+    """Histogram data recorded so far in this process, and reset it.
+
+    Worker processes send this back so merge() can add it to the parent's metrics.
+    """
+    with _lock:
+        histograms = dict(_histograms)
+        _histograms.clear()
+    return {stage: (h.counts, h.total, h.count) for stage, h in histograms.items()}
+
+def merge(exported: Optional[Dict[str, Tuple[List[int], float, int]]]) -> None:
+    """Add histogram data exported by another process."""
+    if ENABLED and exported:
+        for stage, (counts, total, count) in exported.items():
+            _histogram(stage).merge(counts, total, count)
+
+def _labels(labels: Iterable[Tuple[str, str]]) -> str:
+    pairs = ','.join(f'{name}="{str(value)}"' for name, value in labels)
+    return '{' + pairs + '}' if pairs else ''
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    lines = [
+        '# HELP clea_stage_seconds Time spent in each indexing and search stage.',
+        '# TYPE clea_stage_seconds histogram',
+    ]
+    with _lock:
+        histograms = sorted(_histograms.items())
+        counters = sorted(_counters.items())
+    for stage, histogram in histograms:
+        with histogram._lock:
+            counts, total, count = list(histogram.counts), histogram.total, histogram.count
+        cumulative = 0
+        for bound, n in zip((*map(str, BUCKETS), '+Inf'), counts):
+            cumulative += n
+            lines.append(f'clea_stage_seconds_bucket{_labels([("stage", stage), ("le", bound)])} {cumulative}')
+        lines.append(f'clea_stage_seconds_sum{_labels([("stage", stage)])} {_number(total)}')
+        lines.append(f'clea_stage_seconds_count{_labels([("stage", stage)])} {count}')
+
+    last_name = None
+    for (name, labels), value in counters:
+        if name != last_name:
+            lines.append(f'# TYPE clea_{name}_total counter')
+            last_name = name
+        lines.append(f'clea_{name}_total{_labels(labels)} {_number(value)}')
+
+    gauges: Dict[str, List[str]] = {}
+    for collector in _collectors:
+        try:
+            for name, labels, value in collector():
+                gauges.setdefault(name, []).append(f'clea_{name}{_labels(sorted(labels.items()))} {_number(value)}')
+        except Exception as e:
+            print(f"Error collecting metrics: {str(e)}")
+    for name, samples in sorted(gauges.items()):
+        lines.append(f'# TYPE clea_{name} gauge')
+        lines.extend(samples)
+    return '\n'.join(lines) + '\n'
+
+def reset() -> None:
+    """Forget all recorded histograms and counters."""
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
@@ -0,0 +1,271 @@
+# Migrations - Upgrade existing Clea databases to the current schema
+from db import get_connection
+import json
+import sys
+import zlib
+from init_db import init_database
+from postings import build_postings, encode_postings, decode_postings, encode_terms, bump_generation
+from souffleur import update_vocabulary
+from compaction import compact_index
+from shards import read_shard_count, iter_terms
+
+def migrate_word_index(db_path: str = 'clea_db.db', batch_size: int = 500) -> int:
+    """Convert JSON posting lists in word_index to packed binary postings.
+
+    Returns the number of converted words. Rows that are already binary are left alone,
+    so the migration can be re-run safely.
+    """
+    conn = get_connection(db_path)
+    try:
+        cursor = conn.cursor()
+        converted = 0
+        while True:
+            # Converted rows drop out of the filter, so each pass picks up the next batch
+            cursor.execute('''
+            SELECT word, webpage_ids, webpage_frequencies
+            FROM word_index
+            WHERE typeof(webpage_ids) = 'text'
+            LIMIT ?
+            ''', (batch_size,))
+            rows = cursor.fetchall()
+            if not rows:
+                break
+
+            updates = []
+            for word, ids_json, freqs_json in rows:
+                frequencies = json.loads(freqs_json or '{}')
+                pairs = [(int(webpage_id), int(frequencies.get(webpage_id, 0)))
+                         for webpage_id in json.loads(ids_json or '[]')]
+                ids_blob, freqs_blob = encode_postings(*build_postings(pairs))
+                updates.append((ids_blob, freqs_blob, word))
+
+            cursor.executemany('''
+            UPDATE word_index
+            SET webpage_ids = ?, webpage_frequencies = ?
+            WHERE word = ?
+            ''', updates)
+            converted += len(updates)
+
+        conn.commit()
+        return converted
+
+    except Exception as e:
+        print(f"Error migrating word index: {str(e)}")
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+# Columns added to existing tables since their first release: (table, column, declaration)
+ADDED_COLUMNS = [
+    ('webpages', 'content_hash', 'TEXT'),
+    ('page_content', 'etag', 'TEXT'),
+    ('page_content', 'last_modified', 'TEXT'),
+    ('page_content', 'content_hash', 'TEXT'),
+    ('webpages', 'length', 'INTEGER DEFAULT 0'),
+    ('word_index', 'max_frequency', 'INTEGER'),
+    ('word_index', 'min_length', 'INTEGER'),
+]
+
+def add_missing_columns(db_path: str = 'clea_db.db') -> int:
+    """Add columns from ADDED_COLUMNS that an existing database doesn't have yet."""
+    conn = get_connection(db_path)
+    try:
+        cursor = conn.cursor()
+        added = 0
+        for table, column, declaration in ADDED_COLUMNS:
+            cursor.execute(f'PRAGMA table_info({table})')
+            if column not in {row[1] for row in cursor.fetchall()}:
+                cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {declaration}')
+                added += 1
+
+        conn.commit()
+        return added
+
+    except Exception as e:
+        print(f"Error adding columns: {str(e)}")
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+def backfill_document_lengths(db_path: str = 'clea_db.db') -> int:
+    """Compute page lengths and collection statistics for BM25 from existing postings.
+
+    Only runs on databases without collection statistics yet. Returns the number of
+    pages whose length was set.
+    """
+    conn = get_connection(db_path)
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT 1 FROM index_meta WHERE key = 'doc_count'")
+        if cursor.fetchone():
+            return 0
+
+        lengths = {}
+        for _, ids_blob, freqs_blob in cursor.execute('SELECT word, webpage_ids, webpage_frequencies FROM word_index'):
+            for webpage_id, frequency in zip(*decode_postings(ids_blob, freqs_blob)):
+                lengths[webpage_id] = lengths.get(webpage_id, 0) + frequency
+
+        cursor.executemany('UPDATE webpages SET length = ? WHERE id = ?',
+                           [(length, webpage_id) for webpage_id, length in lengths.items()])
+        updated = cursor.rowcount
+        cursor.execute('''
+        INSERT OR REPLACE INTO index_meta (key, value)
+        SELECT 'doc_count', COUNT(*) FROM webpages
+        UNION ALL
+        SELECT 'total_length', COALESCE(SUM(length), 0) FROM webpages
+        ''')
+
+        conn.commit()
+        return updated
+
+    except Exception as e:
+        print(f"Error backfilling document lengths: {str(e)}")
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+def backfill_term_bounds(db_path: str = 'clea_db.db', batch_size: int = 500) -> int:
+    """Compute max_frequency and min_length of terms written before score bounds existed.
+
+    Needs page lengths, so run it after backfill_document_lengths. Returns the number
+    of terms updated.
+    """
+    conn = get_connection(db_path)
+    try:
+        cursor = conn.cursor()
+        lengths = dict(cursor.execute('SELECT id, length FROM webpages').fetchall())
+        updated = 0
+        while True:
+            # Updated rows drop out of the filter, so each pass picks up the next batch
+            cursor.execute('''
+            SELECT word, webpage_ids, webpage_frequencies
+            FROM word_index
+            WHERE max_frequency IS NULL
+            LIMIT ?
+            ''', (batch_size,))
+            rows = cursor.fetchall()
+            if not rows:
+                break
+
+            updates = []
+            for word, ids_blob, freqs_blob in rows:
+                webpage_ids, frequencies = decode_postings(ids_blob, freqs_blob)
+                # Ids without a page are deleted and can't be scored
+                live_lengths = [lengths[webpage_id] or 0 for webpage_id in webpage_ids if webpage_id in lengths]
+                updates.append((max(frequencies, default=0), min(live_lengths, default=0), word))
+
+            cursor.executemany('''
+            UPDATE word_index
+            SET max_frequency = ?, min_length = ?
+            WHERE word = ?
+            ''', updates)
+            updated += len(updates)
+
+        conn.commit()
+        return updated
+
+    except Exception as e:
+        print(f"Error backfilling term bounds: {str(e)}")
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+def backfill_vocabulary(db_path: str = 'clea_db.db') -> int:
+    """Add terms indexed before the vocabulary table existed, for query suggestions.
+
+    Surface forms are looked up in the stored page texts; terms not found there are
+    suggested as their stem. Returns the number of terms added.
+    """
+    conn = get_connection(db_path)
+    try:
+        cursor = conn.cursor()
+        # Postings are packed uint32, so the document frequency is the blob size / 4
+        cursor.execute('''
+        SELECT word, LENGTH(webpage_ids) / 4
+        FROM word_index
+        WHERE word NOT IN (SELECT word FROM vocabulary)
+        ''')
+        document_frequencies = dict(cursor.fetchall())
+        if not document_frequencies:
+            return 0
+
+        texts = (zlib.decompress(blob).decode('utf-8')
+                 for (blob,) in conn.execute('SELECT text FROM page_text'))
+        update_vocabulary(cursor, document_frequencies, bump_generation(cursor), texts)
+
+        conn.commit()
+        return len(document_frequencies)
+
+    except Exception as e:
+        print(f"Error backfilling vocabulary: {str(e)}")
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+def backfill_page_terms(db_path: str = 'clea_db.db') -> int:
+    """Rebuild the page_terms forward index of pages indexed before it existed, from word_index.
+
+    Without it, re-indexing such a page can't tell which of its postings to remove.
+    Only pages without a page_terms row are filled, so the migration can be re-run
+    safely. Returns the number of pages filled.
+    """
+    conn = get_connection(db_path)
+    try:
+        cursor = conn.cursor()
+        cursor.execute('SELECT id FROM webpages WHERE id NOT IN (SELECT webpage_id FROM page_terms)')
+        page_terms = {row[0]: [] for row in cursor.fetchall()}
+        if not page_terms:
+            return 0
+
+        for word, ids_blob, *_ in iter_terms(db_path, read_shard_count(cursor)):
+            for webpage_id in decode_postings(ids_blob, None)[0]:
+                if webpage_id in page_terms:
+                    page_terms[webpage_id].append(word)
+
+        cursor.executemany('INSERT INTO page_terms (webpage_id, terms) VALUES (?, ?)',
+                           [(webpage_id, encode_terms(terms)) for webpage_id, terms in page_terms.items()])
+
+        conn.commit()
+        return len(page_terms)
+
+    except Exception as e:
+        print(f"Error backfilling page terms: {str(e)}")
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+def migrate_database(db_path: str = 'clea_db.db') -> None:
+    """Run every migration against an existing database."""
+    # Creates any tables added since the database was initialized
+    init_database(db_path)
+    added = add_missing_columns(db_path)
+    print(f"Added {added} missing columns")
+
+    converted = migrate_word_index(db_path)
+    print(f"word_index: converted {converted} JSON posting lists to binary")
+
+    backfilled = backfill_document_lengths(db_path)
+    print(f"webpages: computed the length of {backfilled} pages")
+
+    bounded = backfill_term_bounds(db_path)
+    print(f"word_index: computed score bounds of {bounded} terms")
+
+    suggested = backfill_vocabulary(db_path)
+    print(f"vocabulary: added {suggested} terms for suggestions")
+
+    forwarded = backfill_page_terms(db_path)
+    print(f"page_terms: recorded the terms of {forwarded} pages")
+
+    # Re-indexing used to give pages a new id, leaving postings of the old ids behind
+    compacted = compact_index(db_path)
+    print(f"word_index: dropped {compacted['postings_before'] - compacted['postings_after']} postings of dead pages")
+
+if __name__ == '__main__':
+    migrate_database(sys.argv[1] if len(sys.argv) > 1 else 'clea_db.db')
+    print("Database migrated successfully.")
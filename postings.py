@@ -0,0 +1,232 @@
+# Postings - Compact binary posting lists for the word index
+import sys
+import zlib
+import sqlite3
+from array import array
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# Posting lists are stored as two parallel arrays of unsigned 32-bit ints:
+# sorted webpage ids and their frequencies. Blobs are always little-endian
+# so a database can move between machines.
+POSTING_TYPECODE = 'I'
+_SWAP_BYTES = sys.byteorder != 'little'
+
+def _to_blob(values: array) -> bytes:
+    if _SWAP_BYTES:
+        values = array(POSTING_TYPECODE, values)
+        values.byteswap()
+    return values.tobytes()
+
+def _from_blob(blob: Optional[bytes]) -> array:
+    values = array(POSTING_TYPECODE)
+    if blob:
+        values.frombytes(blob)
+        if _SWAP_BYTES:
+            values.byteswap()
+    return values
+
+def encode_postings(webpage_ids: array, frequencies: array) -> Tuple[bytes, bytes]:
+    """Encode sorted webpage ids and their frequencies as two BLOBs."""
+    return _to_blob(webpage_ids), _to_blob(frequencies)
+
+def decode_postings(ids_blob: Optional[bytes], freqs_blob: Optional[bytes]) -> Tuple[array, array]:
+    """Decode posting BLOBs into (webpage_ids, frequencies) arrays."""
+    return _from_blob(ids_blob), _from_blob(freqs_blob)
+
+def build_postings(pairs: Iterable[Tuple[int, int]]) -> Tuple[array, array]:
+    """Build sorted posting arrays from (webpage_id, frequency) pairs."""
+    webpage_ids = array(POSTING_TYPECODE)
+    frequencies = array(POSTING_TYPECODE)
+    for webpage_id, frequency in sorted(pairs):
+        if webpage_ids and webpage_ids[-1] == webpage_id:
+            frequencies[-1] = frequency
+            continue
+        webpage_ids.append(webpage_id)
+        frequencies.append(frequency)
+    return webpage_ids, frequencies
+
+def set_posting(webpage_ids: array, frequencies: array, webpage_id: int, frequency: int) -> None:
+    """Insert or update a single posting in place, keeping ids sorted."""
+    pos = bisect_left(webpage_ids, webpage_id)
+    if pos < len(webpage_ids) and webpage_ids[pos] == webpage_id:
+        frequencies[pos] = frequency
+    else:
+        webpage_ids.insert(pos, webpage_id)
+        frequencies.insert(pos, frequency)
+
+def merge_postings(webpage_ids: array, frequencies: array, pairs: List[Tuple[int, int]]) -> None:
+    """Merge sorted (webpage_id, frequency) pairs into a posting list in place.
+
+    A pair whose id is already in the list, or repeated in pairs, overwrites its
+    frequency; the last one wins.
+    """
+    if not pairs:
+        return
+    if not webpage_ids or pairs[0][0] > webpage_ids[-1]:
+        # New pages get increasing ids, so this is the common case
+        for webpage_id, frequency in pairs:
+            if webpage_ids and webpage_ids[-1] == webpage_id:
+                frequencies[-1] = frequency
+                continue
+            webpage_ids.append(webpage_id)
+            frequencies.append(frequency)
+    else:
+        for webpage_id, frequency in pairs:
+            set_posting(webpage_ids, frequencies, webpage_id, frequency)
+
+def read_postings(cursor: sqlite3.Cursor, word: str) -> Optional[Tuple[array, array]]:
+    """Read and decode the posting list for a word, or None if it is not indexed."""
+    cursor.execute('SELECT webpage_ids, webpage_frequencies FROM word_index WHERE word = ?', (word,))
+    row = cursor.fetchone()
+    if not row:
+        return None
+    return decode_postings(row[0], row[1])
+
+def read_postings_many(cursor: sqlite3.Cursor, words: List[str], chunk_size: int = 500) -> Dict[str, Tuple[array, array]]:
+    """Read and decode the posting lists for many words with chunked IN lookups."""
+    found = {}
+    for start in range(0, len(words), chunk_size):
+        chunk = words[start:start + chunk_size]
+        placeholders = ','.join('?' * len(chunk))
+        cursor.execute(f'''
+        SELECT word, webpage_ids, webpage_frequencies
+        FROM word_index
+        WHERE word IN ({placeholders})
+        ''', chunk)
+        for word, ids_blob, freqs_blob in cursor.fetchall():
+            found[word] = decode_postings(ids_blob, freqs_blob)
+    return found
+
+def read_term_bounds(cursor: sqlite3.Cursor, words: List[str],
+                     chunk_size: int = 500) -> Dict[str, Tuple[Optional[int], Optional[int]]]:
+    """Read (max_frequency, min_length) of many words; None where a bound is unknown."""
+    found = {}
+    for start in range(0, len(words), chunk_size):
+        chunk = words[start:start + chunk_size]
+        placeholders = ','.join('?' * len(chunk))
+        cursor.execute(f'''
+        SELECT word, max_frequency, min_length
+        FROM word_index
+        WHERE word IN ({placeholders})
+        ''', chunk)
+        for word, max_frequency, min_length in cursor.fetchall():
+            found[word] = (max_frequency, min_length)
+    return found
+
+def merge_term_changes(cursor: sqlite3.Cursor, words: List[str], added: Dict[str, List[Tuple[int, int]]],
+                       removed: Dict[str, Set[int]], page_lengths: Dict[int, int]) -> Dict[str, int]:
+    """Apply new (webpage_id, frequency) postings and removed webpage ids to the word_index rows of words.
+
+    page_lengths holds the length of every page in added, for the min_length bounds.
+    Terms left without postings are deleted. Returns the new document frequency of
+    each word, 0 for deleted ones.
+    """
+    existing = read_postings_many(cursor, words)
+    bounds = read_term_bounds(cursor, words)
+    rows = []
+    emptied = []
+    document_frequencies = {}
+    for word in words:
+        webpage_ids, frequencies = existing.get(word) or decode_postings(None, None)
+        if word in removed:
+            webpage_ids, frequencies = remove_postings(webpage_ids, frequencies, removed[word])
+        new_postings = sorted(added.get(word, ()))
+        merge_postings(webpage_ids, frequencies, new_postings)
+        document_frequencies[word] = len(webpage_ids)
+        if not webpage_ids:
+            emptied.append((word,))
+            continue
+
+        # Removals only loosen min_length, so it is kept as a lower bound; an
+        # unknown bound (NULL) on existing postings stays unknown
+        min_length = bounds[word][1] if word in bounds else None
+        if new_postings and (min_length is not None or word not in bounds):
+            new_min = min(page_lengths[webpage_id] for webpage_id, _ in new_postings)
+            min_length = new_min if min_length is None else min(min_length, new_min)
+        rows.append((word, *encode_postings(webpage_ids, frequencies), max(frequencies), min_length))
+
+    cursor.executemany('''
+    INSERT OR REPLACE INTO word_index (word, webpage_ids, webpage_frequencies, max_frequency, min_length)
+    VALUES (?, ?, ?, ?, ?)
+    ''', rows)
+    cursor.executemany('DELETE FROM word_index WHERE word = ?', emptied)
+    return document_frequencies
+
+def remove_postings(webpage_ids: array, frequencies: array, dead_ids: Set[int]) -> Tuple[array, array]:
+    """Return the posting list without the given webpage ids."""
+    if not dead_ids.intersection(webpage_ids):
+        return webpage_ids, frequencies
+    kept_ids = array(POSTING_TYPECODE)
+    kept_freqs = array(POSTING_TYPECODE)
+    for webpage_id, frequency in zip(webpage_ids, frequencies):
+        if webpage_id not in dead_ids:
+            kept_ids.append(webpage_id)
+            kept_freqs.append(frequency)
+    return kept_ids, kept_freqs
+
+def encode_terms(terms: Iterable[str]) -> bytes:
+    """Encode the distinct terms of a page for the page_terms forward index."""
+    return zlib.compress('\n'.join(sorted(terms)).encode('utf-8'))
+
+def decode_terms(blob: Optional[bytes]) -> Set[str]:
+    """Decode a page_terms blob back into a set of terms."""
+    text = zlib.decompress(blob).decode('utf-8') if blob else ''
+    return set(text.split('\n')) if text else set()
+
+def encode_positions(positions: List[int]) -> bytes:
+    """Encode sorted token positions as varint-coded gaps."""
+    out = bytearray()
+    previous = 0
+    for position in positions:
+        gap = position - previous
+        previous = position
+        while gap >= 0x80:
+            out.append((gap & 0x7F) | 0x80)
+            gap >>= 7
+        out.append(gap)
+    return bytes(out)
+
+def decode_positions(blob: Optional[bytes]) -> List[int]:
+    """Decode varint-coded gaps back into sorted token positions."""
+    positions = []
+    position = 0
+    gap = 0
+    shift = 0
+    for byte in blob or b'':
+        gap |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        position += gap
+        positions.append(position)
+        gap = 0
+        shift = 0
+    return positions
+
+def bump_generation(cursor: sqlite3.Cursor) -> int:
+    """Publish a new index generation and return it. Call inside the transaction that changes the index."""
+    cursor.execute('''
+    INSERT INTO index_meta (key, value) VALUES ('generation', 1)
+    ON CONFLICT(key) DO UPDATE SET value = value + 1
+    ''')
+    return read_generation(cursor)
+
+def read_generation(cursor: sqlite3.Cursor) -> int:
+    """Current index generation, 0 for an index that was never written."""
+    cursor.execute("SELECT value FROM index_meta WHERE key = 'generation'")
+    row = cursor.fetchone()
+    return int(row[0]) if row else 0
+
+def update_collection_stats(cursor: sqlite3.Cursor, doc_delta: int, length_delta: int) -> None:
+    """Adjust the page count and total page length used for BM25 length normalization."""
+    cursor.executemany('''
+    INSERT INTO index_meta (key, value) VALUES (?, ?)
+    ON CONFLICT(key) DO UPDATE SET value = value + excluded.value
+    ''', [('doc_count', doc_delta), ('total_length', length_delta)])
+
+def read_collection_stats(cursor: sqlite3.Cursor) -> Tuple[int, int]:
+    """Return (doc_count, total_length) of the indexed pages."""
+    cursor.execute("SELECT key, value FROM index_meta WHERE key IN ('doc_count', 'total_length')")
+    stats = dict(cursor.fetchall())
+    return int(stats.get('doc_count', 0)), int(stats.get('total_length', 0))
@@ -1,75 +1,419 @@
 # Server - Serves search queries 
-import sqlite3
-from typing import List, Dict
+import re
 import json
-from classeur import tokenize_and_stem
+import zlib
+import base64
+import sqlite3
+from array import array
+from bisect import bisect_left
+from db import get_connection
+from typing import FrozenSet, Iterable, List, Dict, Optional, Tuple
+from analyseur import analyzer
+from classement import rank_bm25, rank_maxscore, phrase_matches, proximity_score, estimate_hits
+from postings import POSTING_TYPECODE, decode_postings, decode_positions, read_collection_stats, read_generation
+from memory_index import LiveIndex
+from shards import read_shard_count, read_terms
+from cache import LRUCache
+from extraits import make_snippet, find_matches
+import metrics
+
+# Keys of a search result; PAGE_FIELDS are read from the webpages table.
+# highlights are (start, end) offsets of query words in the snippet.
+RESULT_FIELDS = ('url', 'title', 'snippet', 'highlights', 'matching_terms', 'relevance_score')
+PAGE_FIELDS = ('url', 'title', 'snippet')
+
+# Quoted parts of a query are phrases
+PHRASE_RE = re.compile(r'"([^"]+)"')
+
+# Multi-term queries rerank this many top pages by term proximity
+RERANK_WINDOW = 50
+
+# Phrase candidates whose positions are checked per lookup
+PHRASE_BATCH = 100
+
+# Finished results of recent queries, and decoded posting lists of hot terms for the
+# SQLite path. Both are cleared whenever the index generation changes.
+result_cache = LRUCache(max_size=1024, ttl=300)
+posting_cache = LRUCache(max_size=4096)
+
+# Page lengths and dead ids of the SQLite path, per database, for the current generation
+page_tables = LRUCache(max_size=8)
+
+# In-memory copy of the index, used instead of word_index once enabled
+_live_index: Optional[LiveIndex] = None
+
+def enable_memory_index(db_path: str = 'clea_db.db', poll_interval: float = 5.0) -> LiveIndex:
+    """Serve searches on db_path from memory, reloading when the indexer publishes a new generation."""
+    global _live_index
+    if _live_index is None or _live_index.db_path != db_path:
+        live = LiveIndex(db_path, poll_interval)
+        live.start()
+        if _live_index is not None:
+            _live_index.stop()
+        _live_index = live
+    return _live_index
+
+def cache_stats() -> Dict[str, Dict]:
+    """Hit, miss and eviction counts of the result and posting caches."""
+    return {'results': result_cache.stats(), 'postings': posting_cache.stats()}
+
+def _cache_metrics():
+    # Search caches and the stem cache shared with the indexer, read at every scrape
+    for name, stats in (*cache_stats().items(), ('stems', analyzer.cache_stats())):
+        for key in ('hits', 'misses', 'size', 'hit_rate'):
+            yield f'cache_{key}', {'cache': name}, stats[key]
+
+metrics.register_collector(_cache_metrics)
+
+def read_term(cursor: sqlite3.Cursor, word: str, db_path: str, generation: int) -> Tuple:
+    """Postings and score bounds of a word as (webpage_ids, frequencies, max_frequency, min_length).
+
+    Served from posting_cache when possible; returns () for words that aren't indexed.
+    """
+    term = posting_cache.get((db_path, word))
+    if term is None:
+        cursor.execute('''
+        SELECT webpage_ids, webpage_frequencies, max_frequency, min_length
+        FROM word_index
+        WHERE word = ?
+        ''', (word,))
+        row = cursor.fetchone()
+        with metrics.timed('posting_decode'):
+            term = (*decode_postings(row[0], row[1]), row[2], row[3]) if row else ()
+        posting_cache.put((db_path, word), term, generation)
+    return term
+
+def read_sharded_terms(words: List[str], db_path: str, shard_count: int, generation: int) -> Dict[str, Tuple]:
+    """read_term() of every word of a sharded index, reading the uncached words' shards in parallel."""
+    terms = {word: posting_cache.get((db_path, word)) for word in words}
+    missing = [word for word, term in terms.items() if term is None]
+    if missing:
+        found = read_terms(db_path, shard_count, missing)
+        for word in missing:
+            terms[word] = found.get(word, ())
+            posting_cache.put((db_path, word), terms[word], generation)
+    return terms
+
+def parse_query(query: str) -> Tuple[List[str], List[List[str]]]:
+    """Split a query into its distinct stemmed terms and the terms of each quoted phrase."""
+    phrases = [terms for terms in (analyzer.analyze(phrase) for phrase in PHRASE_RE.findall(query)) if terms]
+    words = list(dict.fromkeys(analyzer.analyze(query.replace('"', ' '))))
+    return words, phrases
+
+def read_positions(cursor: sqlite3.Cursor, webpage_ids: List[int], words: List[str],
+                   chunk_size: int = 500) -> Dict[Tuple[int, str], List[int]]:
+    """Positions of the given words on the given pages, keyed by (webpage_id, word).
+
+    Pages indexed without positions have no entries.
+    """
+    positions = {}
+    word_placeholders = ','.join('?' * len(words))
+    for start in range(0, len(webpage_ids), chunk_size):
+        chunk = webpage_ids[start:start + chunk_size]
+        placeholders = ','.join('?' * len(chunk))
+        cursor.execute(f'''
+        SELECT webpage_id, word, positions
+        FROM word_positions
+        WHERE webpage_id IN ({placeholders}) AND word IN ({word_placeholders})
+        ''', [*chunk, *words])
+        for webpage_id, word, blob in cursor.fetchall():
+            positions[webpage_id, word] = decode_positions(blob)
+    return positions
+
+def match_phrases(cursor: sqlite3.Cursor, ranked: List[Tuple[int, float, int]], phrases: List[List[str]],
+                  max_results: int) -> Tuple[List[Tuple[int, float, int]], bool]:
+    """Keep the best ranked pages that contain every phrase, reading positions in batches.
+
+    Single-term phrases need no positions; ranked is expected to hold only pages
+    with every phrase term already. Pages indexed without positions can't be
+    checked, so they are kept on their terms alone; the returned flag tells
+    whether any kept page was matched that way.
+    """
+    phrases = [phrase for phrase in phrases if len(phrase) > 1]
+    if not phrases:
+        return ranked[:max_results], False
+    words = list({word for phrase in phrases for word in phrase})
+    matched = []
+    unchecked = False
+    for start in range(0, len(ranked), PHRASE_BATCH):
+        batch = ranked[start:start + PHRASE_BATCH]
+        positions = read_positions(cursor, [webpage_id for webpage_id, _, _ in batch], words)
+        for result in batch:
+            if not any((result[0], word) in positions for word in words):
+                unchecked = True
+            elif not all(phrase_matches([positions.get((result[0], word)) for word in phrase])
+                         for phrase in phrases):
+                continue
+            matched.append(result)
+            if len(matched) == max_results:
+                return matched, unchecked
+    return matched, unchecked
+
+def rerank_by_proximity(cursor: sqlite3.Cursor, ranked: List[Tuple[int, float, int]],
+                        words: List[str]) -> List[Tuple[int, float, int]]:
+    """Add the proximity bonus of the query terms to each page's score and sort again."""
+    positions = read_positions(cursor, [webpage_id for webpage_id, _, _ in ranked], words)
+    if not positions:
+        return ranked
+    reranked = [(webpage_id, score + proximity_score([positions.get((webpage_id, word)) for word in words]), matches)
+                for webpage_id, score, matches in ranked]
+    reranked.sort(key=lambda result: result[1], reverse=True)
+    return reranked
+
+def read_page_table(cursor: sqlite3.Cursor) -> Tuple[array, FrozenSet[int]]:
+    """Length of every page indexed by webpage id, and the ids that have no page.
 
-def search_pages(query: str, db_path: str = 'clea_db.db', max_results: int = 100) -> List[Dict]:
-    """Search indexed pages using a text query."""
-    query_words = tokenize_and_stem(query)
-    
-    if not query_words:
+    The array is sized by the highest id ever handed out, like MemoryIndex.lengths;
+    ids without a page (deleted, or from a failed flush) get 0 and are in the set.
+    """
+    cursor.execute('''
+    SELECT MAX(COALESCE((SELECT MAX(seq) FROM sqlite_sequence WHERE name = 'webpages'), 0),
+               COALESCE((SELECT MAX(id) FROM webpages), 0))
+    ''')
+    size = cursor.fetchone()[0] + 1
+    lengths = array(POSTING_TYPECODE, [0]) * size
+    present = bytearray(size)
+    present[0] = 1  # ids start at 1
+    for webpage_id, length in cursor.execute('SELECT id, length FROM webpages'):
+        lengths[webpage_id] = length or 0
+        present[webpage_id] = 1
+    cursor.execute('SELECT webpage_id FROM deleted_webpages')
+    dead = {row[0] for row in cursor.fetchall()}
+    dead.update(webpage_id for webpage_id, found in enumerate(present) if not found)
+    return lengths, frozenset(dead)
+
+def page_table(cursor: sqlite3.Cursor, db_path: str, generation: int) -> Tuple[array, FrozenSet[int]]:
+    """read_page_table() for the given generation, read once per generation."""
+    page_tables.sync(generation)
+    table = page_tables.get(db_path)
+    if table is None:
+        table = read_page_table(cursor)
+        page_tables.put(db_path, table, generation)
+    return table
+
+def read_snippets(cursor: sqlite3.Cursor, webpage_ids: List[int],
+                  words: List[str]) -> Dict[int, Tuple[str, List[Tuple[int, int]]]]:
+    """Query-dependent snippets and highlights of pages whose text is stored."""
+    placeholders = ','.join('?' * len(webpage_ids))
+    cursor.execute(f'SELECT webpage_id, text FROM page_text WHERE webpage_id IN ({placeholders})', webpage_ids)
+    return {webpage_id: make_snippet(zlib.decompress(blob).decode('utf-8'), words)
+            for webpage_id, blob in cursor.fetchall()}
+
+def hydrate_results(cursor: sqlite3.Cursor, ranked: List[Tuple[int, float, int]],
+                    fields: Optional[Iterable[str]] = None, words: Optional[List[str]] = None) -> List[Dict]:
+    """Turn ranked (webpage_id, score, matching_terms) into result dicts with one lookup.
+
+    Only the requested fields are returned (all of RESULT_FIELDS by default), and only
+    the webpage columns among them are read. Pages deleted since ranking are skipped.
+    Given the query words, snippets are cut from the stored page text around them;
+    pages without stored text keep their index-time snippet.
+    """
+    fields = RESULT_FIELDS if fields is None else tuple(dict.fromkeys(fields))
+    unknown = [field for field in fields if field not in RESULT_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown result fields: {', '.join(unknown)}")
+    if not ranked:
         return []
 
-    conn = sqlite3.connect(db_path)
+    # Column names come from the PAGE_FIELDS whitelist, so they are safe to interpolate
+    wants_snippet = 'snippet' in fields or 'highlights' in fields
+    columns = [field for field in PAGE_FIELDS if field in fields or (field == 'snippet' and wants_snippet)]
+    webpage_ids = [webpage_id for webpage_id, _, _ in ranked]
+    placeholders = ','.join('?' * len(webpage_ids))
+    cursor.execute(f'''
+    SELECT {', '.join(['id', *columns])}
+    FROM webpages
+    WHERE id IN ({placeholders})
+    ''', webpage_ids)
+    pages = {row[0]: row[1:] for row in cursor.fetchall()}
+    snippets = read_snippets(cursor, webpage_ids, words) if wants_snippet and words else {}
+
+    results = []
+    for webpage_id, score, matching_terms in ranked:
+        row = pages.get(webpage_id)
+        if row is None:
+            continue
+        result = dict(zip(columns, row))
+        if wants_snippet:
+            if webpage_id in snippets:
+                result['snippet'], highlights = snippets[webpage_id]
+            else:
+                highlights = [(start, end) for start, end, _ in find_matches(result['snippet'] or '', words or ())]
+            if 'highlights' in fields:
+                result['highlights'] = highlights
+            if 'snippet' not in fields:
+                del result['snippet']
+        if 'matching_terms' in fields:
+            result['matching_terms'] = matching_terms
+        if 'relevance_score' in fields:
+            result['relevance_score'] = round(score, 4)
+        results.append(result)
+    return results
+
+def encode_cursor(generation: int, offset: int, query_key: int, after: Optional[Tuple[float, int]]) -> str:
+    """Opaque token for the results that follow offset; after is the BM25 position reached."""
+    state = [generation, offset, query_key, *(after or (None, None))]
+    return base64.urlsafe_b64encode(json.dumps(state).encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor: str, query_key: int) -> Tuple[int, int, Optional[Tuple[float, int]]]:
+    """Return (generation, offset, after) of a cursor made by encode_cursor for the same query."""
     try:
-        cursor = conn.cursor()
-        
-        # get matching webpage IDs for each word
-        matching_pages = {}
-        for word in query_words:
-            cursor.execute('''
-            SELECT webpage_ids, webpage_frequencies
-            FROM word_index
-            WHERE word = ?
-            ''', (word,))
-            
-            row = cursor.fetchone()
-            if row:
-                webpage_ids = json.loads(row[0])
-                frequencies = json.loads(row[1])
-                
-                for webpage_id in webpage_ids:
-                    if webpage_id not in matching_pages:
-                        matching_pages[webpage_id] = {
-                            'matching_terms': 0,
-                            'total_frequency': 0
-                        }
-                    matching_pages[webpage_id]['matching_terms'] += 1
-                    matching_pages[webpage_id]['total_frequency'] += frequencies[webpage_id]
-
-        # Sort by matching terms and frequency
-        sorted_pages = sorted(
-            matching_pages.items(),
-            key=lambda x: (x[1]['matching_terms'], x[1]['total_frequency']),
-            reverse=True
-        )[:max_results]
-
-        results = []
-        for webpage_id, scores in sorted_pages:
-            cursor.execute('''
-            SELECT url, title
-            FROM webpages
-            WHERE id = ?
-            ''', (webpage_id,))
-            
-            row = cursor.fetchone()
-            if row:
-                url = row[0]
-                title = row[1]
-                
-                cursor.execute('SELECT snippet FROM webpages WHERE id = ?', (webpage_id,))
-                snippet = cursor.fetchone()[0]
-                
-                results.append({
-                    'url': url,
-                    'title': title,
-                    'snippet': snippet,
-                    'matching_terms': scores['matching_terms'],
-                    'relevance_score': scores['total_frequency']
-                })
+        generation, offset, key, score, webpage_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        offset = int(offset)
+    except (ValueError, TypeError, UnicodeError):
+        raise ValueError('Invalid cursor')
+    if key != query_key or offset < 0:
+        raise ValueError('Cursor belongs to another query')
+    return generation, offset, (float(score), int(webpage_id)) if score is not None else None
+
+def search(query: str, db_path: str = 'clea_db.db', offset: int = 0, limit: int = 10,
+           cursor: Optional[str] = None, fields: Optional[Iterable[str]] = None) -> Dict:
+    """Search indexed pages using a text query, ranked by BM25, one page of results at a time.
+
+    Quoted parts of the query are phrases that every result must contain; pages
+    indexed without positions only need to contain the phrase words. The top
+    RERANK_WINDOW results of multi-term queries get a bonus for query terms close to
+    each other; both need pages indexed with positions. fields limits each result to
+    the given keys of RESULT_FIELDS, e.g. ('url',).
+
+    Returns {'results', 'total', 'total_estimated', 'offset', 'next_cursor',
+    'phrase_fallback'}. total is estimated from posting-list lengths unless the last
+    results were reached. phrase_fallback is True when some results were matched
+    on the phrase words alone, for lack of positions. Passing
+    next_cursor back continues after the results returned, scoring only the next
+    limit pages once past the rerank window; a cursor from an older index generation
+    falls back to its offset.
+    """
+    words, phrases = parse_query(query)
+    if limit < 0 or offset < 0:
+        raise ValueError('offset and limit must not be negative')
+    query_key = zlib.crc32(json.dumps([words, phrases]).encode('utf-8'))
+    after = None
+    if cursor:
+        cursor_generation, offset, after = decode_cursor(cursor, query_key)
+
+    empty = {'results': [], 'total': 0, 'total_estimated': False, 'offset': offset, 'next_cursor': None,
+             'phrase_fallback': False}
+    if not words:
+        return empty
+    if fields is not None:
+        fields = tuple(fields)
+
+    # Take one snapshot so every term of the query sees the same generation
+    index = _live_index.index if _live_index is not None and _live_index.db_path == db_path else None
+
+    conn = get_connection(db_path)
+    try:
+        db_cursor = conn.cursor()
+        # One read transaction, so the generation matches everything read below
+        db_cursor.execute('BEGIN')
+        generation = index.generation if index is not None else read_generation(db_cursor)
+
+        # A BM25 position is only meaningful within the generation it was taken in
+        window = RERANK_WINDOW if len(words) > 1 else 0
+        if after is not None and (cursor_generation != generation or offset < window):
+            after = None
+
+        result_cache.sync(generation)
+        cache_key = (db_path, tuple(words), tuple(map(tuple, phrases)), offset, limit, after, fields)
+        page = result_cache.get(cache_key)
+        if page is not None:
+            metrics.increment('searches', result='cached')
+            return {**page, 'results': [dict(result) for result in page['results']]}
+        metrics.increment('searches', result='computed')
         
-        return results
+        # get the posting list and score bounds of each distinct query word
+        postings_by_word = {}
+        if index is not None:
+            for word in words:
+                postings = index.postings(word)
+                if postings:
+                    postings_by_word[word] = (*postings, *index.term_bounds(word))
+        else:
+            posting_cache.sync(generation)
+            shard_count = read_shard_count(db_cursor)
+            terms = (read_sharded_terms(words, db_path, shard_count, generation) if shard_count else
+                     {word: read_term(db_cursor, word, db_path, generation) for word in words})
+            postings_by_word = {word: terms[word] for word in words if terms[word]}
+
+        if index is not None:
+            lengths, deleted = index.lengths, index.deleted
+            doc_count, total_length = index.doc_count, index.total_length
+        else:
+            lengths, dead = page_table(db_cursor, db_path, generation)
+            deleted = set()
+            for word, (webpage_ids, frequencies, *bounds) in postings_by_word.items():
+                # Shards may already hold a flush newer than this generation; its pages
+                # aren't in the table yet, so their postings are left out
+                end = bisect_left(webpage_ids, len(lengths))
+                if end < len(webpage_ids):
+                    webpage_ids, frequencies = webpage_ids[:end], frequencies[:end]
+                    postings_by_word[word] = (webpage_ids, frequencies, *bounds)
+                # Ids without a page can't be shown; dropping them like tombstoned ones keeps
+                # them from taking top-k slots as zero-length pages
+                if dead:
+                    deleted.update(dead.intersection(webpage_ids))
+            postings_by_word = {word: postings for word, postings in postings_by_word.items() if postings[0]}
+            doc_count, total_length = read_collection_stats(db_cursor)
+        term_postings = list(postings_by_word.values())
+
+        # Past the rerank window results are in BM25 order, so a cursor resumes right
+        # after its position; otherwise everything up to the end of the page is ranked.
+        # One extra result tells whether there is a next page.
+        start = 0 if after is not None else offset
+        needed = (limit if after is not None else max(offset + limit, window)) + 1
+        phrase_fallback = False
+        with metrics.timed('scoring'):
+            if phrases:
+                # Only pages with every phrase term can match; positions are checked best first
+                required = {word for phrase in phrases for word in phrase}
+                scored = []
+                total = 0
+                if required <= postings_by_word.keys():
+                    candidates = set.intersection(*(set(postings_by_word[word][0]) for word in required))
+                    candidates.difference_update(deleted)
+                    scored = rank_bm25([postings[:2] for postings in term_postings], lengths, doc_count,
+                                       total_length, len(candidates), deleted, only=candidates, after=after)
+                    scored, phrase_fallback = match_phrases(db_cursor, scored, phrases, needed)
+                    total = len(candidates)
+            else:
+                scored = rank_maxscore(term_postings, lengths, doc_count, total_length, needed, deleted, after=after)
+                total = estimate_hits([len(postings[0]) for postings in term_postings], doc_count)
+
+            ranked = scored
+            if window and after is None and scored:
+                ranked = rerank_by_proximity(db_cursor, scored[:window], words) + scored[window:]
+        end = start + limit
+        has_more = len(ranked) > end
+        ranked = ranked[start:end]
+
+        next_cursor = None
+        if has_more:
+            # The first end pages are the same in BM25 order once the window is passed
+            position = (scored[end - 1][1], scored[end - 1][0]) if offset + limit >= window and end > 0 else None
+            next_cursor = encode_cursor(generation, offset + limit, query_key, position)
+        if has_more:
+            total = max(total, offset + limit + 1)
+        else:
+            total = offset + len(ranked)
+
+        with metrics.timed('hydration'):
+            results = hydrate_results(db_cursor, ranked, fields, words)
+        page = {
+            'results': results,
+            'total': total,
+            'total_estimated': has_more,
+            'offset': offset,
+            'next_cursor': next_cursor,
+            'phrase_fallback': phrase_fallback
+        }
+        result_cache.put(cache_key, page, generation)
+        return {**page, 'results': [dict(result) for result in page['results']]}
         
     finally:
-        conn.close()
\ No newline at end of file
+        conn.close()
+
+def search_pages(query: str, db_path: str = 'clea_db.db', max_results: int = 100,
+                 fields: Optional[Iterable[str]] = None) -> List[Dict]:
+    """The first max_results results of a query as a list; see search()."""
+    return search(query, db_path, limit=max_results, fields=fields)['results']
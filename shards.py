@@ -0,0 +1,256 @@
+# Shards - Spreads word_index over several database files, partitioned by term
+import os
+import sys
+import zlib
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Dict, Iterator, List, Set, Tuple
+from db import get_connection, close_all
+from init_db import create_word_index
+from postings import decode_postings, merge_term_changes, bump_generation
+import metrics
+
+# Threads reading posting lists from shards for searches
+READ_WORKERS = 8
+
+_read_pool = ThreadPoolExecutor(max_workers=READ_WORKERS, thread_name_prefix='clea-shard')
+_write_pools: Dict[int, ThreadPoolExecutor] = {}
+_write_pools_lock = threading.Lock()
+
+def read_shard_count(cursor: sqlite3.Cursor) -> int:
+    """Number of shard files holding word_index, 0 when it is in the main database."""
+    cursor.execute("SELECT value FROM index_meta WHERE key = 'shards'")
+    row = cursor.fetchone()
+    return int(row[0]) if row else 0
+
+def shard_of(word: str, count: int) -> int:
+    """Shard holding the postings of word; crc32 keeps it stable across processes."""
+    return zlib.crc32(word.encode('utf-8')) % count
+
+def shard_path(db_path: str, shard: int, count: int) -> str:
+    """File of one shard next to the main database, e.g. clea_db.shard2-of-4.db."""
+    root, ext = os.path.splitext(db_path)
+    return f'{root}.shard{shard}-of-{count}{ext or ".db"}'
+
+def partition(words: List[str], count: int) -> Dict[int, List[str]]:
+    """Group words by shard, keeping their order within each shard."""
+    by_shard: Dict[int, List[str]] = {}
+    for word in words:
+        by_shard.setdefault(shard_of(word, count), []).append(word)
+    return by_shard
+
+def _read_shard(path: str, words: List[str], chunk_size: int = 500) -> Dict[str, Tuple]:
+    conn = get_connection(path)
+    try:
+        cursor = conn.cursor()
+        terms = {}
+        for start in range(0, len(words), chunk_size):
+            chunk = words[start:start + chunk_size]
+            placeholders = ','.join('?' * len(chunk))
+            cursor.execute(f'''
+            SELECT word, webpage_ids, webpage_frequencies, max_frequency, min_length
+            FROM word_index
+            WHERE word IN ({placeholders})
+            ''', chunk)
+            rows = cursor.fetchall()
+            with metrics.timed('posting_decode'):
+                for word, ids_blob, freqs_blob, max_frequency, min_length in rows:
+                    terms[word] = (*decode_postings(ids_blob, freqs_blob), max_frequency, min_length)
+        return terms
+    finally:
+        conn.close()
+
+def read_terms(db_path: str, count: int, words: List[str]) -> Dict[str, Tuple]:
+    """Postings and score bounds of words as {word: (webpage_ids, frequencies, max_frequency, min_length)}.
+
+    The shards of the words are read in parallel; words that aren't indexed are left out.
+    Each shard is read in its own transaction, so postings may already include a
+    flush whose generation the caller hasn't seen yet.
+    """
+    by_shard = partition(words, count)
+    if len(by_shard) <= 1:
+        return {word: term for shard, shard_words in by_shard.items()
+                for word, term in _read_shard(shard_path(db_path, shard, count), shard_words).items()}
+    futures = [_read_pool.submit(_read_shard, shard_path(db_path, shard, count), shard_words)
+               for shard, shard_words in by_shard.items()]
+    terms = {}
+    for future in futures:
+        terms.update(future.result())
+    return terms
+
+def _write_pool(count: int) -> ThreadPoolExecutor:
+    # One thread per shard, so every shard of a flush can wait for the others at once.
+    # The threads live on and keep their shard connections open between flushes.
+    with _write_pools_lock:
+        pool = _write_pools.get(count)
+        if pool is None:
+            pool = _write_pools[count] = ThreadPoolExecutor(max_workers=count,
+                                                            thread_name_prefix='clea-shard-write')
+        return pool
+
+def write_term_changes(db_path: str, count: int, words: List[str], added: Dict[str, List[Tuple[int, int]]],
+                       removed: Dict[str, Set[int]], page_lengths: Dict[int, int]) -> Dict[str, int]:
+    """merge_term_changes() on the shards of words, every shard in its own thread and transaction.
+
+    Shards only commit once all of them have written their terms, so a failed merge
+    leaves every shard unchanged. The commits themselves are separate, though: if one
+    of them or the main database's commit fails, the other shards keep postings for
+    pages whose rows were rolled back. The caller must then tombstone those pages, as
+    IndexSegment does, for compaction to drop the postings. Call while holding the
+    main database's write lock, and commit it afterwards, so flushes don't interleave
+    and the generation is published after the postings. Returns the new document
+    frequency of each word.
+    """
+    by_shard = partition(words, count)
+    if not by_shard:
+        return {}
+    written = threading.Barrier(len(by_shard))
+
+    def write(shard: int, shard_words: List[str]) -> Dict[str, int]:
+        conn = get_connection(shard_path(db_path, shard, count))
+        try:
+            cursor = conn.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            document_frequencies = merge_term_changes(cursor, shard_words, added, removed, page_lengths)
+            written.wait()
+            conn.commit()
+            return document_frequencies
+        except Exception:
+            written.abort()
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    pool = _write_pool(count)
+    futures = [pool.submit(write, shard, shard_words) for shard, shard_words in by_shard.items()]
+    wait(futures)
+    # Report the shard that failed rather than the ones stopped by the broken barrier
+    errors = [future.exception() for future in futures if future.exception() is not None]
+    if errors:
+        raise next((e for e in errors if not isinstance(e, threading.BrokenBarrierError)), errors[0])
+
+    document_frequencies = {}
+    for future in futures:
+        document_frequencies.update(future.result())
+    return document_frequencies
+
+def iter_terms(db_path: str, count: int) -> Iterator[Tuple]:
+    """All word_index rows as (word, webpage_ids, webpage_frequencies, max_frequency, min_length) BLOB rows."""
+    paths = [shard_path(db_path, shard, count) for shard in range(count)] if count else [db_path]
+    for path in paths:
+        conn = get_connection(path)
+        try:
+            cursor = conn.cursor()
+            cursor.execute('BEGIN')
+            cursor.execute('SELECT word, webpage_ids, webpage_frequencies, max_frequency, min_length FROM word_index')
+            yield from cursor
+        finally:
+            conn.close()
+
+def _remove_database(path: str) -> None:
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+def _insert_terms(conn: sqlite3.Connection, rows: List[Tuple]) -> None:
+    conn.executemany('''
+    INSERT OR REPLACE INTO word_index (word, webpage_ids, webpage_frequencies, max_frequency, min_length)
+    VALUES (?, ?, ?, ?, ?)
+    ''', rows)
+
+def reshard(db_path: str = 'clea_db.db', count: int = 4, batch_size: int = 1000) -> Dict:
+    """Move word_index into count shard files next to db_path, or back into db_path with count 0.
+
+    The main database's write lock is held throughout, so indexing and compaction
+    wait until the move is published with a new generation. Stop the search server
+    first: it may still be reading the old layout. Returns the number of terms moved
+    per shard.
+    """
+    if count < 0:
+        raise ValueError('count must not be negative')
+    conn = get_connection(db_path)
+    targets = []
+    try:
+        cursor = conn.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        old_count = read_shard_count(cursor)
+        if count == old_count:
+            conn.rollback()
+            return {'shards': count, 'terms': 0, 'terms_per_shard': []}
+
+        if count:
+            for shard in range(count):
+                path = shard_path(db_path, shard, count)
+                _remove_database(path)  # left over from an interrupted run
+                target = get_connection(path)
+                targets.append(target)
+                create_word_index(target.cursor())
+                target.execute('BEGIN IMMEDIATE')
+        else:
+            targets.append(conn)
+
+        moved = [0] * max(count, 1)
+        batches: Dict[int, List[Tuple]] = {}
+        if old_count:
+            rows = iter_terms(db_path, old_count)
+        else:
+            rows = cursor.execute('''
+            SELECT word, webpage_ids, webpage_frequencies, max_frequency, min_length FROM word_index
+            ''')
+        for row in rows:
+            shard = shard_of(row[0], count) if count else 0
+            batch = batches.setdefault(shard, [])
+            batch.append(row)
+            if len(batch) >= batch_size:
+                _insert_terms(targets[shard], batch)
+                moved[shard] += len(batch)
+                batch.clear()
+        for shard, batch in batches.items():
+            _insert_terms(targets[shard], batch)
+            moved[shard] += len(batch)
+
+        # Shards first: the main commit below is what switches searches to them
+        for target in targets:
+            if target is not conn:
+                target.commit()
+        if not old_count:
+            cursor.execute('DELETE FROM word_index')
+        cursor.execute('''
+        INSERT INTO index_meta (key, value) VALUES ('shards', ?)
+        ON CONFLICT(key) DO UPDATE SET value = excluded.value
+        ''', (count,))
+        bump_generation(cursor)
+        conn.commit()
+
+    except Exception as e:
+        print(f"Error resharding index: {str(e)}")
+        for target in targets:
+            target.rollback()
+        conn.rollback()
+        raise
+    finally:
+        for target in targets:
+            if target is not conn:
+                target.close()
+        conn.close()
+
+    # Idle pooled connections, this thread's and the old write threads', would keep the old files open
+    close_all()
+    with _write_pools_lock:
+        old_pool = _write_pools.pop(old_count, None)
+    if old_pool is not None:
+        old_pool.shutdown()
+    for shard in range(old_count):
+        _remove_database(shard_path(db_path, shard, old_count))
+    return {'shards': count, 'terms': sum(moved), 'terms_per_shard': moved if count else []}
+
+if __name__ == '__main__':
+    if len(sys.argv) not in (2, 3):
+        print("Usage: python shards.py <shard count, 0 for a single file> [db_path]")
+        sys.exit(1)
+    result = reshard(sys.argv[2] if len(sys.argv) > 2 else 'clea_db.db', int(sys.argv[1]))
+    print(f"Moved {result['terms']} terms into {result['shards'] or 'no'} shards")
+    if result['terms_per_shard']:
+        print(f"Terms per shard: {', '.join(map(str, result['terms_per_shard']))}")
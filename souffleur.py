@@ -0,0 +1,196 @@
+# Prompter - Suggests query completions from the indexed vocabulary while the user types
+import re
+import heapq
+import sqlite3
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional, Tuple
+from db import get_connection
+from analyseur import analyzer
+from postings import read_generation
+
+# Suggestions kept per prefix; requests may ask for fewer
+MAX_SUGGESTIONS = 10
+
+# Prefixes up to this length match the most terms, so their suggestions are precomputed
+PRECOMPUTED_PREFIX = 3
+
+# Seconds between checks for a new index generation
+REFRESH_INTERVAL = 1.0
+
+# The word being typed is the last one of the query
+LAST_WORD_RE = re.compile(r'(\w+)$')
+
+def update_vocabulary(cursor: sqlite3.Cursor, document_frequencies: Dict[str, int], generation: int,
+                      texts: Iterable[str] = (), chunk_size: int = 500) -> None:
+    """Record the new document frequency of changed terms, 0 for terms that left the index.
+
+    Call inside the transaction that changes word_index, with the generation it publishes.
+    Terms without a surface form yet take the first word of texts that stems to them.
+    """
+    words = [word for word, frequency in document_frequencies.items() if frequency]
+    known = set()
+    for start in range(0, len(words), chunk_size):
+        chunk = words[start:start + chunk_size]
+        placeholders = ','.join('?' * len(chunk))
+        cursor.execute(f'''
+        SELECT word FROM vocabulary
+        WHERE word IN ({placeholders}) AND surface IS NOT NULL
+        ''', chunk)
+        known.update(row[0] for row in cursor.fetchall())
+
+    missing = set(words) - known
+    surfaces = {}
+    for text in texts:
+        if not missing:
+            break
+        found = analyzer.surface_forms(text, missing)
+        surfaces.update(found)
+        missing -= found.keys()
+
+    cursor.executemany('''
+    INSERT INTO vocabulary (word, surface, document_frequency, generation)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT(word) DO UPDATE SET
+        surface = COALESCE(vocabulary.surface, excluded.surface),
+        document_frequency = excluded.document_frequency,
+        generation = excluded.generation
+    ''', [(word, surfaces.get(word), frequency, generation)
+          for word, frequency in document_frequencies.items()])
+
+class Suggester:
+    """Sorted vocabulary of surface forms with their document frequencies.
+
+    Completions of a prefix are the most frequent terms in its range of the sorted
+    array, found by binary search. Short prefixes match the most terms, so their
+    completions are kept precomputed. refresh() only reads the vocabulary rows
+    changed since the loaded generation.
+    """
+
+    def __init__(self, db_path: str = 'clea_db.db', refresh_interval: float = REFRESH_INTERVAL):
+        self.db_path = db_path
+        self.refresh_interval = refresh_interval
+        self.generation = -1
+        self.checked = 0.0
+        self.surfaces: Dict[str, str] = {}  # indexed word -> surface form shown for it
+        # (terms, frequencies, precomputed) swapped as one snapshot, so readers need no lock
+        self.snapshot: Tuple[List[str], Dict[str, int], Dict[str, List[Tuple[str, int]]]] = ([], {}, {})
+        self._lock = threading.Lock()
+        self._refreshing: Optional[threading.Thread] = None
+
+    def refresh(self) -> bool:
+        """Apply vocabulary changes of new index generations. Returns whether anything changed."""
+        with self._lock:
+            self.checked = time.monotonic()
+            conn = get_connection(self.db_path)
+            try:
+                cursor = conn.cursor()
+                cursor.execute('BEGIN')
+                generation = read_generation(cursor)
+                if generation == self.generation:
+                    return False
+                cursor.execute('''
+                SELECT word, COALESCE(surface, word), document_frequency
+                FROM vocabulary
+                WHERE generation > ?
+                ''', (self.generation,))
+                changes = cursor.fetchall()
+            finally:
+                conn.close()
+
+            terms, frequencies, precomputed = self.snapshot
+            frequencies = dict(frequencies)
+            added = set()
+            changed = set()
+            for word, surface, frequency in changes:
+                # A term shown as its stem until a surface form was found is renamed
+                previous = self.surfaces.get(word)
+                if previous is not None and previous != surface:
+                    frequencies.pop(previous, None)
+                    changed.add(previous)
+                changed.add(surface)
+                if frequency:
+                    self.surfaces[word] = surface
+                    if surface not in frequencies:
+                        added.add(surface)
+                    frequencies[surface] = frequency
+                else:
+                    self.surfaces.pop(word, None)
+                    frequencies.pop(surface, None)
+
+            if len(frequencies) < len(terms) + len(added):
+                terms = [term for term in terms if term in frequencies]
+            if added:
+                terms = list(heapq.merge(terms, sorted(added)))
+
+            # Only the precomputed prefixes of changed terms can have new completions
+            precomputed = dict(precomputed)
+            prefixes = {surface[:length] for surface in changed
+                        for length in range(1, min(len(surface), PRECOMPUTED_PREFIX) + 1)}
+            for prefix in prefixes:
+                completions = self._complete(terms, frequencies, prefix, MAX_SUGGESTIONS)
+                if completions:
+                    precomputed[prefix] = completions
+                else:
+                    precomputed.pop(prefix, None)
+
+            self.snapshot = (terms, frequencies, precomputed)
+            self.generation = generation
+            return True
+
+    def maybe_refresh(self) -> None:
+        """Refresh if the last check is older than refresh_interval.
+
+        Only the first load blocks; later refreshes run in the background while
+        lookups keep using the current snapshot.
+        """
+        if self.generation < 0:
+            self.refresh()
+        elif time.monotonic() - self.checked >= self.refresh_interval and not (
+                self._refreshing is not None and self._refreshing.is_alive()):
+            self.checked = time.monotonic()
+            self._refreshing = threading.Thread(target=self.refresh, daemon=True)
+            self._refreshing.start()
+
+    @staticmethod
+    def _complete(terms: List[str], frequencies: Dict[str, int], prefix: str,
+                  limit: int) -> List[Tuple[str, int]]:
+        start = bisect_left(terms, prefix)
+        end = bisect_left(terms, prefix + '\uffff', start)
+        top = heapq.nlargest(limit, terms[start:end], key=frequencies.__getitem__)
+        return [(term, frequencies[term]) for term in top]
+
+    def complete(self, prefix: str, limit: int = MAX_SUGGESTIONS) -> List[Tuple[str, int]]:
+        """Most frequent terms starting with prefix as (term, document_frequency), best first."""
+        terms, frequencies, precomputed = self.snapshot
+        limit = min(limit, MAX_SUGGESTIONS)
+        if len(prefix) <= PRECOMPUTED_PREFIX:
+            return precomputed.get(prefix, [])[:limit]
+        return self._complete(terms, frequencies, prefix, limit)
+
+_suggesters: Dict[str, Suggester] = {}
+_suggesters_lock = threading.Lock()
+
+def get_suggester(db_path: str = 'clea_db.db') -> Suggester:
+    """Shared suggester of db_path, loaded on first use."""
+    with _suggesters_lock:
+        suggester = _suggesters.get(db_path)
+        if suggester is None:
+            suggester = _suggesters[db_path] = Suggester(db_path)
+    suggester.maybe_refresh()
+    return suggester
+
+def suggest(query: str, db_path: str = 'clea_db.db', limit: int = 8) -> List[Dict]:
+    """Complete the last word of query with the most frequent matching indexed words.
+
+    Each suggestion is the whole query with its last word completed, e.g. 'new yo'
+    gives {'text': 'new york', 'document_frequency': 12}. A query ending in a space
+    has no word to complete and gets no suggestions.
+    """
+    match = LAST_WORD_RE.search(query.lower())
+    if match is None:
+        return []
+    head = query[:match.start()]
+    completions = get_suggester(db_path).complete(match.group(1), limit)
+    return [{'text': head + term, 'document_frequency': frequency} for term, frequency in completions]
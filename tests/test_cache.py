@@ -0,0 +1,17 @@
+import unittest
+from cache import LRUCache
+
+class LRUCacheGenerationTest(unittest.TestCase):
+    def test_put_for_an_older_generation_is_dropped(self):
+        cache = LRUCache()
+        cache.sync(1)
+        # Another request publishes generation 2 while this one still computes for 1
+        cache.sync(2)
+        cache.put('key', 'stale', 1)
+        self.assertIsNone(cache.get('key'))
+
+        cache.put('key', 'current', 2)
+        self.assertEqual(cache.get('key'), 'current')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import os
+import tempfile
+import unittest
+from classeur import IndexSegment, count_terms
+from db import get_connection, close_all
+from init_db import init_database
+from migrate_db import migrate_database, backfill_page_terms
+import servir
+
+class BackfillPageTermsTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp.name, 'clea_db.db')
+        init_database(self.db_path)
+
+    def tearDown(self):
+        close_all()
+        self.tmp.cleanup()
+
+    def index(self, url, text):
+        segment = IndexSegment(self.db_path)
+        segment.add_page(url, 'Title', text, count_terms(text), str(hash(text)), None, text)
+        segment.flush()
+
+    def search(self, query):
+        servir.result_cache.clear()
+        servir.posting_cache.clear()
+        return [result['url'] for result in servir.search_pages(query, self.db_path)]
+
+    def test_reindexed_legacy_page_drops_out_of_old_terms(self):
+        self.index('http://example.com/a', 'alpha bravo')
+        # Pages indexed before page_terms existed have no forward index row
+        conn = get_connection(self.db_path)
+        conn.execute('DELETE FROM page_terms')
+        conn.commit()
+        conn.close()
+
+        migrate_database(self.db_path)
+        self.index('http://example.com/a', 'alpha delta')
+
+        self.assertEqual(self.search('bravo'), [])
+        self.assertEqual(self.search('alpha'), ['http://example.com/a'])
+
+    def test_backfill_is_idempotent(self):
+        self.index('http://example.com/a', 'alpha bravo')
+        conn = get_connection(self.db_path)
+        conn.execute('DELETE FROM page_terms')
+        conn.commit()
+        conn.close()
+
+        self.assertEqual(backfill_page_terms(self.db_path), 1)
+        self.assertEqual(backfill_page_terms(self.db_path), 0)
+
+if __name__ == '__main__':
+    unittest.main()
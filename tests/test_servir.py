@@ -0,0 +1,46 @@
+import os
+import tempfile
+import unittest
+from classeur import IndexSegment, tokenize_page
+from db import close_all
+from init_db import init_database
+import servir
+
+class PhraseSearchTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp.name, 'clea_db.db')
+        init_database(self.db_path)
+        servir.result_cache.clear()
+        servir.posting_cache.clear()
+
+    def tearDown(self):
+        close_all()
+        self.tmp.cleanup()
+
+    def index(self, pages, positions):
+        segment = IndexSegment(self.db_path, positions=positions)
+        for url, text in pages.items():
+            word_freq, term_positions = tokenize_page(text, positions)
+            segment.add_page(url, 'Title', text, word_freq, None, term_positions, text)
+        segment.flush()
+
+    def test_phrase_falls_back_to_terms_without_positions(self):
+        self.index({'http://example.com/a': 'garden tomato harvest', 'http://example.com/b': 'garden party'},
+                   positions=False)
+
+        page = servir.search('"tomato garden"', self.db_path)
+        self.assertEqual([result['url'] for result in page['results']], ['http://example.com/a'])
+        self.assertTrue(page['phrase_fallback'])
+        self.assertFalse(servir.search('tomato garden', self.db_path)['phrase_fallback'])
+
+    def test_phrase_is_checked_with_positions(self):
+        self.index({'http://example.com/a': 'garden tomato harvest', 'http://example.com/b': 'tomato garden'},
+                   positions=True)
+
+        page = servir.search('"tomato garden"', self.db_path)
+        self.assertEqual([result['url'] for result in page['results']], ['http://example.com/b'])
+        self.assertFalse(page['phrase_fallback'])
+
+if __name__ == '__main__':
+    unittest.main()